@@ -0,0 +1,42 @@
+"""create_backtest_results
+
+Revision ID: 7c1e4b9d2a51
+Revises: 20ba6222e479
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4b9d2a51'
+down_revision: Union[str, None] = '20ba6222e479'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'backtest_results',
+        sa.Column('backtest_id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('ticker_symbol', sa.String(length=20), nullable=False),
+        sa.Column('fast_window', sa.Integer(), nullable=False),
+        sa.Column('slow_window', sa.Integer(), nullable=False),
+        sa.Column('bar_count', sa.Integer(), nullable=False),
+        sa.Column('starting_cash', sa.DECIMAL(precision=15, scale=2), nullable=False),
+        sa.Column('final_value', sa.DECIMAL(precision=15, scale=2), nullable=False),
+        sa.Column('total_return_pct', sa.DECIMAL(precision=12, scale=4), nullable=False),
+        sa.Column('max_drawdown_pct', sa.DECIMAL(precision=12, scale=4), nullable=False),
+        sa.Column('trade_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_backtest_results_user_id', 'backtest_results', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_backtest_results_user_id', table_name='backtest_results')
+    op.drop_table('backtest_results')
@@ -0,0 +1,28 @@
+"""add_version_to_portfolios
+
+Revision ID: 9d3f6a2b8c47
+Revises: 7c1e4b9d2a51
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3f6a2b8c47'
+down_revision: Union[str, None] = '7c1e4b9d2a51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows start at 1; ETags only need the version to change, not to count anything
+    op.add_column('portfolios',
+                  sa.Column('version', sa.Integer(), nullable=False, server_default=sa.text('1')))
+
+
+def downgrade() -> None:
+    op.drop_column('portfolios', 'version')
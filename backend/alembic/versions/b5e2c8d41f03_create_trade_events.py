@@ -0,0 +1,40 @@
+"""create_trade_events
+
+Revision ID: b5e2c8d41f03
+Revises: 9d3f6a2b8c47
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e2c8d41f03'
+down_revision: Union[str, None] = '9d3f6a2b8c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Transactional outbox of executed trades. Starts empty: consumers wanting the older trades
+    # read them from the trades table once, then follow the stream.
+    op.create_table(
+        'trade_events',
+        sa.Column('event_id', sa.Integer(), primary_key=True),
+        sa.Column('trade_id', sa.Integer(), nullable=False),
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('ticker_symbol', sa.String(length=20), nullable=False),
+        sa.Column('trade_type', sa.String(length=4), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price', sa.DECIMAL(precision=12, scale=2), nullable=False),
+        sa.Column('cash_balance', sa.DECIMAL(precision=15, scale=2), nullable=False),
+        sa.Column('position_quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('trade_events')
@@ -0,0 +1,28 @@
+"""add_average_buy_price_to_trade_events
+
+Revision ID: e1a7f3c9b260
+Revises: b5e2c8d41f03
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7f3c9b260'
+down_revision: Union[str, None] = 'b5e2c8d41f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Events written before this column existed did not record it; 0 marks them
+    op.add_column('trade_events',
+                  sa.Column('average_buy_price', sa.DECIMAL(precision=12, scale=2), nullable=False, server_default=sa.text('0')))
+
+
+def downgrade() -> None:
+    op.drop_column('trade_events', 'average_buy_price')
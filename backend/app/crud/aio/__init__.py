@@ -0,0 +1,2 @@
+# Async equivalents of the app.crud modules, for use with AsyncSession (see database.get_async_db).
+# Function names and behaviour mirror the synchronous modules; only the session type and `await` differ.
@@ -0,0 +1,36 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Sequence
+
+from app.models.backtest_models import DBBacktestResult, BacktestSummary
+
+async def create_backtest_results(
+    db: AsyncSession, user_id: int, ticker_symbol: str, summaries: Sequence[BacktestSummary]
+) -> List[DBBacktestResult]:
+    """
+    Stores the summaries of a parameter sweep in a single commit.
+    """
+    db_results = [
+        DBBacktestResult(user_id=user_id, ticker_symbol=ticker_symbol, **summary.model_dump())
+        for summary in summaries
+    ]
+    db.add_all(db_results)
+    await db.commit()
+    for db_result in db_results:
+        await db.refresh(db_result) # To get backtest_id and created_at
+    return db_results
+
+async def get_backtest_results_by_user(
+    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100
+) -> List[DBBacktestResult]:
+    """
+    Retrieves a user's stored backtest summaries, newest first, with pagination.
+    """
+    result = await db.scalars(
+        select(DBBacktestResult)
+        .where(DBBacktestResult.user_id == user_id)
+        .order_by(DBBacktestResult.backtest_id.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result)
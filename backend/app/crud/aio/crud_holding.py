@@ -0,0 +1,91 @@
+from sqlalchemy import RowMapping, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence
+
+from app.models.holding_models import DBHolding
+from decimal import Decimal # For type hinting and ensuring precision
+
+async def get_holding_by_portfolio_and_ticker(
+    db: AsyncSession, portfolio_id: int, ticker_symbol: str
+) -> Optional[DBHolding]:
+    """
+    Fetches a specific holding for a given portfolio and ticker.
+    """
+    return await db.scalar(
+        select(DBHolding)
+        .where(DBHolding.portfolio_id == portfolio_id, DBHolding.ticker_symbol == ticker_symbol)
+        .limit(1)
+    )
+
+def create_holding(
+    db: AsyncSession, portfolio_id: int, ticker_symbol: str, quantity: int, average_buy_price: Decimal
+) -> DBHolding:
+    """
+    Creates a new DBHolding record (staged only, so no await needed).
+    Commit is handled by the calling function.
+    """
+    db_holding = DBHolding(
+        portfolio_id=portfolio_id,
+        ticker_symbol=ticker_symbol,
+        quantity=quantity,
+        average_buy_price=average_buy_price
+    )
+    db.add(db_holding)
+    return db_holding
+
+def update_holding(
+    db: AsyncSession, holding: DBHolding, new_quantity: int, new_average_buy_price: Optional[Decimal] = None
+) -> DBHolding:
+    """
+    Updates the given DBHolding object's quantity, and its average buy price if provided (staged only).
+    Commit is handled by the calling function.
+    """
+    holding.quantity = new_quantity
+    if new_average_buy_price is not None:
+        holding.average_buy_price = new_average_buy_price
+    db.add(holding) # Ensure changes are staged
+    return holding
+
+async def delete_holding(db: AsyncSession, holding: DBHolding) -> DBHolding:
+    """
+    Marks a loaded holding for deletion. Commit is handled by the calling function.
+    """
+    await db.delete(holding)
+    return holding
+
+async def get_holdings_by_portfolio(
+    db: AsyncSession, portfolio_id: int, skip: int = 0, limit: int = 100
+) -> List[DBHolding]:
+    """
+    Retrieves a list of holdings for a specific portfolio with pagination.
+    """
+    result = await db.scalars(
+        select(DBHolding)
+        .where(DBHolding.portfolio_id == portfolio_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result)
+
+async def get_holding_rows_by_portfolio(
+    db: AsyncSession, portfolio_id: int, skip: int = 0, limit: int = 100
+) -> Sequence[RowMapping]:
+    """
+    Same page as get_holdings_by_portfolio, as column rows keyed by column name (no ORM objects).
+    """
+    result = await db.execute(
+        select(*DBHolding.__table__.columns)
+        .where(DBHolding.portfolio_id == portfolio_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.mappings().all()
+
+async def get_holdings_for_portfolios(db: AsyncSession, portfolio_ids: Sequence[int]) -> List[DBHolding]:
+    """
+    Retrieves every holding of the given portfolios in one query (no pagination).
+    """
+    if not portfolio_ids:
+        return []
+    result = await db.scalars(select(DBHolding).where(DBHolding.portfolio_id.in_(portfolio_ids)))
+    return list(result)
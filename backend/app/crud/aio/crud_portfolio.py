@@ -0,0 +1,84 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+
+from app.models.portfolio_models import DBPortfolio, PortfolioCreate # Pydantic PortfolioCreate
+from app.crud.crud_portfolio import DEFAULT_STARTING_CASH, bump_portfolio_version
+
+async def create_user_portfolio(db: AsyncSession, portfolio: PortfolioCreate, user_id: int) -> DBPortfolio:
+    """
+    Creates a new portfolio for a specific user with a default starting cash balance.
+    """
+    db_portfolio = DBPortfolio(
+        **portfolio.model_dump(),
+        user_id=user_id,
+        cash_balance=DEFAULT_STARTING_CASH
+    )
+    db.add(db_portfolio)
+    await db.commit()
+    await db.refresh(db_portfolio)
+    return db_portfolio
+
+async def get_portfolio_by_id(db: AsyncSession, portfolio_id: int) -> Optional[DBPortfolio]:
+    """
+    Retrieves a portfolio by its ID.
+    """
+    return await db.scalar(select(DBPortfolio).where(DBPortfolio.portfolio_id == portfolio_id).limit(1))
+
+async def get_portfolios_by_user(
+    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100
+) -> List[DBPortfolio]:
+    """
+    Retrieves a list of portfolios for a specific user with pagination.
+    """
+    result = await db.scalars(
+        select(DBPortfolio)
+        .where(DBPortfolio.user_id == user_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result)
+
+async def get_portfolios_version_summary(db: AsyncSession, user_id: int) -> Tuple:
+    """
+    (count, highest id, newest created_at, sum of versions) of the user's portfolios, in one aggregate
+    query. Changes whenever any of them is created, deleted or bumped, so it can stand in for the
+    list in ETags.
+    """
+    result = await db.execute(
+        select(
+            func.count(DBPortfolio.portfolio_id),
+            func.max(DBPortfolio.portfolio_id),
+            func.max(DBPortfolio.created_at),
+            func.sum(DBPortfolio.version),
+        ).where(DBPortfolio.user_id == user_id)
+    )
+    return tuple(result.one())
+
+async def update_portfolio(
+    db: AsyncSession, portfolio_id: int, portfolio_update: PortfolioCreate
+) -> Optional[DBPortfolio]:
+    """
+    Updates an existing portfolio.
+    Only updates portfolio_name.
+    """
+    db_portfolio = await get_portfolio_by_id(db, portfolio_id=portfolio_id)
+    if db_portfolio:
+        db_portfolio.portfolio_name = portfolio_update.portfolio_name
+        bump_portfolio_version(db_portfolio)
+        await db.commit()
+        await db.refresh(db_portfolio)
+    return db_portfolio
+
+async def delete_portfolio(db: AsyncSession, portfolio_id: int) -> Optional[DBPortfolio]:
+    """
+    Deletes a portfolio from the database.
+    Returns the deleted portfolio object if found and deleted, otherwise None.
+    """
+    db_portfolio = await get_portfolio_by_id(db, portfolio_id=portfolio_id)
+    if db_portfolio:
+        # The trades/holdings relationships cascade; load them first since async sessions cannot lazy-load.
+        await db.refresh(db_portfolio, attribute_names=["trades", "holdings"])
+        await db.delete(db_portfolio)
+        await db.commit()
+    return db_portfolio
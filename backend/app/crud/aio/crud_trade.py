@@ -0,0 +1,212 @@
+from sqlalchemy import RowMapping, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Sequence, Tuple
+from decimal import Decimal
+from fastapi import HTTPException, status
+import logging
+import time
+
+from app.models.trade_models import DBTrade, TradeCreate
+from app.models.portfolio_models import DBPortfolio
+from app.models.holding_models import DBHolding
+from app.crud.aio import crud_holding
+from app.crud.crud_portfolio import bump_portfolio_version_statement
+from app.crud.crud_trade import (
+    TradeHoldings, indexed_trade_holdings, publish_committed_trades, reindex_trade_holdings, stage_trade_changes,
+)
+from app.services import trade_rules
+from app.services.market_data_service import get_price_for_trade_async
+from app.services.holdings_index_service import Holdings
+from app.services.metrics_service import TRADE_COMMIT_DURATION, TRADE_FAILURES
+
+logger = logging.getLogger(__name__)
+
+async def stage_portfolio_trade(
+    db: AsyncSession,
+    db_portfolio: DBPortfolio,
+    trade: TradeCreate,
+    trade_execution_price: Decimal,
+    holdings_by_ticker: Optional[Dict[str, DBHolding]] = None,
+    indexed_holdings: Optional[Holdings] = None,
+) -> Tuple[DBTrade, int, Decimal]:
+    """
+    Async counterpart of app.crud.crud_trade.stage_portfolio_trade: stages the cash balance change,
+    the DBTrade row, the holding create/update/delete and the outbox event without committing.
+    Raises trade_rules.TradeRuleError if the trade breaks the cash or holdings rules.
+    """
+    existing_holding = None
+    if indexed_holdings is None:
+        if holdings_by_ticker is not None:
+            existing_holding = holdings_by_ticker.get(trade.ticker_symbol)
+        else:
+            existing_holding = await crud_holding.get_holding_by_portfolio_and_ticker(
+                db, portfolio_id=db_portfolio.portfolio_id, ticker_symbol=trade.ticker_symbol
+            )
+    staged, holding_statement = stage_trade_changes(
+        db, db_portfolio, trade, trade_execution_price, existing_holding, holdings_by_ticker, indexed_holdings
+    )
+    if holding_statement is not None:
+        await db.execute(holding_statement)
+    return staged
+
+async def _holdings_for_trade(db: AsyncSession, db_portfolio: DBPortfolio) -> TradeHoldings:
+    """Async counterpart of app.crud.crud_trade._holdings_for_trade."""
+    holdings = indexed_trade_holdings(db_portfolio)
+    if holdings is None:
+        holdings = reindex_trade_holdings(
+            db_portfolio, await crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[db_portfolio.portfolio_id])
+        )
+    return holdings
+
+async def create_portfolio_trade(db: AsyncSession, trade: TradeCreate, portfolio_id: int) -> DBTrade:
+    """
+    Creates a new trade for a specific portfolio and updates/creates a holding.
+    """
+    # 1. Determine trade execution price
+    if trade.price is not None:
+        trade_execution_price = trade.price
+        logger.info(f"Using client-provided price for trade: {trade_execution_price}")
+    else:
+        trade_execution_price = await get_price_for_trade_async(db, trade.ticker_symbol)
+        logger.info(f"Using server-determined price for trade: {trade_execution_price} (source logged in market_data_service)")
+
+    # 2. Fetch the portfolio to access/update cash_balance
+    db_portfolio = await db.get(DBPortfolio, portfolio_id)
+    if not db_portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found for trade operation.")
+
+    # 3. Stage cash, trade and holding changes (BUY or SELL), checked against the holdings index when it
+    #    knows the portfolio at this version
+    holdings = await _holdings_for_trade(db, db_portfolio)
+    try:
+        staged = await stage_portfolio_trade(
+            db, db_portfolio, trade, trade_execution_price, holdings.holdings_by_ticker, holdings.indexed_holdings
+        )
+    except trade_rules.TradeRuleError as e:
+        await db.rollback() # Discard anything staged for this trade
+        TRADE_FAILURES.labels("single", "rule_violation").inc()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
+
+    # 4. Commit the transaction (includes trade, portfolio cash_balance, and holding changes)
+    commit_start = time.perf_counter()
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        TRADE_FAILURES.labels("single", "commit_error").inc()
+        logger.error(f"Error during commit for trade {trade.ticker_symbol}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save trade and update holdings.")
+    TRADE_COMMIT_DURATION.labels("single").observe(time.perf_counter() - commit_start)
+
+    # 5. Refresh to get DB-generated values (trade_id, timestamp)
+    db_trade = staged[0]
+    await db.refresh(db_trade)
+
+    # 6. Publish the trade and write it through to the holdings index
+    publish_committed_trades(db_portfolio, [staged], holdings)
+
+    return db_trade
+
+async def create_portfolio_trades_atomically(
+    db: AsyncSession, trades: Sequence[TradeCreate], portfolio_id: int
+) -> List[DBTrade]:
+    """
+    Executes several priced trades for one portfolio in a single transaction, in the given order.
+    If any trade fails, nothing is committed. Every trade must carry a price.
+    """
+    db_portfolio = await db.get(DBPortfolio, portfolio_id)
+    if not db_portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found for trade operation.")
+
+    holdings_by_ticker = {
+        h.ticker_symbol: h for h in await crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[portfolio_id])
+    }
+    staged = []
+    for trade in trades:
+        try:
+            staged.append(await stage_portfolio_trade(db, db_portfolio, trade, trade.price, holdings_by_ticker))
+        except trade_rules.TradeRuleError as e:
+            await db.rollback()
+            TRADE_FAILURES.labels("batch", "rule_violation").inc()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{trade.trade_type.value} {trade.quantity} {trade.ticker_symbol}: {e.detail}"
+            )
+
+    commit_start = time.perf_counter()
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        TRADE_FAILURES.labels("batch", "commit_error").inc()
+        logger.error(f"Error during commit for {len(trades)} trades in portfolio {portfolio_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save trades and update holdings.")
+    TRADE_COMMIT_DURATION.labels("batch").observe(time.perf_counter() - commit_start)
+
+    for db_trade, _, _ in staged:
+        await db.refresh(db_trade)
+    publish_committed_trades(db_portfolio, staged)
+    return [db_trade for db_trade, _, _ in staged]
+
+async def get_trade_by_id(db: AsyncSession, trade_id: int) -> Optional[DBTrade]:
+    """
+    Retrieves a trade by its ID.
+    """
+    return await db.get(DBTrade, trade_id)
+
+async def get_trades_by_portfolio(
+    db: AsyncSession, portfolio_id: int, skip: int = 0, limit: int = 100
+) -> List[DBTrade]:
+    """
+    Retrieves a list of trades for a specific portfolio with pagination.
+    """
+    result = await db.scalars(
+        select(DBTrade)
+        .where(DBTrade.portfolio_id == portfolio_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result)
+
+async def get_trade_rows_by_portfolio(
+    db: AsyncSession, portfolio_id: int, skip: int = 0, limit: int = 100
+) -> Sequence[RowMapping]:
+    """
+    Same page as get_trades_by_portfolio, as column rows keyed by column name (no ORM objects are
+    built or tracked by the session). For list responses, see app.routes.responses.ListResponder.
+    """
+    result = await db.execute(
+        select(*DBTrade.__table__.columns)
+        .where(DBTrade.portfolio_id == portfolio_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.mappings().all()
+
+async def update_trade(
+    db: AsyncSession, trade_id: int, trade_update: TradeCreate
+) -> Optional[DBTrade]:
+    """
+    Updates an existing trade. Timestamp is not updated.
+    """
+    db_trade = await get_trade_by_id(db, trade_id=trade_id)
+    if db_trade:
+        update_data = trade_update.model_dump(exclude_unset=True) # Only update provided fields
+        for key, value in update_data.items():
+            setattr(db_trade, key, value)
+        await db.execute(bump_portfolio_version_statement(db_trade.portfolio_id))
+        await db.commit()
+        await db.refresh(db_trade)
+    return db_trade
+
+async def delete_trade(db: AsyncSession, trade_id: int) -> Optional[DBTrade]:
+    """
+    Deletes a trade from the database.
+    Returns the deleted trade object if found and deleted, otherwise None.
+    """
+    db_trade = await get_trade_by_id(db, trade_id=trade_id)
+    if db_trade:
+        await db.delete(db_trade)
+        await db.execute(bump_portfolio_version_statement(db_trade.portfolio_id))
+        await db.commit()
+    return db_trade
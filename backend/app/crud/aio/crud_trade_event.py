@@ -0,0 +1,37 @@
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.crud.crud_trade_event import gap_marker
+from app.models.trade_event_models import DBTradeEvent
+
+async def get_last_trade_event_id(db: AsyncSession) -> int:
+    """The newest offset of the trade event stream (0 while it is empty)."""
+    return await db.scalar(select(func.max(DBTradeEvent.event_id))) or 0
+
+async def get_trade_events(
+    db: AsyncSession, after: int, limit: int = 100, up_to: Optional[int] = None
+) -> List[DBTradeEvent]:
+    """
+    Trade events with offsets above `after` (and at most `up_to`), oldest first, gap markers included.
+    Reads the outbox's primary key only, never the trades table.
+    """
+    query = select(DBTradeEvent).where(DBTradeEvent.event_id > after)
+    if up_to is not None:
+        query = query.where(DBTradeEvent.event_id <= up_to)
+    return list(await db.scalars(query.order_by(DBTradeEvent.event_id).limit(limit)))
+
+async def fill_trade_event_gap(db: AsyncSession, event_id: int) -> bool:
+    """
+    Commits a gap marker at a missing offset: True once it is filled, False if the offset's own event
+    committed first (or another reader filled it). Waits while a transaction holding the offset is running.
+    """
+    await db.rollback() # Ends the reading transaction first, so it holds nothing the writer may wait on
+    db.add(gap_marker(event_id))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return True
@@ -0,0 +1,42 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user_models import DBUser, UserCreate # Pydantic UserCreate for input type hint
+from app.services import auth_service # Module import: auth_service imports this module too
+
+async def get_user_by_username(db: AsyncSession, username: str) -> DBUser | None:
+    """
+    Retrieves a user from the database by their username.
+    """
+    return await db.scalar(select(DBUser).where(DBUser.username == username).limit(1))
+
+async def get_user_by_email(db: AsyncSession, email: str) -> DBUser | None:
+    """
+    Retrieves a user from the database by their email.
+    """
+    return await db.scalar(select(DBUser).where(DBUser.email == email).limit(1))
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> DBUser | None:
+    """
+    Retrieves a user from the database by their user ID.
+    """
+    return await db.get(DBUser, user_id)
+
+async def create_user(db: AsyncSession, user: UserCreate, hashed_password: str | None = None) -> DBUser:
+    """
+    Creates a new user in the database.
+    - Uses hashed_password if given (hash it with auth_service.get_password_hash_async to keep bcrypt
+      off the event loop); otherwise hashes the plain password inline.
+    - Adds the new user to the session, commits, and refreshes.
+    """
+    if hashed_password is None:
+        hashed_password = auth_service.get_password_hash(user.password)
+    db_user = DBUser(
+        username=user.username,
+        email=user.email,
+        password_hash=hashed_password
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user) # To get the auto-generated user_id and created_at
+    return db_user
@@ -0,0 +1,35 @@
+from sqlalchemy.orm import Session
+from typing import List, Sequence
+
+from app.models.backtest_models import DBBacktestResult, BacktestSummary
+
+def create_backtest_results(
+    db: Session, user_id: int, ticker_symbol: str, summaries: Sequence[BacktestSummary]
+) -> List[DBBacktestResult]:
+    """
+    Stores the summaries of a parameter sweep in a single commit.
+    """
+    db_results = [
+        DBBacktestResult(user_id=user_id, ticker_symbol=ticker_symbol, **summary.model_dump())
+        for summary in summaries
+    ]
+    db.add_all(db_results)
+    db.commit()
+    for db_result in db_results:
+        db.refresh(db_result) # To get backtest_id and created_at
+    return db_results
+
+def get_backtest_results_by_user(
+    db: Session, user_id: int, skip: int = 0, limit: int = 100
+) -> List[DBBacktestResult]:
+    """
+    Retrieves a user's stored backtest summaries, newest first, with pagination.
+    """
+    return (
+        db.query(DBBacktestResult)
+        .filter(DBBacktestResult.user_id == user_id)
+        .order_by(DBBacktestResult.backtest_id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
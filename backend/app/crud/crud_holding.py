@@ -1,5 +1,6 @@
+from sqlalchemy import delete, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 from app.models.holding_models import DBHolding
 from decimal import Decimal # For type hinting and ensuring precision
@@ -64,6 +65,32 @@ def delete_holding(db: Session, holding_id: int) -> Optional[DBHolding]:
     return None
 
 
+def update_holding_statement(
+    portfolio_id: int, ticker_symbol: str, new_quantity: int, new_average_buy_price: Optional[Decimal] = None
+):
+    """
+    The same change as update_holding for a holding that is not loaded (e.g. known from the holdings index),
+    as an UPDATE statement for the caller to execute (sync or async) before committing.
+    """
+    values = {"quantity": new_quantity}
+    if new_average_buy_price is not None:
+        values["average_buy_price"] = new_average_buy_price
+    return (
+        update(DBHolding)
+        .where(DBHolding.portfolio_id == portfolio_id, DBHolding.ticker_symbol == ticker_symbol)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+def delete_holding_statement(portfolio_id: int, ticker_symbol: str):
+    """A DELETE statement for one holding, loaded or not (see update_holding_statement)."""
+    return (
+        delete(DBHolding)
+        .where(DBHolding.portfolio_id == portfolio_id, DBHolding.ticker_symbol == ticker_symbol)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def get_holdings_by_portfolio(
     db: Session, portfolio_id: int, skip: int = 0, limit: int = 100
 ) -> List[DBHolding]:
@@ -78,3 +105,12 @@ def get_holdings_by_portfolio(
         .limit(limit)
         .all()
     )
+
+def get_holdings_for_portfolios(db: Session, portfolio_ids: Sequence[int]) -> List[DBHolding]:
+    """
+    Retrieves every holding of the given portfolios in one query (no pagination).
+    Used where whole portfolios are valued or rebalanced at once.
+    """
+    if not portfolio_ids:
+        return []
+    return db.query(DBHolding).filter(DBHolding.portfolio_id.in_(portfolio_ids)).all()
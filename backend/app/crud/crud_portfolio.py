@@ -1,3 +1,4 @@
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from decimal import Decimal # Import Decimal
@@ -7,6 +8,22 @@ from app.models.portfolio_models import DBPortfolio, PortfolioCreate # Pydantic
 
 DEFAULT_STARTING_CASH = Decimal("100000.00")
 
+def bump_portfolio_version(db_portfolio: DBPortfolio) -> None:
+    """
+    Stages version = version + 1 on a loaded portfolio, in the same UPDATE as its other changes.
+    The increment runs in the database, so concurrent commits never end up with the same version.
+    The flush reads the new value back (RETURNING), so after it the attribute holds this transaction's version.
+    """
+    db_portfolio.version = DBPortfolio.version + 1
+
+def bump_portfolio_version_statement(portfolio_id: int):
+    """The same bump for a portfolio that is not loaded (e.g. when only one of its trades changed)."""
+    return (
+        update(DBPortfolio)
+        .where(DBPortfolio.portfolio_id == portfolio_id)
+        .values(version=DBPortfolio.version + 1)
+    )
+
 def create_user_portfolio(db: Session, portfolio: PortfolioCreate, user_id: int) -> DBPortfolio:
     """
     Creates a new portfolio for a specific user with a default starting cash balance.
@@ -52,6 +69,7 @@ def update_portfolio(
     if db_portfolio:
         # Only update fields present in PortfolioCreate (i.e., portfolio_name)
         db_portfolio.portfolio_name = portfolio_update.portfolio_name
+        bump_portfolio_version(db_portfolio)
         db.commit()
         db.refresh(db_portfolio)
     return db_portfolio
@@ -1,21 +1,212 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from decimal import Decimal, InvalidOperation # For precise calculations and handling conversion errors
+from sqlalchemy.sql import Executable
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from decimal import ROUND_HALF_UP, Decimal # For precise calculations
 from fastapi import HTTPException, status
 import logging
+import time
 
 from app.models.trade_models import DBTrade, TradeCreate, TradeTypeEnum
 from app.models.portfolio_models import DBPortfolio # Import DBPortfolio
+from app.models.holding_models import DBHolding
 from app.crud import crud_holding
+from app.crud.crud_trade_event import stage_trade_event
+from app.crud.crud_portfolio import bump_portfolio_version, bump_portfolio_version_statement
+from app.services import money, trade_rules
 from app.services.market_data_service import get_price_for_trade
+from app.services.holdings_index_service import Holdings, holdings_index, loaded_version
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import TRADE_COMMIT_DURATION, TRADE_FAILURES
 
 logger = logging.getLogger(__name__)
 
+class TradeHoldings(NamedTuple):
+    """
+    The portfolio's holdings as a trade is checked against them (see _holdings_for_trade): either
+    indexed_holdings from the holdings index, or holdings_by_ticker loaded from the database (which
+    refilled the index), with the index token (which holds the loaded version) for the post-commit confirm.
+    """
+    holdings_by_ticker: Optional[Dict[str, DBHolding]] = None
+    indexed_holdings: Optional[Holdings] = None
+    index_token: Optional[tuple] = None
+
+NOT_INDEXED = TradeHoldings()
+
+def indexed_trade_holdings(db_portfolio: DBPortfolio) -> Optional[TradeHoldings]:
+    """
+    Step one of _holdings_for_trade (sync and async): the holdings index's answer for a loaded portfolio,
+    NOT_INDEXED when the index is not used, or None when the holdings must be loaded (see reindex_trade_holdings).
+    """
+    version = loaded_version(db_portfolio) if holdings_index.enabled else None
+    if version is None:
+        return NOT_INDEXED
+    found = holdings_index.lookup(db_portfolio.portfolio_id, version)
+    if found is None:
+        return None
+    return TradeHoldings(indexed_holdings=found[0], index_token=found[1])
+
+def reindex_trade_holdings(db_portfolio: DBPortfolio, db_holdings: Sequence[DBHolding]) -> TradeHoldings:
+    """Step two of _holdings_for_trade on an index miss: refills the index with every holding of the portfolio."""
+    version = loaded_version(db_portfolio)
+    token = holdings_index.load(
+        db_portfolio.portfolio_id, version, [(h.ticker_symbol, h.quantity, h.average_buy_price) for h in db_holdings]
+    )
+    return TradeHoldings(holdings_by_ticker={h.ticker_symbol: h for h in db_holdings}, index_token=token)
+
+def stage_trade_changes(
+    db: Session,
+    db_portfolio: DBPortfolio,
+    trade: TradeCreate,
+    trade_execution_price: Decimal,
+    existing_holding: Optional[DBHolding],
+    holdings_by_ticker: Optional[Dict[str, DBHolding]] = None,
+    indexed_holdings: Optional[Holdings] = None,
+) -> Tuple[Tuple[DBTrade, int, Decimal], Optional[Executable]]:
+    """
+    The part of stage_portfolio_trade that needs no I/O, shared by the sync and async versions (db.add and
+    db.expunge need no await). Checks the trade against the cash and holdings rules, then stages the cash
+    balance change, the DBTrade row, the holding change, the outbox event and the version bump.
+    The holding is existing_holding (loaded, or None if there is none), or its entry in indexed_holdings.
+    Returns ((db_trade, resulting_quantity, resulting_average_price), holding_statement): a holding that is
+    not loaded (or is deleted) is changed by an UPDATE/DELETE statement the caller executes before committing.
+    """
+    ticker = trade.ticker_symbol
+    # Money math in micro-units (see app.services.money); the price is taken to the cent, as stored
+    price = money.to_micros(trade_execution_price, money.MONEY_PLACES, ROUND_HALF_UP)
+    trade_execution_price = money.from_micros(price)
+    cash_balance = money.to_micros(db_portfolio.cash_balance)
+    if indexed_holdings is not None:
+        held_quantity, held_average = indexed_holdings.get(ticker, (0, 0))
+    else:
+        held_quantity = existing_holding.quantity if existing_holding else 0
+        held_average = money.to_micros(existing_holding.average_buy_price) if existing_holding else 0
+
+    # 1. Validate against the cash and holdings rules before anything is staged
+    if trade.trade_type == TradeTypeEnum.BUY:
+        cash_balance -= trade_rules.check_buy(cash_balance, price, trade.quantity)
+        resulting_quantity = held_quantity + trade.quantity
+        resulting_average_price = money.from_micros(trade_rules.average_price_after_buy(
+            held_quantity, held_average, price, trade.quantity
+        ))
+    else: # TradeTypeEnum.SELL
+        resulting_quantity = trade_rules.check_sell(held_quantity, trade.quantity)
+        resulting_average_price = money.from_micros(held_average)
+        cash_balance += price * trade.quantity
+
+    # 2. Stage the cash balance change and the DBTrade row
+    db_portfolio.cash_balance = money.from_micros(cash_balance)
+    db.add(db_portfolio)
+    db_trade = DBTrade(
+        portfolio_id=db_portfolio.portfolio_id,
+        ticker_symbol=ticker,
+        trade_type=trade.trade_type.value,
+        quantity=trade.quantity,
+        price=trade_execution_price
+    )
+    db.add(db_trade)
+
+    # 3. Stage the holding change: on the loaded row, or by statement
+    holding_statement = None
+    if resulting_quantity == 0:
+        if existing_holding is not None:
+            db.expunge(existing_holding) # Its pending changes, if any, are moot
+            if holdings_by_ticker is not None:
+                holdings_by_ticker.pop(ticker, None)
+        holding_statement = crud_holding.delete_holding_statement(db_portfolio.portfolio_id, ticker)
+    elif held_quantity == 0: # Opens a position (BUY)
+        new_holding = crud_holding.create_holding(
+            db,
+            portfolio_id=db_portfolio.portfolio_id,
+            ticker_symbol=ticker,
+            quantity=resulting_quantity,
+            average_buy_price=resulting_average_price
+        )
+        if holdings_by_ticker is not None:
+            holdings_by_ticker[ticker] = new_holding
+    elif existing_holding is not None:
+        crud_holding.update_holding(
+            db, holding=existing_holding, new_quantity=resulting_quantity, new_average_buy_price=resulting_average_price
+        )
+    else: # Known from the holdings index only
+        holding_statement = crud_holding.update_holding_statement(
+            db_portfolio.portfolio_id, ticker, resulting_quantity, resulting_average_price
+        )
+
+    stage_trade_event(db, db_trade, db_portfolio, resulting_quantity, resulting_average_price) # Outbox row for the /trade-events stream
+    bump_portfolio_version(db_portfolio) # Invalidates the portfolio's ETags when this commits
+    return (db_trade, resulting_quantity, resulting_average_price), holding_statement
+
+def publish_committed_trades(
+    db_portfolio: DBPortfolio,
+    staged: Sequence[Tuple[DBTrade, int, Decimal]],
+    holdings: TradeHoldings = NOT_INDEXED,
+) -> None:
+    """
+    After the commit (sync and async): publishes each trade's post-commit state of the portfolio, so every
+    worker re-ranks it on the leaderboard and pushes the change to its open streams (see the "trade"
+    handlers), then writes the trade through to the holdings index entry it was checked against.
+    """
+    for db_trade, resulting_quantity, resulting_average_price in staged:
+        invalidation_bus.publish(
+            "trade", db_portfolio.portfolio_id, db_portfolio.cash_balance, db_trade.ticker_symbol,
+            resulting_quantity, resulting_average_price,
+        )
+    committed_version = loaded_version(db_portfolio) # Read back by the commit's UPDATE
+    if holdings.index_token is not None and committed_version is not None:
+        # The entry now holds this trade, at the version it committed (unless another commit came in between)
+        holdings_index.confirm(db_portfolio.portfolio_id, holdings.index_token, committed_version)
+
+def stage_portfolio_trade(
+    db: Session,
+    db_portfolio: DBPortfolio,
+    trade: TradeCreate,
+    trade_execution_price: Decimal,
+    holdings_by_ticker: Optional[Dict[str, DBHolding]] = None,
+    indexed_holdings: Optional[Holdings] = None,
+) -> Tuple[DBTrade, int, Decimal]:
+    """
+    Stages one trade on the session without committing: the cash balance change, the DBTrade row,
+    the holding create/update/delete and the trade's outbox event (see stage_trade_changes).
+    Returns (db_trade, resulting_quantity, resulting_average_price) for the traded ticker.
+    The price is taken to the cent (half-up) and the new average cost is rounded half-up to the cent, so
+    the returned values are the ones the columns keep.
+    Raises trade_rules.TradeRuleError if the trade breaks the cash or holdings rules; the caller decides
+    whether to roll back. If holdings_by_ticker is given (preloaded holdings for this portfolio, keyed by
+    ticker), it is used instead of a lookup query and kept up to date. If indexed_holdings is given (the
+    portfolio's holdings from the holdings index, exact at its loaded version), the trade is checked
+    against it and the holding row is changed by statement, without loading it.
+    """
+    existing_holding = None
+    if indexed_holdings is None:
+        if holdings_by_ticker is not None:
+            existing_holding = holdings_by_ticker.get(trade.ticker_symbol)
+        else:
+            existing_holding = crud_holding.get_holding_by_portfolio_and_ticker(
+                db, portfolio_id=db_portfolio.portfolio_id, ticker_symbol=trade.ticker_symbol
+            )
+    staged, holding_statement = stage_trade_changes(
+        db, db_portfolio, trade, trade_execution_price, existing_holding, holdings_by_ticker, indexed_holdings
+    )
+    if holding_statement is not None:
+        db.execute(holding_statement)
+    return staged
+
+def _holdings_for_trade(db: Session, db_portfolio: DBPortfolio) -> TradeHoldings:
+    """
+    The portfolio's holdings for stage_portfolio_trade: from the holdings index when it knows the portfolio
+    at its loaded version, otherwise every holding loaded in one query (which refills the index).
+    """
+    holdings = indexed_trade_holdings(db_portfolio)
+    if holdings is None:
+        holdings = reindex_trade_holdings(
+            db_portfolio, crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[db_portfolio.portfolio_id])
+        )
+    return holdings
+
 def create_portfolio_trade(db: Session, trade: TradeCreate, portfolio_id: int) -> DBTrade:
     """
     Creates a new trade for a specific portfolio and updates/creates a holding.
     """
-    # Create the trade record first
     # Note: Pydantic's condecimal is already Decimal, no need to cast trade.price to Decimal here
     # if it's coming directly from a Pydantic model that uses condecimal.
     # The DBTrade model's price field is SQLAlchemy DECIMAL, which handles Python Decimal.
@@ -37,92 +228,81 @@ def create_portfolio_trade(db: Session, trade: TradeCreate, portfolio_id: int) -
         # No db.rollback() needed here as no changes made yet.
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found for trade operation.")
 
-    # 3. Perform trade-specific logic (BUY or SELL)
-    if trade.trade_type == TradeTypeEnum.BUY:
-        trade_cost = trade_execution_price * trade.quantity
-        if db_portfolio.cash_balance < trade_cost:
-            # No db.rollback() needed here as no changes made yet to this session for this operation
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient cash balance.")
+    # 3. Stage cash, trade and holding changes (BUY or SELL), checked against the holdings index when it
+    #    knows the portfolio at this version
+    holdings = _holdings_for_trade(db, db_portfolio)
+    try:
+        staged = stage_portfolio_trade(
+            db, db_portfolio, trade, trade_execution_price, holdings.holdings_by_ticker, holdings.indexed_holdings
+        )
+    except trade_rules.TradeRuleError as e:
+        db.rollback() # Discard anything staged for this trade
+        TRADE_FAILURES.labels("single", "rule_violation").inc()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.detail)
 
-        # Debit cash balance before creating trade and updating holdings
-        db_portfolio.cash_balance -= trade_cost
-        db.add(db_portfolio) # Stage portfolio update
+    # 4. Commit the transaction (includes trade, portfolio cash_balance, and holding changes)
+    commit_start = time.perf_counter()
+    try:
+        db.commit()
+    except Exception as e: # Catch potential commit errors (e.g. DB constraints if any not caught before)
+        db.rollback()
+        TRADE_FAILURES.labels("single", "commit_error").inc()
+        logger.error(f"Error during commit for trade {trade.ticker_symbol}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save trade and update holdings.")
+    TRADE_COMMIT_DURATION.labels("single").observe(time.perf_counter() - commit_start)
 
-    # 4. Create the DBTrade object (staged for commit)
-    db_trade = DBTrade(
-        portfolio_id=portfolio_id,
-        ticker_symbol=trade.ticker_symbol,
-        trade_type=trade.trade_type.value,
-        quantity=trade.quantity,
-        price=trade_execution_price
-    )
-    db.add(db_trade) # Stage trade creation
+    # 5. Refresh instances to get DB-generated values
+    db_trade = staged[0]
+    db.refresh(db_trade)
+    db.refresh(db_portfolio)
 
-    # 5. Process holding update (staged for commit by crud_holding functions if they don't commit themselves)
-    existing_holding = crud_holding.get_holding_by_portfolio_and_ticker(
-        db, portfolio_id=portfolio_id, ticker_symbol=trade.ticker_symbol
-    )
+    # 6. Publish the trade and write it through to the holdings index
+    publish_committed_trades(db_portfolio, [staged], holdings)
 
-    if trade.trade_type == TradeTypeEnum.BUY:
-        if existing_holding:
-            current_avg_price = Decimal(str(existing_holding.average_buy_price)) # Ensure Decimal
-            new_total_cost = (current_avg_price * existing_holding.quantity) + \
-                             (trade_execution_price * trade.quantity)
-            new_total_quantity = existing_holding.quantity + trade.quantity
-            new_average_buy_price = new_total_cost / new_total_quantity
-
-            crud_holding.update_holding(
-                db,
-                holding=existing_holding,
-                new_quantity=new_total_quantity,
-                new_average_buy_price=new_average_buy_price
-            )
-        else:
-            crud_holding.create_holding(
-                db,
-                portfolio_id=portfolio_id,
-                ticker_symbol=trade.ticker_symbol,
-                quantity=trade.quantity,
-                average_buy_price=trade_execution_price # Use determined execution price
-            )
-    elif trade.trade_type == TradeTypeEnum.SELL:
-        if not existing_holding or existing_holding.quantity < trade.quantity:
-            # Rollback the trade addition if handling as one transaction (requires taking out individual commits)
-            # For now, with individual commits, this state is problematic.
-            # Ideally, this check happens before even creating DBTrade or the route manages transaction.
-            db.rollback() # Rollback trade if holding logic fails (requires no prior commit for trade)
+    return db_trade
+
+def create_portfolio_trades_atomically(
+    db: Session, trades: Sequence[TradeCreate], portfolio_id: int
+) -> List[DBTrade]:
+    """
+    Executes several priced trades for one portfolio in a single transaction, in the given order.
+    Each trade goes through the same rules as create_portfolio_trade; if any trade fails,
+    nothing is committed. Every trade must carry a price (e.g. from one batch pricing call).
+    """
+    db_portfolio = db.query(DBPortfolio).filter(DBPortfolio.portfolio_id == portfolio_id).first()
+    if not db_portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found for trade operation.")
+
+    holdings_by_ticker = {
+        h.ticker_symbol: h for h in crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[portfolio_id])
+    }
+    staged = []
+    for trade in trades:
+        try:
+            staged.append(stage_portfolio_trade(db, db_portfolio, trade, trade.price, holdings_by_ticker))
+        except trade_rules.TradeRuleError as e:
+            db.rollback()
+            TRADE_FAILURES.labels("batch", "rule_violation").inc()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Insufficient quantity to sell or holding does not exist."
+                detail=f"{trade.trade_type.value} {trade.quantity} {trade.ticker_symbol}: {e.detail}"
             )
 
-        new_quantity = existing_holding.quantity - trade.quantity
-        if new_quantity == 0:
-            crud_holding.delete_holding(db, holding_id=existing_holding.holding_id) # This stages delete
-        else:
-            crud_holding.update_holding(db, holding=existing_holding, new_quantity=new_quantity) # This stages update
-
-        # Credit cash balance after processing sell and holding update
-        trade_proceeds = trade_execution_price * trade.quantity
-        db_portfolio.cash_balance += trade_proceeds
-        db.add(db_portfolio) # Stage portfolio update again if not already (though it should be fine)
-
-    # 6. Commit the transaction (includes trade, portfolio cash_balance, and holding changes)
+    commit_start = time.perf_counter()
     try:
         db.commit()
-    except Exception as e: # Catch potential commit errors (e.g. DB constraints if any not caught before)
+    except Exception as e:
         db.rollback()
-        logger.error(f"Error during commit for trade {trade.ticker_symbol}: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save trade and update holdings.")
+        TRADE_FAILURES.labels("batch", "commit_error").inc()
+        logger.error(f"Error during commit for {len(trades)} trades in portfolio {portfolio_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save trades and update holdings.")
+    TRADE_COMMIT_DURATION.labels("batch").observe(time.perf_counter() - commit_start)
 
-    # 7. Refresh instances to get DB-generated values
-    db.refresh(db_trade)
     db.refresh(db_portfolio)
-    # If existing_holding was updated, it's already part of the session and its state will be updated on commit.
-    # If a new holding was created by crud_holding.create_holding, it should also be refreshed if its ID is needed.
-    # crud_holding.create_holding returns the new holding, so it's already refreshed if that was called.
-
-    return db_trade
+    for db_trade, _, _ in staged:
+        db.refresh(db_trade)
+    publish_committed_trades(db_portfolio, staged)
+    return [db_trade for db_trade, _, _ in staged]
 
 def get_trade_by_id(db: Session, trade_id: int) -> Optional[DBTrade]:
     """
@@ -157,6 +337,7 @@ def update_trade(
         update_data = trade_update.model_dump(exclude_unset=True) # Only update provided fields
         for key, value in update_data.items():
             setattr(db_trade, key, value)
+        db.execute(bump_portfolio_version_statement(db_trade.portfolio_id))
         db.commit()
         db.refresh(db_trade)
     return db_trade
@@ -169,5 +350,6 @@ def delete_trade(db: Session, trade_id: int) -> Optional[DBTrade]:
     db_trade = get_trade_by_id(db, trade_id=trade_id)
     if db_trade:
         db.delete(db_trade)
+        db.execute(bump_portfolio_version_statement(db_trade.portfolio_id))
         db.commit()
     return db_trade
@@ -0,0 +1,58 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from decimal import Decimal
+
+from app.models.trade_event_models import GAP_TRADE_TYPE, DBTradeEvent
+from app.models.trade_models import DBTrade
+from app.models.portfolio_models import DBPortfolio
+
+def stage_trade_event(
+    db: Session, db_trade: DBTrade, db_portfolio: DBPortfolio, position_quantity: int, average_buy_price: Decimal
+) -> DBTradeEvent:
+    """
+    Stages the outbox row for a staged trade (no await needed, so AsyncSessions use it too). It commits or
+    rolls back with the trade; trade_id is filled in when both are flushed.
+    """
+    db_event = DBTradeEvent(
+        trade=db_trade,
+        portfolio_id=db_trade.portfolio_id,
+        ticker_symbol=db_trade.ticker_symbol,
+        trade_type=db_trade.trade_type,
+        quantity=db_trade.quantity,
+        price=db_trade.price,
+        cash_balance=db_portfolio.cash_balance,
+        position_quantity=position_quantity,
+        average_buy_price=average_buy_price,
+    )
+    db.add(db_event)
+    return db_event
+
+def gap_marker(event_id: int) -> DBTradeEvent:
+    """
+    The row claiming offset `event_id` for nobody (see OutboxReader). Inserting it waits for a transaction
+    that holds the offset and is still running, and fails if that transaction commits.
+    """
+    return DBTradeEvent(
+        event_id=event_id, trade_id=0, portfolio_id=0, ticker_symbol="", trade_type=GAP_TRADE_TYPE,
+        quantity=0, price=0, cash_balance=0, position_quantity=0, average_buy_price=0,
+    )
+
+def is_gap_marker(db_event: DBTradeEvent) -> bool:
+    return db_event.trade_type == GAP_TRADE_TYPE
+
+def get_last_trade_event_id(db: Session) -> int:
+    """The newest offset of the trade event stream (0 while it is empty)."""
+    return db.scalar(select(func.max(DBTradeEvent.event_id))) or 0
+
+def get_trade_events(
+    db: Session, after: int, limit: int = 100, up_to: Optional[int] = None
+) -> List[DBTradeEvent]:
+    """
+    Trade events with offsets above `after` (and at most `up_to`), oldest first, gap markers included.
+    Reads the outbox's primary key only, never the trades table.
+    """
+    query = select(DBTradeEvent).where(DBTradeEvent.event_id > after)
+    if up_to is not None:
+        query = query.where(DBTradeEvent.event_id <= up_to)
+    return list(db.scalars(query.order_by(DBTradeEvent.event_id).limit(limit)))
@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from app.models.user_models import DBUser, UserCreate # Pydantic UserCreate for input type hint
-from app.services.auth_service import get_password_hash # For hashing password
+from app.services import auth_service # Module import: auth_service imports this module too
 
 def get_user_by_username(db: Session, username: str) -> DBUser | None:
     """
@@ -20,13 +20,15 @@ def get_user_by_id(db: Session, user_id: int) -> DBUser | None:
     """
     return db.query(DBUser).filter(DBUser.user_id == user_id).first()
 
-def create_user(db: Session, user: UserCreate) -> DBUser:
+def create_user(db: Session, user: UserCreate, hashed_password: str | None = None) -> DBUser:
     """
     Creates a new user in the database.
-    - Hashes the plain password from the UserCreate schema.
+    - Hashes the plain password from the UserCreate schema, unless the caller already hashed it
+      (async routes hash on the password pool to keep bcrypt off the event loop).
     - Adds the new user to the session, commits, and refreshes.
     """
-    hashed_password = get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = auth_service.get_password_hash(user.password)
     db_user = DBUser(
         username=user.username,
         email=user.email,
@@ -1,19 +1,209 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings # Import the settings instance
+from .services.invalidation_service import invalidation_bus
+from .services.metrics_service import REGISTRY, gauge_lines, pool_metrics
 
 # SQLALCHEMY_DATABASE_URL is now sourced from settings.SQLALCHEMY_DATABASE_URL
 # The load_dotenv() call is now in config.py
 
-# Create the SQLAlchemy engine
-# For PostgreSQL, no special connect_args are typically needed like for SQLite.
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+# --- Connection pools ---
+# Both engines use queue pools instrumented to record how long each checkout waited and how often
+# one timed out, so queueing for a connection shows up in get_pool_stats() instead of only as latency.
+class InstrumentedPoolMixin:
+    metrics_name = "default"
+
+    def _do_get(self):
+        metrics = pool_metrics(self.metrics_name)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.record_timeout()
+            raise
+        finally:
+            metrics.wait_seconds.observe(time.perf_counter() - start)
+
+def instrumented_pool_class(base: type, metrics_name: str) -> type:
+    """Subclass of a queue pool class reporting to pool_metrics(metrics_name); kept across engine.dispose()."""
+    return type(f"Instrumented{base.__name__}", (InstrumentedPoolMixin, base), {"metrics_name": metrics_name})
+
+def pool_options() -> dict:
+    """create_engine pool keyword arguments from settings."""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+# --- Engines ---
+# Engines are created on first use (init_engines(), normally from the app's lifespan) rather than at
+# import, so scripts and tools that only need the models do not load database drivers or build pools.
+# The session factories exist from the start and are bound to their engine when it is created.
+# Module attributes `engine`, `async_engine` and `replica_async_engine` still work and create the engines.
 
-# Create SessionLocal class
 # Each instance of SessionLocal will be a database session.
 # autocommit=False and autoflush=False are standard for web apps with ORMs.
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The synchronous engine/session stay available for scripts, Alembic and batch jobs.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# --- Async engine ---
+# Request handlers use the async engine so a query waiting on the database does not block the event loop.
+# The async driver is derived from the configured URL, so DATABASE_URL stays a plain postgresql:// URL.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    """
+    Returns the async-driver equivalent of a database URL (e.g. postgresql:// -> postgresql+asyncpg://).
+    URLs that already name an async driver are returned unchanged.
+    """
+    parsed = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if async_driver is None:
+        return url
+    return parsed.set(drivername=async_driver).render_as_string(hide_password=False)
+
+# expire_on_commit=False: attributes cannot be lazily reloaded in async code, so objects keep
+# their committed values; call `await db.refresh(obj)` where DB-generated values are needed.
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+# --- Read replica (optional) ---
+# Read-only endpoints read from the replica when READ_REPLICA_DATABASE_URL is set. A user who just wrote
+# is pinned to the primary for READ_YOUR_WRITES_SECONDS so their next reads cannot miss their own changes.
+# Pins are shared with the other workers over the invalidation bus (PostgreSQL); without it they are per
+# process, so keep READ_YOUR_WRITES_SECONDS above the replication lag.
+ReplicaSessionLocal = AsyncSessionLocal # Falls back to the primary
+if settings.READ_REPLICA_DATABASE_URL:
+    ReplicaSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+class Engines:
+    __slots__ = ("engine", "async_engine", "replica_async_engine")
+
+    def __init__(self, engine, async_engine, replica_async_engine):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.replica_async_engine = replica_async_engine # None without READ_REPLICA_DATABASE_URL
+
+
+_engines: Optional[Engines] = None
+_engines_lock = threading.Lock()
+
+def init_engines() -> Engines:
+    """Creates the engines (once per process) and binds the session factories to them."""
+    global _engines
+    if _engines is not None:
+        return _engines
+    with _engines_lock:
+        if _engines is None:
+            # For PostgreSQL, no special connect_args are typically needed like for SQLite.
+            sync_engine = create_engine(
+                settings.SQLALCHEMY_DATABASE_URL,
+                poolclass=instrumented_pool_class(QueuePool, "sync"),
+                **pool_options(),
+            )
+            primary_async_engine = create_async_engine(
+                to_async_url(settings.SQLALCHEMY_DATABASE_URL),
+                poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, "async"),
+                **pool_options(),
+            )
+            replica_engine = None
+            if settings.READ_REPLICA_DATABASE_URL:
+                replica_engine = create_async_engine(
+                    to_async_url(settings.READ_REPLICA_DATABASE_URL),
+                    poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, "replica"),
+                    **pool_options(),
+                )
+                ReplicaSessionLocal.configure(bind=replica_engine)
+            SessionLocal.configure(bind=sync_engine)
+            AsyncSessionLocal.configure(bind=primary_async_engine)
+            _engines = Engines(sync_engine, primary_async_engine, replica_engine)
+    return _engines
+
+def __getattr__(name: str):
+    if name in Engines.__slots__:
+        return getattr(init_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_primary_pins: TTLCache = TTLCache(maxsize=100_000, ttl=max(settings.READ_YOUR_WRITES_SECONDS, 0.001))
+_primary_pins_lock = threading.Lock()
+
+def pin_to_primary(user_id: int) -> None:
+    """
+    Routes user_id's reads to the primary for READ_YOUR_WRITES_SECONDS, in every worker.
+    Call after committing a write.
+    """
+    if ReplicaSessionLocal is AsyncSessionLocal: # No replica, every read already goes to the primary
+        return
+    invalidation_bus.publish("pin", user_id)
+
+def _pin(user_id: int) -> None:
+    with _primary_pins_lock:
+        _primary_pins[user_id] = True
+
+invalidation_bus.register("pin", _pin)
+
+def is_pinned_to_primary(user_id: int) -> bool:
+    with _primary_pins_lock:
+        return user_id in _primary_pins
+
+def read_sessionmaker(user_id: Optional[int] = None) -> async_sessionmaker:
+    """The session factory for a read: the replica, unless there is none or user_id was pinned to the primary."""
+    init_engines()
+    if user_id is not None and is_pinned_to_primary(user_id):
+        return AsyncSessionLocal
+    return ReplicaSessionLocal
+
+def get_pool_stats() -> dict:
+    """
+    Live state of the connection pools: configured size, connections checked out / idle / in overflow,
+    plus the checkout wait histogram and timeout count.
+    """
+    stats = {}
+    engines = init_engines()
+    pools = [("sync", engines.engine.pool), ("async", engines.async_engine.pool)]
+    if engines.replica_async_engine is not None:
+        pools.append(("replica", engines.replica_async_engine.pool))
+    for name, pool in pools:
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0), # QueuePool counts up from -pool_size
+            **pool_metrics(name).snapshot(),
+        }
+    return stats
+
+def _pool_gauges():
+    """Pool state as Prometheus gauges, read at scrape time (wait histograms and timeouts are registered metrics)."""
+    stats = get_pool_stats()
+    for field, documentation in (
+        ("size", "Configured pool size."),
+        ("checked_out", "Connections currently checked out."),
+        ("checked_in", "Idle connections in the pool."),
+        ("overflow", "Connections open beyond the pool size."),
+    ):
+        yield from gauge_lines(
+            f"db_pool_{field}", documentation, (({"pool": name}, pool[field]) for name, pool in stats.items())
+        )
+
+REGISTRY.add_collector(_pool_gauges)
 
 # Define Base
 # This Base will be used by all SQLAlchemy models to inherit from.
@@ -22,11 +212,31 @@ Base = declarative_base()
 # --- Database Session Dependency ---
 def get_db():
     """
-    FastAPI dependency to get a database session.
+    FastAPI dependency to get a (synchronous) database session.
     Ensures the database session is always closed after the request.
+    Prefer get_async_db in async routes; this one blocks the event loop while queries run.
     """
+    init_engines()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    FastAPI dependency to get an async database session.
+    Ensures the database session is always closed after the request.
+    """
+    init_engines()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_replica_db():
+    """
+    FastAPI dependency to get an async session on the read replica (the primary if none is configured),
+    for data users do not write themselves. Per-user reads use auth_service.get_read_db instead.
+    """
+    init_engines()
+    async with ReplicaSessionLocal() as db:
+        yield db
@@ -0,0 +1 @@
+# ASGI middleware used by main.py.
@@ -0,0 +1,69 @@
+from app.config import settings
+from app.services.encoding_service import choose_encoding, compress
+
+ACCEPT_ENCODING_HEADER = b"accept-encoding"
+# Already compressed (or opaque) bodies gain nothing; only these are compressed.
+COMPRESSIBLE_TYPES = (b"application/json", b"application/msgpack", b"text/")
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing complete responses of at least COMPRESSION_MIN_BYTES with zstd or
+    gzip, whichever the client's Accept-Encoding prefers (zstd on ties, when the zstandard package is
+    installed). Streamed responses (several body messages) and responses that already carry a
+    Content-Encoding are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int | None = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == ACCEPT_ENCODING_HEADER:
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        held_start = [] # The response start is held back until the body shows whether to compress
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                held_start.append(message)
+                return
+            if not held_start:
+                await send(message)
+                return
+            start_message = held_start.pop()
+            headers = [(name, value) for name, value in start_message.get("headers", [])]
+            headers.append((b"vary", b"Accept-Encoding"))
+            body = message.get("body", b"")
+            if not message.get("more_body") and self._should_compress(headers, body):
+                body = compress(body, encoding)
+                headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode())]
+                message = {**message, "body": body}
+            await send({**start_message, "headers": headers})
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, headers, body: bytes) -> bool:
+        if len(body) < self.minimum_size:
+            return False
+        content_type = b""
+        for name, value in headers:
+            name = name.lower()
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,42 @@
+import time
+
+from app.services.metrics_service import HTTP_REQUEST_DURATION, HTTP_REQUEST_ERRORS, HTTP_REQUESTS
+
+UNMATCHED_ROUTE = "unmatched" # Paths that match no route share one label, so scans cannot blow up cardinality
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count, latency and errors per route template
+    (e.g. /portfolios/{portfolio_id}, never the raw path). Latency runs until the response is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500 # Reported if the app raises before starting a response
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            if status_code >= 500:
+                HTTP_REQUEST_ERRORS.labels(method, route).inc()
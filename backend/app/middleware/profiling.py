@@ -0,0 +1,69 @@
+import time
+
+from app.services.profiling_service import profiler_service
+
+PROFILE_REQUEST_HEADER = b"x-profile-request"
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling selected requests with cProfile (see ProfilingService.choose_trigger).
+    Profiled responses carry an X-Profile-Id header (unless streamed); results are under
+    /admin/profiling/profiles. Only installed when PROFILING_ENABLED is set, so it costs nothing otherwise.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile_header = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_REQUEST_HEADER:
+                profile_header = value.decode("latin-1")
+                break
+        trigger = profiler_service.choose_trigger(scope["path"], profile_header)
+        profiler = profiler_service.start(trigger) if trigger else None
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        profile_id = None
+        held_start = [] # The response start is held back until the profile id is known
+
+        def finish() -> str:
+            return profiler_service.finish(
+                profiler,
+                method=scope["method"],
+                path=scope["path"],
+                route=getattr(scope.get("route"), "path", None),
+                status_code=status_code,
+                duration=time.perf_counter() - start,
+                trigger=trigger,
+            )
+
+        async def send_profiled(message):
+            nonlocal status_code, profile_id
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                held_start.append(message)
+                return
+            if held_start:
+                start_message = held_start.pop()
+                if not message.get("more_body"): # Complete body: the profile can end here
+                    profile_id = finish()
+                    headers = [*start_message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+                    start_message = {**start_message, "headers": headers}
+                await send(start_message)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if profile_id is None:
+                finish()
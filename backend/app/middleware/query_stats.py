@@ -0,0 +1,116 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_STATEMENT_MAX_CHARS = 300
+
+
+class RequestQueryStats:
+    """SQL statements run while serving one request: count, total time and the slowest statement."""
+
+    __slots__ = ("query_count", "db_time", "slowest_time", "slowest_statement")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.query_count += 1
+        self.db_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+
+# Set per request by QueryStatsMiddleware. The object is mutated in place, so statements run in
+# the threadpool or in SQLAlchemy's async greenlets (which inherit the request's context) still count.
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+def current_query_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+# --- SQLAlchemy hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        conn.info["query_start_time"] = time.perf_counter() # One statement at a time per connection
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    start_time = conn.info.pop("query_start_time", None)
+    if stats is None or start_time is None:
+        return
+    stats.record(statement, time.perf_counter() - start_time)
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Counts and times every statement the engine runs on behalf of a request.
+    For an AsyncEngine pass async_engine.sync_engine. Statements outside a request are not recorded.
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+# --- Middleware ---
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware. Adds X-DB-Query-Count and X-DB-Time-Ms (and a Server-Timing "db" entry) to
+    every HTTP response when QUERY_STATS_HEADERS is on, and logs a warning with the slowest statement
+    when a request runs more than DB_QUERY_BUDGET statements.
+    Statements run after the response headers are sent (e.g. while streaming) are not included.
+    """
+
+    def __init__(self, app, query_budget: Optional[int] = None, add_headers: Optional[bool] = None):
+        self.app = app
+        self.query_budget = settings.DB_QUERY_BUDGET if query_budget is None else query_budget
+        self.add_headers = settings.QUERY_STATS_HEADERS if add_headers is None else add_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start" and self.add_headers:
+                db_time_ms = f"{stats.db_time * 1000:.2f}"
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.query_count).encode()))
+                headers.append((b"x-db-time-ms", db_time_ms.encode()))
+                headers.append((b"server-timing", f'db;dur={db_time_ms};desc="{stats.query_count} queries"'.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current_stats.reset(token)
+            self._log(scope, stats)
+
+    def _log(self, scope, stats: RequestQueryStats) -> None:
+        route = getattr(scope.get("route"), "path", scope.get("path")) # Route template, e.g. /portfolios/{portfolio_id}
+        endpoint = f"{scope.get('method')} {route}"
+        if self.query_budget and stats.query_count > self.query_budget:
+            logger.warning(
+                f"{endpoint} ran {stats.query_count} SQL statements (budget {self.query_budget}) "
+                f"in {stats.db_time * 1000:.1f}ms; slowest {stats.slowest_time * 1000:.1f}ms: "
+                f"{(stats.slowest_statement or '')[:SLOWEST_STATEMENT_MAX_CHARS]}"
+            )
+        elif stats.query_count:
+            logger.debug(
+                f"{endpoint}: {stats.query_count} SQL statements in {stats.db_time * 1000:.1f}ms, "
+                f"slowest {stats.slowest_time * 1000:.1f}ms"
+            )
@@ -7,6 +7,8 @@ from .portfolio_models import DBPortfolio
 from .trade_models import DBTrade
 from .holding_models import DBHolding
 from .market_data_models import DBMarketDataCache
+from .backtest_models import DBBacktestResult
+from .trade_event_models import DBTradeEvent
 
 # Import Pydantic Schemas that might be commonly used for request/response validation
 # This is optional, as they can also be imported directly from their specific files.
@@ -21,6 +23,14 @@ from .trade_models import Trade, TradeCreate, TradeTypeEnum
 from .holding_models import Holding, HoldingCreate
 # MarketData Schemas
 from .market_data_models import MarketData, MarketDataCreate
+# Rebalance Schemas
+from .rebalance_models import RebalanceRequest, RebalanceResult, BulkRebalanceRequest, BulkRebalanceResult
+# Backtest Schemas
+from .backtest_models import BacktestParams, BacktestRequest, BacktestSummary, BacktestResult
+# Trade event (outbox) Schemas
+from .trade_event_models import TradeEvent
+# Profiling Schemas
+from .profiling_models import ProfilingControl, ProfilingState, ProfileSummary, ProfileDetail
 
 # It's good practice to make __all__ if you want to control `from .models import *`
 # For now, direct imports are generally preferred in application code.
@@ -0,0 +1,62 @@
+from pydantic import BaseModel, ConfigDict, Field, condecimal, confloat, model_validator
+from typing import List, Optional
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, func, DECIMAL
+from app.database import Base
+
+# --- SQLAlchemy Model ---
+class DBBacktestResult(Base):
+    """
+    Summary of one backtest run. Only summaries are stored; fills and equity curves stay in memory.
+    """
+    __tablename__ = "backtest_results"
+
+    backtest_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False, index=True)
+    ticker_symbol = Column(String(20), nullable=False)
+    fast_window = Column(Integer, nullable=False)
+    slow_window = Column(Integer, nullable=False)
+    bar_count = Column(Integer, nullable=False)
+    starting_cash = Column(DECIMAL(15, 2), nullable=False)
+    final_value = Column(DECIMAL(15, 2), nullable=False)
+    total_return_pct = Column(DECIMAL(12, 4), nullable=False)
+    max_drawdown_pct = Column(DECIMAL(12, 4), nullable=False)
+    trade_count = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+# --- Pydantic Schemas ---
+class BacktestParams(BaseModel):
+    # Moving-average crossover: buy when the fast SMA crosses above the slow SMA, sell everything when it crosses below.
+    fast_window: int = Field(..., ge=1)
+    slow_window: int = Field(..., ge=2)
+
+    @model_validator(mode="after")
+    def check_windows(self) -> "BacktestParams":
+        if self.fast_window >= self.slow_window:
+            raise ValueError("fast_window must be smaller than slow_window")
+        return self
+
+class BacktestSummary(BacktestParams): # Output of the in-memory engine
+    bar_count: int
+    starting_cash: condecimal(max_digits=15, decimal_places=2)
+    final_value: condecimal(max_digits=15, decimal_places=2)
+    total_return_pct: condecimal(max_digits=12, decimal_places=4)
+    max_drawdown_pct: condecimal(max_digits=12, decimal_places=4)
+    trade_count: int
+
+class BacktestRequest(BaseModel):
+    ticker_symbol: str
+    closes: List[confloat(gt=0, allow_inf_nan=False)] = Field(..., min_length=2) # Historical closing prices, oldest first
+    starting_cash: Optional[condecimal(max_digits=15, decimal_places=2)] = None # Defaults to a new portfolio's cash
+    fast_windows: List[int] = Field(..., min_length=1)
+    slow_windows: List[int] = Field(..., min_length=1)
+
+class BacktestResult(BacktestSummary): # For reading/returning stored results
+    backtest_id: int
+    user_id: int
+    ticker_symbol: str
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,12 @@
+from pydantic import BaseModel, condecimal
+
+# No SQLAlchemy model: the leaderboard is derived in memory from portfolios, holdings and cached prices.
+
+# --- Pydantic Schemas ---
+class LeaderboardEntry(BaseModel):
+    rank: int # 1-based position, best return first
+    portfolio_id: int
+    user_id: int
+    portfolio_name: str
+    total_value: condecimal(max_digits=15, decimal_places=2) # cash + holdings valued at latest known prices
+    return_pct: condecimal(max_digits=12, decimal_places=4) # Relative to the default starting cash
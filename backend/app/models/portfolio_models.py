@@ -2,7 +2,7 @@ from pydantic import BaseModel, ConfigDict, condecimal # Import condecimal
 from typing import Optional, List
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, func, DECIMAL # Import DECIMAL
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, FetchedValue, func, DECIMAL # Import DECIMAL
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -15,12 +15,18 @@ class DBPortfolio(Base): # Renamed to DBPortfolio
     portfolio_name = Column(String(100), nullable=False)
     cash_balance = Column(DECIMAL(15, 2), nullable=False) # Default set by CRUD
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Bumped by every commit changing the portfolio, its trades or its holdings (see
+    # crud_portfolio.bump_portfolio_version); ETags of the portfolio's GET responses are derived from it.
+    # Computed in the database on update, and read back in the same UPDATE (RETURNING, eager_defaults).
+    version = Column(Integer, nullable=False, default=1, server_default="1", server_onupdate=FetchedValue())
 
     # Relationships
     owner = relationship("DBUser", back_populates="portfolios") # Relates to DBUser
     trades = relationship("DBTrade", back_populates="portfolio", cascade="all, delete-orphan") # Relates to DBTrade
     holdings = relationship("DBHolding", back_populates="portfolio", cascade="all, delete-orphan") # Relates to DBHolding
 
+    __mapper_args__ = {"eager_defaults": True}
+
 
 # --- Pydantic Schemas (original content) ---
 class PortfolioBase(BaseModel):
@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+# No SQLAlchemy model: profiles are kept in memory by profiling_service.
+
+# --- Pydantic Schemas ---
+class ProfilingControl(BaseModel):
+    # Fields left out are not changed
+    sample_rate: Optional[float] = Field(None, ge=0, le=1) # Fraction of requests profiled at random
+    profile_next: Optional[int] = Field(None, ge=0, le=1000) # Profile the next N requests (0 disarms)
+    path_prefix: Optional[str] = None # Only requests under this path count towards profile_next ("" for any)
+
+class ProfilingState(BaseModel):
+    sample_rate: float
+    profile_next: int
+    path_prefix: str
+    stored_profiles: int
+
+class ProfileTokenRequest(BaseModel):
+    path: str # Exact request path the token is valid for, e.g. /portfolios/12/trades/
+    ttl_seconds: int = Field(300, ge=1, le=86400)
+
+class ProfileToken(BaseModel):
+    header: str = "X-Profile-Request"
+    value: str
+    expires_at: datetime
+
+class Hotspot(BaseModel):
+    function: str # "name (file:line)"
+    calls: int
+    own_seconds: float # Time spent in the function itself
+    cumulative_seconds: float # Including callees
+
+class ProfileSummary(BaseModel):
+    profile_id: str
+    created_at: datetime
+    method: str
+    path: str
+    route: Optional[str] = None # Route template, when the request matched one
+    status_code: int
+    duration_ms: float
+    trigger: str # "sampled", "signed_header" or "armed"
+
+class ProfileDetail(ProfileSummary):
+    hotspots: List[Hotspot] # Top functions by own time
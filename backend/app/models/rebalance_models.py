@@ -0,0 +1,51 @@
+from pydantic import BaseModel, Field, condecimal, field_validator
+from typing import Dict, List, Optional
+from decimal import Decimal
+
+from .trade_models import Trade, TradeCreate
+
+# No SQLAlchemy model: a rebalance is executed as ordinary trades.
+
+# --- Pydantic Schemas ---
+class RebalanceRequest(BaseModel):
+    # Fraction of total portfolio value per ticker. Held tickers that are not listed are sold;
+    # whatever the weights leave over stays in cash.
+    target_weights: Dict[str, condecimal(ge=0, le=1)] = Field(..., min_length=1)
+    dry_run: bool = False # Only compute the orders, do not execute them
+
+    @field_validator("target_weights")
+    @classmethod
+    def check_weights(cls, weights: Dict[str, Decimal]) -> Dict[str, Decimal]:
+        normalized: Dict[str, Decimal] = {}
+        for ticker, weight in weights.items():
+            normalized[ticker.strip().upper()] = normalized.get(ticker.strip().upper(), Decimal("0")) + weight
+        if sum(normalized.values()) > 1:
+            raise ValueError("target weights must add up to at most 1")
+        return normalized
+
+class RebalancePlan(BaseModel):
+    total_value: condecimal(max_digits=15, decimal_places=2)
+    cash_before: condecimal(max_digits=15, decimal_places=2)
+    cash_after: condecimal(max_digits=15, decimal_places=2) # Projected, at the batch prices
+    orders: List[TradeCreate] = [] # Sells first, then buys; every order carries its batch price
+
+class RebalanceResult(RebalancePlan):
+    portfolio_id: int
+    dry_run: bool
+    trades: List[Trade] = [] # Executed trades (empty for dry runs)
+
+class BulkRebalanceRequest(RebalanceRequest):
+    portfolio_ids: List[int] = Field(..., min_length=1, max_length=10000)
+
+class BulkRebalanceItem(BaseModel):
+    portfolio_id: int
+    status: str # "rebalanced", "planned" (dry run), "unchanged", "failed" or "not_found"
+    order_count: int = 0
+    detail: Optional[str] = None
+
+class BulkRebalanceResult(BaseModel):
+    dry_run: bool
+    requested: int
+    succeeded: int
+    failed: int
+    results: List[BulkRebalanceItem]
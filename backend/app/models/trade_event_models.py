@@ -0,0 +1,52 @@
+from pydantic import BaseModel, ConfigDict, condecimal
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, TIMESTAMP, func, DECIMAL
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+GAP_TRADE_TYPE = "GAP" # trade_type of the rows filling offsets of rolled-back transactions
+
+# --- SQLAlchemy Model ---
+class DBTradeEvent(Base):
+    """
+    Transactional outbox of executed trades: one row per trade, written in the trade's own transaction,
+    so an event exists exactly when its trade committed. Append-only; event_id is the stream offset.
+    Offsets taken by rolled-back transactions are filled with gap markers (trade_type GAP_TRADE_TYPE, see
+    crud_trade_event.gap_marker) by the outbox readers, and never reach consumers.
+    No foreign keys: events outlive deleted trades and portfolios.
+    """
+    __tablename__ = "trade_events"
+
+    event_id = Column(Integer, primary_key=True)
+    trade_id = Column(Integer, nullable=False)
+    portfolio_id = Column(Integer, nullable=False)
+    ticker_symbol = Column(String(20), nullable=False)
+    trade_type = Column(String(4), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    price = Column(DECIMAL(12, 2), nullable=False)
+    # Portfolio state right after the trade, so consumers need not reconstruct it
+    cash_balance = Column(DECIMAL(15, 2), nullable=False)
+    position_quantity = Column(Integer, nullable=False)
+    average_buy_price = Column(DECIMAL(12, 2), nullable=False) # Of the position (unchanged by sells)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    # Fills trade_id when the trade and its event are flushed together
+    trade = relationship("DBTrade", primaryjoin="foreign(DBTradeEvent.trade_id) == DBTrade.trade_id")
+
+
+# --- Pydantic Schemas ---
+class TradeEvent(BaseModel): # One event of the /trade-events stream
+    event_id: int
+    trade_id: int
+    portfolio_id: int
+    ticker_symbol: str
+    trade_type: str
+    quantity: int
+    price: condecimal(max_digits=12, decimal_places=2)
+    cash_balance: condecimal(max_digits=15, decimal_places=2)
+    position_quantity: int
+    average_buy_price: condecimal(max_digits=12, decimal_places=2)
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,69 @@
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.models.profiling_models import (
+    ProfileDetail, ProfileSummary, ProfileToken, ProfileTokenRequest, ProfilingControl, ProfilingState,
+)
+from app.services.auth_service import require_admin_token
+from app.services.profiling_service import profiler_service, sign_profile_request
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=["admin"],
+    dependencies=[Depends(require_admin_token)],
+)
+
+@router.get("", response_model=ProfilingState)
+async def get_profiling_state():
+    """Current sampling rate, armed request count and number of stored profiles."""
+    return profiler_service.state()
+
+@router.put("", response_model=ProfilingState)
+async def configure_profiling(control: ProfilingControl):
+    """
+    Changes the sampling rate and/or arms profiling of the next N requests (optionally under a path prefix).
+    Takes effect only when the server runs with PROFILING_ENABLED.
+    """
+    return profiler_service.configure(
+        sample_rate=control.sample_rate, profile_next=control.profile_next, path_prefix=control.path_prefix
+    )
+
+@router.post("/tokens", response_model=ProfileToken, status_code=status.HTTP_201_CREATED)
+async def create_profile_token(token_request: ProfileTokenRequest):
+    """
+    Mints an X-Profile-Request header value: requests to exactly `path` sending it are profiled until it expires.
+    """
+    if not settings.PROFILING_SIGNING_KEY:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="PROFILING_SIGNING_KEY is not set")
+    expires_at = int(time.time()) + token_request.ttl_seconds
+    return ProfileToken(
+        value=sign_profile_request(token_request.path, expires_at),
+        expires_at=datetime.fromtimestamp(expires_at, tz=timezone.utc),
+    )
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def list_profiles():
+    """Stored profiles, newest first."""
+    return profiler_service.list_profiles()
+
+@router.get("/profiles/{profile_id}", response_model=ProfileDetail)
+async def get_profile(profile_id: str):
+    """One profile with its top hotspots by own time."""
+    profile = profiler_service.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: str):
+    """The profile as collapsed stacks, for flamegraph.pl, speedscope or inferno."""
+    collapsed = await run_in_threadpool(profiler_service.get_collapsed, profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return PlainTextResponse(collapsed)
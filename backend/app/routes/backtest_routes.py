@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.backtest_models import BacktestRequest, BacktestResult
+from app.models.user_models import User as PydanticUser
+from app.services.auth_service import get_current_active_user, get_read_db
+from app.services import backtest_service
+from app.database import get_async_db, pin_to_primary
+from app.crud.aio import crud_backtest
+from app.crud.crud_portfolio import DEFAULT_STARTING_CASH
+
+router = APIRouter(
+    prefix="/backtests",
+    tags=["backtests"],
+    dependencies=[Depends(get_current_active_user)] # Protect all routes
+)
+
+MAX_SWEEP_SIZE = 500 # Parameter combinations per request
+
+@router.post("/", response_model=List[BacktestResult], status_code=status.HTTP_201_CREATED)
+async def run_backtests(
+    backtest_in: BacktestRequest,
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Runs a moving-average crossover sweep over the supplied closing prices and stores one summary per parameter set.
+    """
+    param_grid = backtest_service.build_param_grid(backtest_in.fast_windows, backtest_in.slow_windows)
+    if not param_grid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No valid parameter combinations (every fast window must be smaller than a slow window)."
+        )
+    if len(param_grid) > MAX_SWEEP_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many parameter combinations ({len(param_grid)}); the limit is {MAX_SWEEP_SIZE}."
+        )
+
+    starting_cash = DEFAULT_STARTING_CASH if backtest_in.starting_cash is None else backtest_in.starting_cash
+    # The sweep is CPU-bound; keep it off the event loop while the process pool works.
+    summaries = await run_in_threadpool(
+        backtest_service.run_parameter_sweep, backtest_in.closes, param_grid, starting_cash
+    )
+    db_results = await crud_backtest.create_backtest_results(
+        db=db, user_id=current_user.user_id, ticker_symbol=backtest_in.ticker_symbol.upper(), summaries=summaries
+    )
+    pin_to_primary(current_user.user_id)
+    return [BacktestResult.model_validate(r) for r in db_results]
+
+@router.get("/", response_model=List[BacktestResult])
+async def list_backtests(
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+    skip: int = 0,
+    limit: int = 100
+):
+    db_results = await crud_backtest.get_backtest_results_by_user(
+        db=db, user_id=current_user.user_id, skip=skip, limit=limit
+    )
+    return [BacktestResult.model_validate(r) for r in db_results]
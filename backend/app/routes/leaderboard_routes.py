@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.leaderboard_models import LeaderboardEntry
+from app.models.user_models import User as PydanticUser
+from app.services.auth_service import get_current_active_user
+from app.services.leaderboard_service import leaderboard
+from app.database import get_async_db
+
+router = APIRouter(
+    prefix="/leaderboard",
+    tags=["leaderboard"],
+    dependencies=[Depends(get_current_active_user)] # Protect all routes
+)
+
+@router.get("/", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Returns portfolios ranked by return, best first.
+    The ranking is precomputed; the database is only read the first time it is requested.
+    """
+    await leaderboard.ensure_loaded_async(db)
+    return leaderboard.top(limit=limit, offset=skip)
+
+@router.get("/me", response_model=List[LeaderboardEntry])
+async def get_my_rankings(
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Returns the rank of each of the current user's portfolios.
+    """
+    await leaderboard.ensure_loaded_async(db)
+    return leaderboard.ranks_for_user(current_user.user_id)
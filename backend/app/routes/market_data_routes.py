@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
+from typing import Dict, List
 from pydantic import BaseModel, condecimal # Import condecimal for Pydantic model
 
-from app.database import get_db
+from app.config import settings
+from app.database import get_async_db, get_replica_db
+from app.routes.responses import NegotiatedRoute
 from app.services import market_data_service
+from app.services.price_stream_service import PriceSubscription, PriceUpdate, price_hub
 # Assuming get_current_active_user can be used if routes need to be protected
 # from app.services.auth_service import get_current_active_user
 # from app.models.user_models import User as PydanticUser
@@ -12,6 +20,7 @@ from app.services import market_data_service
 router = APIRouter(
     prefix="/marketdata",
     tags=["marketdata"],
+    route_class=NegotiatedRoute, # JSON or MessagePack, per the Accept header
     # dependencies=[Depends(get_current_active_user)] # Uncomment if these routes need auth
 )
 
@@ -20,17 +29,172 @@ class TickerPriceResponse(BaseModel):
     price: condecimal(max_digits=12, decimal_places=2) # Use condecimal for validated Decimal
     source: str # e.g., "realtime_finnhub", "cached", "mock_fixed", "mock_random", or error string from service
 
+class QuoteBatchResponse(BaseModel):
+    prices: Dict[str, condecimal(max_digits=12, decimal_places=2)] # Keyed by upper-cased ticker
+
+MAX_BATCH_TICKERS = 100 # Also the most tickers one stream can subscribe to
+MAX_TICKER_LENGTH = 20
+
+def parse_tickers(tickers: str) -> List[str]:
+    """Upper-cased, de-duplicated tickers from a comma-separated list. Raises ValueError if invalid."""
+    ticker_symbols = sorted({t.strip().upper() for t in tickers.split(",") if t.strip()})
+    if len(ticker_symbols) > MAX_BATCH_TICKERS:
+        raise ValueError(f"At most {MAX_BATCH_TICKERS} distinct tickers are allowed")
+    if any(len(t) > MAX_TICKER_LENGTH for t in ticker_symbols):
+        raise ValueError(f"Tickers are at most {MAX_TICKER_LENGTH} characters long")
+    return ticker_symbols
+
+@router.get("/", response_model=QuoteBatchResponse)
+async def get_ticker_prices(
+    tickers: str = Query(..., description="Comma-separated ticker symbols, e.g. AAPL,MSFT"),
+    db: AsyncSession = Depends(get_async_db) # Cache reads and refreshes
+):
+    """
+    Prices several tickers at once: one cache query for all of them, Finnhub only for the missing
+    or expired ones, and mock prices for anything still unpriced (see get_prices_for_tickers_async).
+    """
+    try:
+        ticker_symbols = parse_tickers(tickers)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if not ticker_symbols:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No tickers given")
+    prices = await market_data_service.get_prices_for_tickers_async(db, ticker_symbols)
+    return QuoteBatchResponse(prices=prices)
+
+# --- Streaming ---
+# Declared before /{ticker_symbol}, which would otherwise match /stream.
+
+async def _subscribe_with_snapshot(db: AsyncSession, subscription: PriceSubscription, tickers: List[str]) -> None:
+    """
+    Subscribes to tickers. Tickers the hub has a recorded price for get it from the hub; the others get a
+    "snapshot" price looked up once through the cache, so every ticker starts with a price.
+    """
+    unknown = [t for t in tickers if t not in subscription.tickers and price_hub.latest(t) is None]
+    if unknown:
+        prices = await market_data_service.get_prices_for_tickers_async(db, unknown)
+        await db.commit() # Ends the read transaction: a stream must not hold a pooled connection
+        for ticker, price in prices.items():
+            subscription.offer(PriceUpdate(ticker, price, "snapshot"))
+    subscription.subscribe(tickers)
+
+@router.get("/stream")
+async def stream_prices_sse(
+    tickers: str = Query(..., description="Comma-separated ticker symbols, e.g. AAPL,MSFT"),
+    db: AsyncSession = Depends(get_async_db) # Only for the initial snapshot
+):
+    """
+    Server-sent events: a `price` event (JSON data, as the WebSocket messages) whenever a subscribed
+    ticker gets a new price, starting with the current price of each. A client that falls behind skips
+    to the latest price per ticker instead of queueing every update.
+    """
+    try:
+        ticker_symbols = parse_tickers(tickers)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if not ticker_symbols:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No tickers given")
+    subscription = price_hub.open()
+    try:
+        await _subscribe_with_snapshot(db, subscription, ticker_symbols)
+    except BaseException:
+        subscription.close()
+        raise
+
+    async def events():
+        try:
+            yield b": subscribed\n\n" # Sends the headers right away
+            while True:
+                updates = await subscription.next_updates(timeout=settings.PRICE_STREAM_HEARTBEAT_SECONDS)
+                if subscription.closed:
+                    return
+                # Sending waits for the client, while newer prices replace the pending ones
+                yield b"".join(update.sse for update in updates) if updates else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/stream")
+async def stream_prices_websocket(
+    websocket: WebSocket,
+    tickers: str = "",
+    db: AsyncSession = Depends(get_async_db) # Only for snapshots of newly subscribed tickers
+):
+    """
+    WebSocket price stream. Initial tickers may be given as ?tickers=AAPL,MSFT; afterwards the client
+    sends {"action": "subscribe" | "unsubscribe", "tickers": [...]}. The server sends
+    {"type": "price", "ticker_symbol", "price", "source", "timestamp"} messages (the latest price per
+    ticker if the client falls behind) and {"type": "error", "detail"} for invalid messages.
+    """
+    await websocket.accept()
+    try:
+        initial_tickers = parse_tickers(tickers)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e)) # Policy violation
+        return
+    subscription = price_hub.open()
+    receiving = sending = None
+    try:
+        await _subscribe_with_snapshot(db, subscription, initial_tickers)
+        # One task owns the socket's sending side; commands and updates are awaited together.
+        receiving = asyncio.ensure_future(websocket.receive_text())
+        sending = asyncio.ensure_future(subscription.next_updates())
+        while True:
+            done, _ = await asyncio.wait({receiving, sending}, return_when=asyncio.FIRST_COMPLETED)
+            if sending in done:
+                for update in sending.result():
+                    await websocket.send_text(update.json)
+                sending = asyncio.ensure_future(subscription.next_updates())
+            if receiving in done:
+                error = await _handle_stream_command(db, subscription, receiving.result())
+                if error:
+                    await websocket.send_text(json.dumps({"type": "error", "detail": error}))
+                receiving = asyncio.ensure_future(websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in (receiving, sending):
+            if task is not None:
+                task.cancel()
+        subscription.close()
+
+async def _handle_stream_command(db: AsyncSession, subscription: PriceSubscription, message: str) -> str | None:
+    """Applies one client message; returns an error to report, if any."""
+    try:
+        command = json.loads(message)
+        action, tickers = command["action"], command["tickers"]
+        if not isinstance(tickers, list) or not all(isinstance(t, str) for t in tickers):
+            raise TypeError("tickers must be a list of strings")
+        tickers = parse_tickers(",".join(tickers))
+    except (ValueError, KeyError, TypeError) as e:
+        return f"Expected {{\"action\": \"subscribe\" | \"unsubscribe\", \"tickers\": [...]}}: {e}"
+    if action == "subscribe":
+        if len(subscription.tickers | set(tickers)) > MAX_BATCH_TICKERS:
+            return f"At most {MAX_BATCH_TICKERS} tickers per stream"
+        await _subscribe_with_snapshot(db, subscription, tickers)
+    elif action == "unsubscribe":
+        subscription.unsubscribe(tickers)
+    else:
+        return f"Unknown action: {action}"
+    return None
+
 @router.get("/{ticker_symbol}", response_model=TickerPriceResponse)
 async def get_ticker_price(
     ticker_symbol: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db), # Only used to refresh the cache
+    read_db: AsyncSession = Depends(get_replica_db)
 ):
     """
     Fetches the current price for a given ticker symbol.
     The price can come from a real-time API (Finnhub), cache, or a mock source if real data fails.
     The 'source' field in the response indicates where the price data originated.
     """
-    price, source = market_data_service.get_current_price_with_source_info(db, ticker_symbol=ticker_symbol)
+    price, source = await market_data_service.get_current_price_with_source_info_async(
+        db, ticker_symbol=ticker_symbol, read_db=read_db
+    )
 
     if price is None: # Should ideally not happen if mock fallback always provides a price
         raise HTTPException(
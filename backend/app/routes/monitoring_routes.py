@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.database import get_pool_stats
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import PROMETHEUS_CONTENT_TYPE, REGISTRY
+from app.services.trade_journal_service import trade_journal
+
+router = APIRouter(
+    tags=["monitoring"],
+    # Operational data only, no user data; restrict access at the proxy if needed.
+)
+
+@router.get("/monitoring/db-pool")
+async def get_db_pool_stats():
+    """
+    Live connection pool state for the sync and async engines: checked-out, idle and overflow
+    connections, checkout wait histogram (seconds, cumulative buckets) and checkout timeouts.
+    """
+    return get_pool_stats()
+
+@router.get("/monitoring/invalidation")
+async def get_invalidation_bus_stats():
+    """
+    Cross-worker cache invalidation bus: whether it is running and listening, events waiting to be sent,
+    and the latency from another worker publishing an event to this one applying it (histogram, seconds).
+    """
+    return invalidation_bus.stats()
+
+@router.get("/monitoring/journal")
+async def get_trade_journal_stats():
+    """
+    Trade journal of this worker: whether it writes the journal, the offset its position book reached,
+    the journal's head and segments, and how the last startup recovered (snapshot offset, records replayed, time).
+    """
+    return trade_journal.stats()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    All application metrics in the Prometheus text format: per-route request counts, errors and latency,
+    price cache and Finnhub metrics, trade commit latency and failures, connection pool state and
+    cache invalidation events and latency.
+    """
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
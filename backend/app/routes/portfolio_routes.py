@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.portfolio_models import Portfolio, PortfolioCreate # Pydantic models
 from app.models.holding_models import Holding as PydanticHolding # Pydantic Holding model
+from app.models.rebalance_models import RebalanceRequest, RebalanceResult, BulkRebalanceRequest, BulkRebalanceResult
 from app.models.user_models import User as PydanticUser
-from app.services.auth_service import get_current_active_user
-from app.database import get_db
-from app.crud import crud_portfolio, crud_holding # Added crud_holding
+from app.services.auth_service import get_current_active_user, get_read_db
+from app.config import settings
+from app.database import get_async_db, get_db, pin_to_primary
+from app.crud.aio import crud_portfolio, crud_holding # Added crud_holding
+from app.services.invalidation_service import invalidation_bus
+from app.services import market_data_service, rebalance_service
+from app.services.holdings_index_service import holdings_for_valuation
+from app.services.portfolio_stream_service import portfolio_hub
+from app.routes.responses import ListResponder, NegotiatedRoute, check_not_modified
 
 router = APIRouter(
     prefix="/portfolios",
     tags=["portfolios"],
-    dependencies=[Depends(get_current_active_user)] # Protect all routes
+    dependencies=[Depends(get_current_active_user)], # Protect all routes
+    route_class=NegotiatedRoute, # JSON or MessagePack, per the Accept header
 )
 
+holding_list = ListResponder(PydanticHolding)
+
 # In-memory DB and ID counter are removed.
 # _fake_portfolios_db: List[Portfolio] = []
 # _next_portfolio_id: int = 1
@@ -23,22 +36,31 @@ router = APIRouter(
 async def create_portfolio(
     portfolio_in: PortfolioCreate,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # current_user is Pydantic User model, which has user_id
-    db_portfolio = crud_portfolio.create_user_portfolio(
+    db_portfolio = await crud_portfolio.create_user_portfolio(
         db=db, portfolio=portfolio_in, user_id=current_user.user_id
     )
+    pin_to_primary(current_user.user_id)
+    invalidation_bus.publish(
+        "portfolio", db_portfolio.portfolio_id, db_portfolio.user_id, db_portfolio.portfolio_name, db_portfolio.cash_balance
+    )
     return Portfolio.model_validate(db_portfolio)
 
 @router.get("/", response_model=List[Portfolio])
 async def list_portfolios(
+    request: Request,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db), # Replica unless the user wrote recently
     skip: int = 0,
     limit: int = 100
 ):
-    db_portfolios = crud_portfolio.get_portfolios_by_user(
+    summary = await crud_portfolio.get_portfolios_version_summary(db=db, user_id=current_user.user_id)
+    not_modified = check_not_modified(request, "portfolios", current_user.user_id, *summary, skip, limit)
+    if not_modified:
+        return not_modified
+    db_portfolios = await crud_portfolio.get_portfolios_by_user(
         db=db, user_id=current_user.user_id, skip=skip, limit=limit
     )
     return [Portfolio.model_validate(p) for p in db_portfolios]
@@ -46,15 +68,19 @@ async def list_portfolios(
 @router.get("/{portfolio_id}", response_model=Portfolio)
 async def get_portfolio(
     portfolio_id: int,
+    request: Request,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db) # Replica unless the user wrote recently
 ):
-    db_portfolio = crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+    db_portfolio = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
     if db_portfolio is None or db_portfolio.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Portfolio not found or not owned by user"
         )
+    not_modified = check_not_modified(request, "portfolio", portfolio_id, db_portfolio.version)
+    if not_modified:
+        return not_modified
     return Portfolio.model_validate(db_portfolio)
 
 @router.put("/{portfolio_id}", response_model=Portfolio)
@@ -62,19 +88,24 @@ async def update_portfolio(
     portfolio_id: int,
     portfolio_update: PortfolioCreate,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_portfolio = crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+    db_portfolio = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
     if db_portfolio is None or db_portfolio.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Portfolio not found or not owned by user"
         )
 
-    updated_db_portfolio = crud_portfolio.update_portfolio(
+    updated_db_portfolio = await crud_portfolio.update_portfolio(
         db=db, portfolio_id=portfolio_id, portfolio_update=portfolio_update
     )
     # crud_portfolio.update_portfolio itself returns the updated object or None if not found (already checked)
+    pin_to_primary(current_user.user_id)
+    invalidation_bus.publish(
+        "portfolio", updated_db_portfolio.portfolio_id, updated_db_portfolio.user_id,
+        updated_db_portfolio.portfolio_name, updated_db_portfolio.cash_balance
+    )
     return Portfolio.model_validate(updated_db_portfolio)
 
 
@@ -82,18 +113,20 @@ async def update_portfolio(
 async def delete_portfolio(
     portfolio_id: int,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_portfolio_to_delete = crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+    db_portfolio_to_delete = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
     if db_portfolio_to_delete is None or db_portfolio_to_delete.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Portfolio not found or not owned by user"
         )
 
-    deleted_portfolio = crud_portfolio.delete_portfolio(db=db, portfolio_id=portfolio_id)
+    deleted_portfolio = await crud_portfolio.delete_portfolio(db=db, portfolio_id=portfolio_id)
     if not deleted_portfolio: # Should not happen if previous check passed, but good for safety
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio deletion failed")
+    pin_to_primary(current_user.user_id)
+    invalidation_bus.publish("portfolio_removed", portfolio_id) # Also ends its open streams
 
     return None # Return None for 204 No Content
 
@@ -107,21 +140,119 @@ async def delete_portfolio(
 @router.get("/{portfolio_id}/holdings", response_model=List[PydanticHolding])
 async def list_portfolio_holdings(
     portfolio_id: int,
+    request: Request,
     current_user: PydanticUser = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db), # Replica unless the user wrote recently
     skip: int = 0,
     limit: int = 100
 ):
     # First, verify ownership of the portfolio
-    db_portfolio = crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+    db_portfolio = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
     if db_portfolio is None or db_portfolio.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Portfolio not found or not owned by user"
         )
+    # Unchanged since the client's copy (same portfolio version): skip the holdings query altogether
+    not_modified = check_not_modified(request, "holdings", portfolio_id, db_portfolio.version, skip, limit)
+    if not_modified:
+        return not_modified
 
-    # If ownership is confirmed, fetch holdings
-    db_holdings = crud_holding.get_holdings_by_portfolio(
+    # If ownership is confirmed, fetch holdings as column rows (validated and encoded once)
+    holding_rows = await crud_holding.get_holding_rows_by_portfolio(
         db=db, portfolio_id=portfolio_id, skip=skip, limit=limit
     )
-    return [PydanticHolding.model_validate(h) for h in db_holdings]
+    return holding_list.response(holding_rows)
+
+@router.get("/{portfolio_id}/stream")
+async def stream_portfolio(
+    portfolio_id: int,
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db) # Primary: the snapshot must include the latest trades
+):
+    """
+    Server-sent events with the portfolio's live valuation: a `snapshot` event (cash, market value,
+    total value, unrealized P&L, return and per-holding values), then a `patch` event whenever a trade
+    for the portfolio commits or a price of one of its holdings moves. Patches are JSON Merge Patches
+    (RFC 7396) of the snapshot: only the fields that changed, null for a sold-out holding. The stream
+    ends when the portfolio is deleted.
+    """
+    # Opened before reading, so trades committing meanwhile are replayed onto the snapshot
+    subscription = portfolio_hub.open(portfolio_id)
+    try:
+        db_portfolio = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+        if db_portfolio is None or db_portfolio.user_id != current_user.user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Portfolio not found or not owned by user"
+            )
+        if not subscription.view.loaded:
+            holdings = await holdings_for_valuation(db, db_portfolio)
+            prices = await market_data_service.get_prices_for_tickers_async(db, [ticker for ticker, _, _ in holdings])
+            portfolio_hub.load(portfolio_id, db_portfolio.cash_balance, holdings, prices)
+        await db.commit() # Ends the read transaction: a stream must not hold a pooled connection
+    except BaseException:
+        subscription.close()
+        raise
+
+    async def events():
+        try:
+            while True:
+                message = await subscription.next_message(timeout=settings.PRICE_STREAM_HEARTBEAT_SECONDS)
+                if subscription.closed:
+                    return
+                yield f"event: {message[0]}\ndata: {message[1]}\n\n".encode() if message else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{portfolio_id}/rebalance", response_model=RebalanceResult)
+async def rebalance_portfolio(
+    portfolio_id: int,
+    rebalance_in: RebalanceRequest,
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Moves the portfolio towards the given target weights with the fewest whole-share orders.
+    All tickers are priced in one batch and the orders (sells, then buys) are executed in a single
+    transaction. With dry_run the orders are only returned.
+    """
+    db_portfolio = await crud_portfolio.get_portfolio_by_id(db=db, portfolio_id=portfolio_id)
+    if db_portfolio is None or db_portfolio.user_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Portfolio not found or not owned by user"
+        )
+    result = await rebalance_service.rebalance_portfolio_async(
+        db, db_portfolio, target_weights=rebalance_in.target_weights, dry_run=rebalance_in.dry_run
+    )
+    if result.trades:
+        pin_to_primary(current_user.user_id)
+    return result
+
+@router.post("/rebalance/bulk", response_model=BulkRebalanceResult)
+async def bulk_rebalance_portfolios(
+    bulk_in: BulkRebalanceRequest,
+    current_user: PydanticUser = Depends(get_current_active_user),
+    db: Session = Depends(get_db) # Long batch job: sync session, run in the threadpool
+):
+    """
+    Rebalances many of the current user's portfolios (e.g. all portfolios following one model) to the same
+    target weights in one job. Each portfolio succeeds or fails on its own; see the per-portfolio results.
+    """
+    # Thousands of portfolios take a while; run the job off the event loop.
+    result = await run_in_threadpool(
+        rebalance_service.rebalance_portfolios_bulk,
+        db,
+        current_user.user_id,
+        bulk_in.portfolio_ids,
+        bulk_in.target_weights,
+        bulk_in.dry_run,
+    )
+    if not bulk_in.dry_run:
+        pin_to_primary(current_user.user_id)
+    return result
@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import inspect
+import math
+from contextvars import ContextVar
+from typing import Any, Callable, Generic, Iterable, List, Optional, Type, TypeVar
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+from app.services.encoding_service import JSON_FORMAT, ResponseFormat, encode_msgpack, negotiate_format
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Format negotiated for the current request by NegotiatedRoute (JSON outside of one)
+_response_format: ContextVar[ResponseFormat] = ContextVar("response_format", default=JSON_FORMAT)
+
+
+def current_response_format() -> ResponseFormat:
+    return _response_format.get()
+
+
+def msgpack_response(content: Any, response_format: ResponseFormat, status_code: int = 200) -> Response:
+    """`content` is Python-mode data (pydantic `dump_python`), so Decimals and datetimes are still typed."""
+    return Response(
+        content=encode_msgpack(content, response_format.decimal_scale),
+        status_code=status_code,
+        media_type=response_format.content_type,
+    )
+
+
+def _finite_input(value: Any) -> Any:
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value) # "nan", "inf": NaN/Infinity parse as JSON but cannot be encoded back
+    if isinstance(value, (list, tuple)):
+        return [_finite_input(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _finite_input(v) for k, v in value.items()}
+    return value
+
+
+async def validation_error_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
+    """FastAPI's 422 response, except that non-finite float inputs are echoed as strings."""
+    errors = [{**error, "input": _finite_input(error["input"])} if "input" in error else error for error in exc.errors()]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def check_not_modified(request: Request, *validators: Any) -> Optional[Response]:
+    """
+    Conditional GET for a NegotiatedRoute. The ETag is a hash of `validators` (e.g. the portfolio id and
+    version plus the page asked for) and the negotiated format; the caller must pass everything the
+    response body depends on. Returns a 304 response to send as is when If-None-Match matches, otherwise
+    None, and the route adds the ETag to the full response. Call it before running the expensive queries.
+    """
+    raw = "|".join(str(validator) for validator in (*validators, _response_format.get().content_type))
+    etag = f'W/"{hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()}"'
+    request.state.etag = etag
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304)
+    return None
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    Route class (`APIRouter(route_class=NegotiatedRoute)`) serving MessagePack instead of JSON to clients
+    asking for it in Accept (see encoding_service.negotiate_format). For MessagePack, what the endpoint
+    returns is validated against response_model and encoded from the typed values; JSON responses go
+    through FastAPI unchanged. Endpoints without a response_model, or returning a Response, are left alone.
+    Also adds the ETag of endpoints using check_not_modified to their responses.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def negotiated_endpoint(*args, **kwargs):
+                return self._negotiate(await endpoint(*args, **kwargs))
+        else:
+            @functools.wraps(endpoint)
+            def negotiated_endpoint(*args, **kwargs):
+                return self._negotiate(endpoint(*args, **kwargs))
+        super().__init__(path, negotiated_endpoint, **kwargs)
+        self._response_adapter: Optional[TypeAdapter] = None
+
+    def _negotiate(self, content: Any) -> Any:
+        response_format = _response_format.get()
+        if response_format is JSON_FORMAT or self.response_model is None or isinstance(content, Response):
+            return content
+        if self._response_adapter is None:
+            self._response_adapter = TypeAdapter(self.response_model)
+        adapter = self._response_adapter
+        value = adapter.validate_python(content, from_attributes=True)
+        return msgpack_response(adapter.dump_python(value), response_format, status_code=self.status_code or 200)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            token = _response_format.set(negotiate_format(request.headers.get("accept")))
+            try:
+                response = await handler(request)
+            finally:
+                _response_format.reset(token)
+            response.headers.append("Vary", "Accept")
+            etag = getattr(request.state, "etag", None)
+            if etag is not None and response.status_code in (200, 304):
+                response.headers["ETag"] = etag
+                # Clients may keep the response but must revalidate it (cheaply, with If-None-Match) before use
+                response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return negotiated_handler
+
+
+class ListResponder(Generic[ModelT]):
+    """
+    JSON list responses built from column rows (e.g. `result.mappings()`), not ORM objects.
+
+    Returning `[Model.model_validate(obj) for obj in orm_objects]` hydrates every ORM object, validates it
+    into the model, and then FastAPI validates the list again against response_model and encodes it with
+    jsonable_encoder + json.dumps. Here the rows are validated once, as a whole list, and encoded straight
+    to bytes by pydantic-core; the route returns the Response, so FastAPI skips its own pass. The JSON is
+    the same as response_model would produce (Decimals as strings, ISO timestamps), so keep
+    response_model on the route for the OpenAPI schema. On a NegotiatedRoute, clients asking for
+    MessagePack get the same list as MessagePack.
+    """
+
+    def __init__(self, model: Type[ModelT]):
+        self.adapter = TypeAdapter(List[model])
+
+    def validate(self, rows: Iterable[Any]) -> List[ModelT]:
+        return self.adapter.validate_python(rows)
+
+    def render(self, rows: Iterable[Any]) -> bytes:
+        return self.adapter.dump_json(self.validate(rows))
+
+    def response(self, rows: Iterable[Any], status_code: int = 200) -> Response:
+        response_format = _response_format.get()
+        if response_format is not JSON_FORMAT:
+            return msgpack_response(self.adapter.dump_python(self.validate(rows)), response_format, status_code)
+        return Response(content=self.render(rows), status_code=status_code, media_type="application/json")
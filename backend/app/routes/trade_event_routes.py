@@ -0,0 +1,42 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.services.auth_service import require_admin_token
+from app.services.trade_event_service import trade_event_relay
+
+router = APIRouter(
+    prefix="/trade-events",
+    tags=["trade-events"],
+    dependencies=[Depends(require_admin_token)], # For downstream systems (reporting, risk), not end users
+)
+
+@router.get("/stream")
+async def stream_trade_events(
+    after: Optional[int] = Query(None, ge=0, description="Offset to resume after; omit for new trades only"),
+    last_event_id: Optional[int] = Header(None, ge=0), # Sent by EventSource clients when reconnecting
+):
+    """
+    Server-sent `trade` events for every executed trade, from the trade_events outbox, in offset order.
+    Each event's id is its offset: a consumer resumes exactly where it stopped with Last-Event-ID
+    (or ?after=), and after=0 replays the whole history. Events are delivered in batches, one write each.
+    """
+    start = last_event_id if last_event_id is not None else after
+    subscription = await trade_event_relay.open(after=start)
+
+    async def events():
+        try:
+            yield f": from offset {subscription.cursor}\n\n".encode() # Sends the headers right away
+            while True:
+                batch = await subscription.next_batch(timeout=settings.PRICE_STREAM_HEARTBEAT_SECONDS)
+                if batch is None:
+                    return
+                yield b"".join(batch) if batch else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
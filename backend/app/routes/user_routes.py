@@ -4,21 +4,23 @@ from typing import List, Dict, Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session # Import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 # Models & Schemas
 from app.models.user_models import User, UserCreate, Token # UserInDB Pydantic model not directly used by routes now
 # DB related
-from app.database import get_db
-from app.crud import crud_user
+from app.database import get_async_db
+from app.crud.aio import crud_user
 from app.models.user_models import DBUser # SQLAlchemy model for type hint
+from app.config import settings
 
 # Services
 from app.services.auth_service import (
     create_access_token,
-    authenticate_user, # Use the new DB-aware authenticate_user
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+    authenticate_user_async, # DB-aware authentication that keeps bcrypt off the event loop
+    get_password_hash_async,
+    login_limiter,
     # get_password_hash, verify_password are now used within crud_user or authenticate_user
     get_current_active_user, # Import this
 )
@@ -33,21 +35,23 @@ router = APIRouter(
 # _next_user_id = 1
 
 @router.post("/register", response_model=User) # Returns Pydantic User model
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user_by_username = crud_user.get_user_by_username(db, username=user.username)
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # Queries go through the async session and bcrypt to the password pool, keeping the event loop free.
+    db_user_by_username = await crud_user.get_user_by_username(db, username=user.username)
     if db_user_by_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
-    db_user_by_email = crud_user.get_user_by_email(db, email=user.email)
+    db_user_by_email = await crud_user.get_user_by_email(db, email=user.email)
     if db_user_by_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    created_db_user = crud_user.create_user(db=db, user=user)
+    hashed_password = await get_password_hash_async(user.password)
+    created_db_user = await crud_user.create_user(db=db, user=user, hashed_password=hashed_password)
     # Convert SQLAlchemy model (DBUser) to Pydantic model (User) for response
     return User.model_validate(created_db_user)
 
@@ -55,10 +59,12 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # authenticate_user now handles fetching from DB and password verification
-    user = authenticate_user(db, username=form_data.username, password=form_data.password)
+    # Only LOGIN_MAX_CONCURRENCY logins are verified at once, so a login burst cannot starve trading traffic.
+    async with login_limiter.slot():
+        # authenticate_user_async fetches from DB and verifies the password without blocking the event loop
+        user = await authenticate_user_async(db, username=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,9 +72,10 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        # uid lets get_current_user resolve the user from its cache without a username lookup
+        data={"sub": user.username, "uid": user.user_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
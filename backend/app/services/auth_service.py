@@ -1,28 +1,118 @@
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import threading
+import time
 
-from fastapi import Depends, HTTPException, status
+from cachetools import TTLCache
+from sqlalchemy import event
+
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session # Added for DB session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session # Added for DB session
 from fastapi import Depends, HTTPException, status # Depends is already here
 from fastapi.security import OAuth2PasswordBearer
 
 # --- User Models & DB ---
 from app.models.user_models import TokenData, User, DBUser
 from app.crud import crud_user
-from app.database import get_db
+from app.crud.aio import crud_user as aio_crud_user
+from app.database import get_async_db, read_sessionmaker
 from app.config import settings # Import settings
+from app.services.invalidation_service import invalidation_bus
 
 # --- Password Hashing ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib/bcrypt and jose are imported on first use, keeping them out of the app's import time.
+_pwd_context = None
+_pwd_context_lock = threading.Lock()
+
+def get_pwd_context():
+    """The passlib CryptContext (bcrypt), created on first use."""
+    global _pwd_context
+    if _pwd_context is None:
+        with _pwd_context_lock:
+            if _pwd_context is None:
+                from passlib.context import CryptContext
+                _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# bcrypt costs ~100-300ms of CPU per call. Async routes run it on a small dedicated thread pool
+# (bcrypt releases the GIL) so the event loop keeps serving other requests. At most
+# PASSWORD_HASH_MAX_PENDING jobs may be running or queued; beyond that callers get a 503 straight
+# away instead of piling up behind the pool.
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_password_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+async def _run_password_job(fn, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, fn, *args)
+    finally:
+        _password_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps how many requests may be inside a block at once. Callers wait up to `timeout` seconds
+    for a slot, then get a 503, so a burst on one endpoint cannot take over the worker.
+    The asyncio semaphore is created per event loop (e.g. each TestClient runs its own loop).
+    """
+
+    def __init__(self, limit: int, timeout: float, name: str):
+        self.limit = limit
+        self.timeout = timeout
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Too many concurrent {self.name} requests, please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+login_limiter = ConcurrencyLimiter(
+    limit=settings.LOGIN_MAX_CONCURRENCY, timeout=settings.LOGIN_QUEUE_TIMEOUT_SECONDS, name="login"
+)
 
 # --- User Authentication ---
 def authenticate_user(db: Session, username: str, password: str) -> DBUser | None:
@@ -39,31 +129,103 @@ def authenticate_user(db: Session, username: str, password: str) -> DBUser | Non
         return None
     return user
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> DBUser | None:
+    """
+    Same as authenticate_user, but keeps the event loop free: the user lookup goes through the
+    async session and the bcrypt check runs on the bounded password-hashing pool.
+    """
+    user = await aio_crud_user.get_user_by_username(db, username=username)
+    if not user:
+        return None
+    if not await verify_password_async(password, user.password_hash):
+        return None
+    return user
+
 # --- JWT Handling ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    to_encode = data.copy() # data should contain 'sub': username
+    to_encode = data.copy() # data should contain 'sub': username and 'uid': user_id
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+# --- Identity Cache ---
+# Tokens carry the user_id ("uid" claim), so an authenticated request can be resolved from two small
+# in-process TTL/LRU caches without touching the database: decoded token payloads, and resolved users.
+# Entries live for AUTH_CACHE_TTL_SECONDS at most; a user row changing or being deleted drops its entry.
+_auth_cache_lock = threading.Lock()
+_token_cache: TTLCache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+_user_cache: TTLCache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+def decode_access_token(token: str) -> dict:
+    """
+    Decodes and verifies a JWT, reusing the result for repeated requests with the same token.
+    Raises JWTError if the token is invalid or expired.
+    """
+    from jose import JWTError, jwt
+    with _auth_cache_lock:
+        payload = _token_cache.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            return payload
+        with _auth_cache_lock:
+            _token_cache.pop(token, None)
+        raise JWTError("Signature has expired.")
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    with _auth_cache_lock:
+        _token_cache[token] = payload
+    return payload
+
+def cache_user(user: User) -> User:
+    with _auth_cache_lock:
+        _user_cache[user.user_id] = user
+    return user
+
+def invalidate_cached_user(user_id: int) -> None:
+    """
+    Drops a user from the identity cache so the next request reloads it from the database.
+    """
+    with _auth_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def clear_auth_cache() -> None:
+    with _auth_cache_lock:
+        _token_cache.clear()
+        _user_cache.clear()
+
+@event.listens_for(DBUser, "after_update")
+@event.listens_for(DBUser, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target: DBUser) -> None:
+    # Dropped from every worker's cache once the change commits (see invalidation_service)
+    session = object_session(target)
+    if session is not None:
+        invalidation_bus.publish_after_commit(session, "user", target.user_id)
+    else:
+        invalidation_bus.publish("user", target.user_id)
+
+invalidation_bus.register("user", invalidate_cached_user)
+invalidation_bus.register_resync(clear_auth_cache)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db) # Add DB session dependency
-) -> DBUser: # Return SQLAlchemy model DBUser
+    db: AsyncSession = Depends(get_async_db) # Only used on a cache miss; the session does not connect until queried
+) -> User: # Pydantic snapshot of the user, safe to cache across requests
+    from jose import JWTError
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_access_token(token)
         username: Optional[str] = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid") # Absent from tokens issued before the claim was added
         if username is None:
             raise credentials_exception
         # TokenData model is for payload structure, not needed to be returned here explicitly
@@ -71,23 +233,49 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception # This covers invalid token format, signature, expiry
 
-    user = crud_user.get_user_by_username(db, username=username)
-    if user is None:
+    if user_id is not None:
+        with _auth_cache_lock:
+            cached_user = _user_cache.get(user_id)
+        if cached_user is not None:
+            return cached_user
+        db_user = await aio_crud_user.get_user_by_id(db, user_id=user_id)
+    else:
+        db_user = await aio_crud_user.get_user_by_username(db, username=username)
+
+    if db_user is None:
         # This case means the user existed when token was issued, but not anymore.
         raise credentials_exception
-    return user # Return the SQLAlchemy DBUser object
+    return cache_user(User.model_validate(db_user))
+
+async def get_read_db(current_user: User = Depends(get_current_user)):
+    """
+    FastAPI dependency for read-only endpoints: an async session on the read replica, or on the primary
+    if no replica is configured or the user wrote recently (see database.pin_to_primary).
+    """
+    async with read_sessionmaker(current_user.user_id)() as db:
+        yield db
 
 async def get_current_active_user(
-    current_user: DBUser = Depends(get_current_user) # Depends on the new get_current_user
+    current_user: User = Depends(get_current_user) # Depends on the cached get_current_user
 ) -> User: # Return Pydantic User model for API response shaping
-    # Here you could add logic to check if current_user (DBUser) is active, e.g.
+    # Here you could add logic to check if current_user is active, e.g.
     # if current_user.disabled:
     #     raise HTTPException(status_code=400, detail="Inactive user")
 
-    # Convert DBUser (SQLAlchemy model) to User (Pydantic model) for the response
-    # This ensures that hashed_password and other sensitive DB fields are not directly returned
-    # if User Pydantic model is defined correctly (e.g. inherits from UserInDBBase and does not add password_hash)
-    return User.model_validate(current_user)
+    # get_current_user already returns the Pydantic User model, so hashed_password and other
+    # sensitive DB fields never reach the response.
+    return current_user
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    FastAPI dependency guarding /admin endpoints with the shared ADMIN_API_TOKEN (X-Admin-Token header).
+    The endpoints answer 404 while no token is configured, so they are not discoverable by default.
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
 
 
 # Removed _fake_db_users_auth_service, get_user_from_db (local fake one),
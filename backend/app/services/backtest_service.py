@@ -0,0 +1,138 @@
+import logging
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, List, Optional, Sequence
+
+from app.config import settings
+from app.models.backtest_models import BacktestParams, BacktestSummary
+from app.services import money, trade_rules
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+PCT_QUANTUM = Decimal("0.0001")
+# Below this many parameter combinations, spinning up worker processes costs more than it saves.
+SWEEP_PARALLEL_THRESHOLD = 4
+
+# --- Core engine ---
+# Bars live in a flat array('d') of closes; the loop keeps running sums for both moving
+# averages so each bar is O(1). Fills go through trade_rules, the same BUY/SELL cash and
+# holdings rules as crud_trade.create_portfolio_trade, with cash and prices in integer
+# micro-units (prices rounded to cents), so the loop does no Decimal arithmetic.
+
+def _to_price(close: float) -> int:
+    return money.to_micros(repr(close), money.MONEY_PLACES, ROUND_HALF_UP)
+
+def run_backtest(
+    closes: Sequence[float], fast_window: int, slow_window: int, starting_cash: Decimal
+) -> BacktestSummary:
+    """
+    Replays closing prices through a moving-average crossover strategy.
+    Buys as many whole shares as cash allows when the fast SMA crosses above the slow SMA,
+    and sells the whole position when it crosses back below. Returns only the summary.
+    """
+    prices = closes if isinstance(closes, array) else array("d", closes)
+    bar_count = len(prices)
+
+    cash, quantity, average_price = money.to_micros(starting_cash), 0, 0
+    cash_float = cash / money.MICROS
+    fast_sum = slow_sum = 0.0
+    previous_spread: Optional[float] = None
+    peak_equity, max_drawdown, trade_count = cash_float, 0.0, 0
+
+    for i in range(bar_count):
+        close = prices[i]
+        fast_sum += close
+        slow_sum += close
+        if i >= fast_window:
+            fast_sum -= prices[i - fast_window]
+        if i >= slow_window:
+            slow_sum -= prices[i - slow_window]
+
+        if i + 1 >= slow_window:
+            spread = fast_sum / fast_window - slow_sum / slow_window
+            if previous_spread is not None:
+                if quantity == 0 and previous_spread <= 0 < spread:
+                    price = _to_price(close)
+                    buy_quantity = cash // price if price > 0 else 0
+                    if buy_quantity > 0:
+                        cash, quantity, average_price = trade_rules.apply_buy(
+                            cash, quantity, average_price, price, buy_quantity
+                        )
+                        cash_float = cash / money.MICROS
+                        trade_count += 1
+                elif quantity > 0 and previous_spread >= 0 > spread:
+                    cash, quantity, average_price = trade_rules.apply_sell(
+                        cash, quantity, average_price, _to_price(close), quantity
+                    )
+                    cash_float = cash / money.MICROS
+                    trade_count += 1
+            previous_spread = spread
+
+        equity = cash_float + quantity * close
+        if equity > peak_equity:
+            peak_equity = equity
+        elif peak_equity > 0:
+            drawdown = (peak_equity - equity) / peak_equity
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+
+    final_value = cash + quantity * _to_price(prices[-1]) if bar_count else cash
+    starting_micros = money.to_micros(starting_cash)
+    total_return = money.percent(final_value - starting_micros, starting_micros) if starting_micros > 0 else Decimal("0.0000")
+    return BacktestSummary(
+        fast_window=fast_window,
+        slow_window=slow_window,
+        bar_count=bar_count,
+        starting_cash=Decimal(starting_cash).quantize(CENT),
+        final_value=money.from_micros(final_value),
+        total_return_pct=total_return,
+        max_drawdown_pct=(Decimal(repr(max_drawdown)) * 100).quantize(PCT_QUANTUM),
+        trade_count=trade_count,
+    )
+
+# --- Parameter sweeps ---
+
+def build_param_grid(fast_windows: Iterable[int], slow_windows: Iterable[int]) -> List[BacktestParams]:
+    """
+    Cartesian product of the windows, skipping combinations where fast >= slow.
+    """
+    slow_list = sorted(set(slow_windows))
+    return [
+        BacktestParams(fast_window=fast, slow_window=slow)
+        for fast in sorted(set(fast_windows)) if fast >= 1
+        for slow in slow_list if slow > fast
+    ]
+
+# Bars are sent to each worker process once, via the pool initializer, instead of with every task.
+_worker_closes: Optional[array] = None
+
+def _init_sweep_worker(closes: array) -> None:
+    global _worker_closes
+    _worker_closes = closes
+
+def _run_sweep_task(task: tuple) -> BacktestSummary:
+    fast_window, slow_window, starting_cash = task
+    return run_backtest(_worker_closes, fast_window, slow_window, starting_cash)
+
+def run_parameter_sweep(
+    closes: Sequence[float],
+    param_grid: Sequence[BacktestParams],
+    starting_cash: Decimal,
+    max_workers: Optional[int] = None,
+) -> List[BacktestSummary]:
+    """
+    Runs one backtest per parameter set, across a process pool when the grid is large enough.
+    Results come back in the same order as `param_grid`.
+    """
+    prices = array("d", closes)
+    tasks = [(p.fast_window, p.slow_window, starting_cash) for p in param_grid]
+    workers = max_workers or settings.BACKTEST_MAX_WORKERS
+    if workers <= 1 or len(tasks) < SWEEP_PARALLEL_THRESHOLD:
+        return [run_backtest(prices, fast, slow, cash) for fast, slow, cash in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor # Pulls in multiprocessing; only needed for large sweeps
+    workers = min(workers, len(tasks))
+    logger.info(f"Running backtest sweep of {len(tasks)} parameter sets on {workers} worker processes.")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker, initargs=(prices,)) as pool:
+        return list(pool.map(_run_sweep_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
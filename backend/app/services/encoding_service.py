@@ -0,0 +1,130 @@
+import gzip
+import logging
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Any, Dict, NamedTuple, Optional
+
+import msgpack
+
+try: # Optional: without it responses are only gzip-compressed
+    import zstandard
+except ImportError: # pragma: no cover - depends on the environment
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+MAX_DECIMAL_SCALE = 9
+
+
+def parse_qualities(header: Optional[str]) -> Dict[str, tuple[float, Dict[str, str]]]:
+    """
+    Parses an Accept or Accept-Encoding header into {lower-cased value: (q, parameters)}.
+    Entries with a malformed q count as q=0; when a value is listed twice the first one wins.
+    """
+    qualities: Dict[str, tuple[float, Dict[str, str]]] = {}
+    if not header:
+        return qualities
+    for entry in header.split(","):
+        value, *raw_params = [part.strip() for part in entry.split(";")]
+        if not value:
+            continue
+        params, q = {}, 1.0
+        for raw_param in raw_params:
+            name, _, param_value = raw_param.partition("=")
+            name, param_value = name.strip().lower(), param_value.strip().strip('"')
+            if name == "q":
+                try:
+                    q = max(0.0, min(1.0, float(param_value)))
+                except ValueError:
+                    q = 0.0
+            elif name:
+                params[name] = param_value
+        qualities.setdefault(value.lower(), (q, params))
+    return qualities
+
+# --- Response formats ---
+
+class ResponseFormat(NamedTuple):
+    media_type: str
+    # msgpack only: Decimals are sent as integers in units of 10**-decimal_scale instead of strings
+    decimal_scale: Optional[int] = None
+
+    @property
+    def content_type(self) -> str:
+        if self.decimal_scale is None:
+            return self.media_type
+        return f"{self.media_type}; decimal-scale={self.decimal_scale}"
+
+
+JSON_FORMAT = ResponseFormat(JSON_MEDIA_TYPE)
+
+
+def negotiate_format(accept: Optional[str]) -> ResponseFormat:
+    """
+    Picks JSON or MessagePack from an Accept header. MessagePack is only chosen when asked for with a
+    higher q than JSON (wildcards count as JSON), so browsers and clients sending */* keep getting JSON.
+    `application/msgpack; decimal-scale=2` asks for Decimals as fixed-point integers (cents at scale 2).
+    """
+    qualities = parse_qualities(accept)
+    msgpack_q, params = max((qualities.get(media_type, (0.0, {})) for media_type in MSGPACK_MEDIA_TYPES),
+                            key=lambda quality: quality[0])
+    json_q = max(qualities.get(value, (0.0, {}))[0] for value in (JSON_MEDIA_TYPE, "application/*", "*/*"))
+    if msgpack_q <= json_q:
+        return JSON_FORMAT
+    decimal_scale = params.get("decimal-scale")
+    if decimal_scale is not None:
+        try:
+            decimal_scale = int(decimal_scale)
+        except ValueError:
+            decimal_scale = None
+        else:
+            if not 0 <= decimal_scale <= MAX_DECIMAL_SCALE:
+                decimal_scale = None
+    return ResponseFormat(MSGPACK_MEDIA_TYPE, decimal_scale)
+
+
+def encode_msgpack(content: Any, decimal_scale: Optional[int] = None) -> bytes:
+    """
+    MessagePack for Python-mode model dumps (pydantic `dump_python`): Decimals become strings as in the
+    JSON responses, or integers in units of 10**-decimal_scale (rounded half-even past that scale),
+    and datetimes the msgpack timestamp extension (naive ones are UTC, as the database returns them).
+    """
+    def default(value):
+        if isinstance(value, Decimal):
+            if decimal_scale is None:
+                return str(value)
+            return int(value.scaleb(decimal_scale).to_integral_value(ROUND_HALF_EVEN))
+        if isinstance(value, datetime): # Aware datetimes are packed natively (datetime=True)
+            return msgpack.Timestamp.from_datetime(value.replace(tzinfo=timezone.utc))
+        raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+    return msgpack.packb(content, default=default, datetime=True)
+
+# --- Compression ---
+
+def available_encodings() -> tuple[str, ...]:
+    """Content codings this process can produce, preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best coding the client accepts (highest q, then our preference), or None for identity."""
+    qualities = parse_qualities(accept_encoding)
+    wildcard_q = qualities.get("*", (0.0, {}))[0]
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = qualities.get(encoding, (wildcard_q, {}))[0]
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level if level is not None else 6, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud.aio import crud_holding
+from app.models.portfolio_models import DBPortfolio
+from app.services import money
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import REGISTRY, gauge_lines
+
+HOLDINGS_INDEX_LOOKUPS = REGISTRY.counter(
+    "holdings_index_lookups_total",
+    "Holdings index lookups by trades and valuations, by result (hit: served from memory, miss: read from the database).",
+    ("result",),
+)
+_HITS = HOLDINGS_INDEX_LOOKUPS.labels("hit")
+_MISSES = HOLDINGS_INDEX_LOOKUPS.labels("miss")
+
+Holdings = Dict[str, Tuple[int, int]] # ticker_symbol -> (quantity, average_buy_price in micro-units)
+
+
+def loaded_version(db_portfolio: DBPortfolio) -> Optional[int]:
+    """The portfolio's version as loaded, or None if it is not (e.g. expired after a staged bump)."""
+    version = inspect(db_portfolio).dict.get("version")
+    return version if isinstance(version, int) else None
+
+
+class _Entry:
+    __slots__ = ("holdings", "version", "changes")
+
+    def __init__(self, holdings: Holdings, version: Optional[int]):
+        self.holdings = holdings # Replaced, never mutated, so readers can keep a reference without the lock
+        self.version = version # Portfolio version the holdings are exact at; None when unknown
+        self.changes = 0 # Trade events applied since loaded
+
+
+class HoldingsIndex:
+    """
+    Write-through cache of portfolio holdings: portfolio -> ticker -> (quantity, average cost in
+    micro-units), for trade validation (crud_trade.create_portfolio_trade) and valuation snapshots
+    (the portfolio stream) without reading the holdings table.
+
+    An entry is tagged with the portfolio version (see crud_portfolio.bump_portfolio_version) it is
+    exact at, and served only to a caller that loaded the portfolio at that same version, which every
+    trade and valuation does anyway. A stale entry therefore costs one reload, never a wrong answer:
+    the database stays the source of truth, and after a restart the index simply starts empty.
+
+    Committed trades are applied from the "trade" events of this worker and, over the invalidation
+    bus, of the others. Events carry no version, so applying one clears the tag, except that the
+    worker that made the trade re-tags the entry with the version its commit produced (confirm) when
+    no other commit came in between, in the database (that version is the loaded one + 1) or through
+    events here. At most HOLDINGS_INDEX_MAX_PORTFOLIOS portfolios are kept, least
+    recently used first out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.HOLDINGS_INDEX_ENABLED
+
+    def lookup(self, portfolio_id: int, version: int) -> Optional[Tuple[Holdings, tuple]]:
+        """(holdings, token for confirm) if the portfolio's holdings are known at `version`, else None."""
+        with self._lock:
+            entry = self._entries.get(portfolio_id)
+            if entry is None or entry.version != version:
+                _MISSES.inc()
+                return None
+            self._entries.move_to_end(portfolio_id)
+            _HITS.inc()
+            return entry.holdings, (entry, entry.changes, version)
+
+    def load(self, portfolio_id: int, version: int, holdings: Iterable[Tuple[str, int, Decimal]]) -> tuple:
+        """
+        Replaces the portfolio's entry with holdings read from the database at `version`, as
+        (ticker_symbol, quantity, average_buy_price). Returns the token for confirm.
+        """
+        entry = _Entry({
+            ticker: (quantity, money.to_micros(average_buy_price))
+            for ticker, quantity, average_buy_price in holdings if quantity > 0
+        }, version)
+        with self._lock:
+            self._entries[portfolio_id] = entry
+            self._entries.move_to_end(portfolio_id)
+            while len(self._entries) > settings.HOLDINGS_INDEX_MAX_PORTFOLIOS:
+                self._entries.popitem(last=False)
+        return entry, 0, version
+
+    def confirm(self, portfolio_id: int, token: tuple, version: int) -> None:
+        """
+        After a trade staged on the holdings behind `token` committed and published its event: tags the
+        entry with `version`, the portfolio's version as that commit left it, if the commit is the only one
+        since the holdings were read (version is the loaded one + 1) and its event the only one applied.
+        """
+        entry, changes, loaded = token
+        if version != loaded + 1: # Another writer committed in between; its changes may be missing here
+            return
+        with self._lock:
+            if self._entries.get(portfolio_id) is entry and entry.changes == changes + 1:
+                entry.version = version
+
+    # --- Hooks ---
+
+    def on_trade_committed(
+        self,
+        portfolio_id: int,
+        cash_balance: Decimal,
+        ticker_symbol: str,
+        quantity: int,
+        average_buy_price: Optional[Decimal],
+    ) -> None:
+        """Same post-commit state as LeaderboardService.on_trade_committed."""
+        average = money.to_micros(average_buy_price) if average_buy_price is not None else 0
+        with self._lock:
+            entry = self._entries.get(portfolio_id)
+            if entry is None:
+                return
+            holdings = dict(entry.holdings)
+            if quantity > 0:
+                holdings[ticker_symbol] = (quantity, average)
+            else:
+                holdings.pop(ticker_symbol, None)
+            entry.holdings, entry.version = holdings, None
+            entry.changes += 1
+
+    def on_portfolio_removed(self, portfolio_id: int) -> None:
+        with self._lock:
+            self._entries.pop(portfolio_id, None)
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "portfolios": len(self._entries),
+                "holdings": sum(len(entry.holdings) for entry in self._entries.values()),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+holdings_index = HoldingsIndex()
+
+invalidation_bus.register("trade", holdings_index.on_trade_committed)
+invalidation_bus.register("portfolio_removed", holdings_index.on_portfolio_removed)
+invalidation_bus.register_resync(holdings_index.reset) # Reloaded from the database on next use
+
+
+async def holdings_for_valuation(db: AsyncSession, db_portfolio: DBPortfolio) -> List[Tuple[str, int, Decimal]]:
+    """
+    (ticker_symbol, quantity, average_buy_price) of every holding of a loaded portfolio: from the index when
+    it is current, otherwise from the database (refilling the index).
+    """
+    version = loaded_version(db_portfolio) if holdings_index.enabled else None
+    found = holdings_index.lookup(db_portfolio.portfolio_id, version) if version is not None else None
+    if found is not None:
+        return [(ticker, quantity, money.from_micros(average)) for ticker, (quantity, average) in found[0].items()]
+    holdings = [
+        (h.ticker_symbol, h.quantity, h.average_buy_price)
+        for h in await crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[db_portfolio.portfolio_id])
+    ]
+    if version is not None:
+        holdings_index.load(db_portfolio.portfolio_id, version, holdings)
+    return holdings
+
+
+def _index_gauges():
+    stats = holdings_index.stats()
+    yield from gauge_lines("holdings_index_portfolios", "Portfolios in the holdings index.", [({}, stats["portfolios"])])
+    yield from gauge_lines("holdings_index_holdings", "Holdings in the holdings index.", [({}, stats["holdings"])])
+
+REGISTRY.add_collector(_index_gauges)
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.metrics_service import REGISTRY, gauge_lines
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_EVENTS = REGISTRY.counter(
+    "invalidation_events_total",
+    "Cache events sent to the other workers (sent) or received from them and applied (received), by kind.",
+    ("direction", "kind"),
+)
+INVALIDATION_LATENCY = REGISTRY.histogram(
+    "invalidation_latency_seconds",
+    "Time from publishing a cache event in one worker to applying it in another (across hosts, includes clock skew).",
+)
+INVALIDATION_RECONNECTS = REGISTRY.counter(
+    "invalidation_bus_reconnects_total", "Times the invalidation bus lost or failed to open its connection."
+)
+INVALIDATION_OVERFLOWS = REGISTRY.counter(
+    "invalidation_bus_overflows_total",
+    "Times the unsent events outgrew INVALIDATION_MAX_PENDING and were replaced by one resync.",
+)
+
+# NOTIFY payloads must be shorter than 8000 bytes; events are batched up to this size.
+MAX_PAYLOAD_BYTES = 7900
+RESYNC = "resync" # Event telling the other workers to drop what they cannot patch (see register_resync)
+_SESSION_KEY = "invalidation_events"
+
+
+def bus_dsn(database_url: str) -> Optional[str]:
+    """The asyncpg DSN for a PostgreSQL DATABASE_URL, or None for other databases (no bus)."""
+    url = make_url(database_url)
+    if url.get_backend_name() != "postgresql":
+        return None
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class InvalidationBus:
+    """
+    Keeps the in-process caches of every worker in step over Postgres LISTEN/NOTIFY.
+
+    Modules with a process-local cache register a handler per event kind (e.g. "trade" for the
+    leaderboard); code that changes the underlying data publishes the event once with `publish`, which
+    applies it in this worker right away and sends it to the others. Events are short positional lists
+    of JSON values (Decimals travel as strings), sent in batches on one dedicated connection, which
+    also LISTENs for the other workers' batches and applies them through the same handlers.
+
+    NOTIFY is fire-and-forget: a worker whose connection drops misses what was sent meanwhile. So each
+    (re)connection first runs the resync handlers, which drop what cannot be patched (reloaded lazily).
+    Events published while this worker's own connection is down wait in the outbox, up to
+    INVALIDATION_MAX_PENDING; past that the backlog is replaced by a single resync for the others.
+    Without PostgreSQL (or with INVALIDATION_BUS_ENABLED off) events are only applied locally.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12] # Tells this worker's own notifications apart
+        self._handlers: Dict[str, List[Callable[..., None]]] = {}
+        self._resync_handlers: List[Callable[[], None]] = []
+        self._outbox: Deque[Tuple[float, list]] = deque() # (published at, event); appended from any thread
+        self._outbox_lock = threading.Lock()
+        self._outbox_generation = 0 # Bumped when the backlog is replaced, so an in-flight batch is not popped twice
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+
+    # --- Handlers ---
+
+    def register(self, kind: str, handler: Callable[..., None]) -> None:
+        """`handler(*args)` runs for every `publish(kind, *args)`, here and in the other workers."""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def register_resync(self, handler: Callable[[], None]) -> None:
+        """`handler()` runs whenever events may have been missed; it should drop (not reload) its cache."""
+        self._resync_handlers.append(handler)
+
+    # --- Publishing (any thread) ---
+
+    def publish(self, kind: str, *args: Any) -> None:
+        """Applies an event in this worker and sends it to the others. Call after the change committed."""
+        self._dispatch(kind, args)
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        with self._outbox_lock:
+            if len(self._outbox) < settings.INVALIDATION_MAX_PENDING:
+                self._outbox.append((time.time(), [kind, *args]))
+            else:
+                # The others can no longer be caught up event by event (e.g. the database is down); they
+                # drop what they cannot patch instead, which also covers this event's change
+                self._outbox.clear()
+                self._outbox.append((time.time(), [RESYNC]))
+                self._outbox_generation += 1
+                INVALIDATION_OVERFLOWS.labels().inc()
+                logger.warning(
+                    f"{settings.INVALIDATION_MAX_PENDING} invalidation events unsent; asking other workers to resync instead"
+                )
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wakeup.set()
+        else:
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    def publish_after_commit(self, session: Session, kind: str, *args: Any) -> None:
+        """Publishes the event once `session` commits (and never if it rolls back)."""
+        session.info.setdefault(_SESSION_KEY, []).append((kind, args))
+
+    def _dispatch(self, kind: str, args) -> None:
+        for handler in self._handlers.get(kind, ()):
+            try:
+                handler(*args)
+            except Exception:
+                # A cache that failed to apply an event must not fail the write that published it
+                logger.exception(f"Applying {kind} event {args!r} failed")
+
+    def resync(self) -> None:
+        for handler in self._resync_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Invalidation resync handler failed")
+
+    # --- Connection ---
+
+    async def start(self) -> bool:
+        """
+        Starts the background listener on the running loop and waits for its first connection attempt,
+        so the initial resync is done before requests are served. False if there is no bus to join.
+        """
+        dsn = bus_dsn(settings.SQLALCHEMY_DATABASE_URL)
+        if not settings.INVALIDATION_BUS_ENABLED or dsn is None or self._task is not None:
+            return False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        first_attempt = asyncio.Event()
+        self._task = self._loop.create_task(self._run(dsn, first_attempt))
+        await first_attempt.wait()
+        return True
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+        with self._outbox_lock:
+            self._outbox.clear()
+
+    async def _run(self, dsn: str, first_attempt: asyncio.Event) -> None:
+        import asyncpg
+
+        delay = settings.INVALIDATION_RECONNECT_SECONDS
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn, timeout=10)
+                connection.add_termination_listener(lambda _: self._wakeup.set())
+                await connection.add_listener(settings.INVALIDATION_CHANNEL, self._on_notification)
+                self.connected = True
+                delay = settings.INVALIDATION_RECONNECT_SECONDS
+                logger.info(f"Invalidation bus listening on {settings.INVALIDATION_CHANNEL!r} as {self.origin}.")
+                # Events sent while this worker was not listening are lost; start over from the database
+                self.resync()
+                first_attempt.set()
+                await self._send_forever(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                INVALIDATION_RECONNECTS.labels().inc()
+                logger.warning(f"Invalidation bus connection failed ({e!r}); reconnecting in {delay:g}s.")
+            finally:
+                self.connected = False
+                first_attempt.set() # Unreachable database: serve anyway, with local events only until it connects
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def _send_forever(self, connection) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.INVALIDATION_PING_SECONDS)
+            except asyncio.TimeoutError:
+                await connection.fetchval("SELECT 1") # An idle connection can die silently; this notices
+                continue
+            self._wakeup.clear()
+            if connection.is_closed():
+                raise ConnectionError("connection closed")
+            while self._outbox:
+                generation = self._outbox_generation
+                payload, count = self._next_batch()
+                await connection.execute("SELECT pg_notify($1, $2)", settings.INVALIDATION_CHANNEL, payload)
+                with self._outbox_lock:
+                    if generation != self._outbox_generation:
+                        continue # The backlog was replaced by a resync meanwhile; that goes out next
+                    for _ in range(count): # Dropped only once sent; a failed batch goes out after reconnecting
+                        _, sent = self._outbox.popleft()
+                        INVALIDATION_EVENTS.labels("sent", sent[0]).inc()
+
+    def _next_batch(self) -> Tuple[str, int]:
+        """The next NOTIFY payload from the outbox and how many events it holds."""
+        encoded: List[str] = []
+        size = 0
+        with self._outbox_lock: # Events are at least 3 bytes encoded, so no batch holds more than this
+            pending = list(islice(self._outbox, MAX_PAYLOAD_BYTES // 3))
+        oldest = pending[0][0]
+        for _, event_args in pending:
+            item = json.dumps(event_args, separators=(",", ":"), default=str) # ASCII, so characters are bytes
+            if size + len(item) + 1 > MAX_PAYLOAD_BYTES - 64: # Leaves room for the envelope
+                break
+            encoded.append(item)
+            size += len(item) + 1
+        if not encoded: # One event too large for NOTIFY: the others cannot patch it, so they resync
+            logger.warning(f"{pending[0][1][0]} event too large for NOTIFY; asking other workers to resync")
+            encoded = [json.dumps([RESYNC])]
+        payload = f'{{"o":"{self.origin}","t":{oldest:.6f},"e":[{",".join(encoded)}]}}'
+        return payload, len(encoded)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            if message["o"] == self.origin:
+                return # Applied when published
+            events = message["e"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed invalidation payload: {payload[:200]!r}")
+            return
+        for kind, *args in events:
+            if kind == RESYNC:
+                self.resync()
+            else:
+                self._dispatch(kind, args)
+            INVALIDATION_EVENTS.labels("received", kind).inc()
+        INVALIDATION_LATENCY.labels().observe(max(time.time() - message.get("t", time.time()), 0.0))
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "connected": self.connected,
+            "origin": self.origin,
+            "pending": len(self._outbox),
+            "latency_seconds": INVALIDATION_LATENCY.labels().snapshot(),
+        }
+
+
+invalidation_bus = InvalidationBus()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    for kind, args in session.info.pop(_SESSION_KEY, ()):
+        invalidation_bus.publish(kind, *args)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _bus_gauges():
+    yield from gauge_lines(
+        "invalidation_bus_connected", "1 while the invalidation bus is listening, else 0.", [({}, int(invalidation_bus.connected))]
+    )
+    yield from gauge_lines(
+        "invalidation_bus_pending_events", "Events waiting to be sent to the other workers.", [({}, len(invalidation_bus._outbox))]
+    )
+
+REGISTRY.add_collector(_bus_gauges)
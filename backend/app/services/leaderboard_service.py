@@ -0,0 +1,400 @@
+import logging
+import random
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.crud.crud_portfolio import DEFAULT_STARTING_CASH
+from app.models.holding_models import DBHolding
+from app.models.leaderboard_models import LeaderboardEntry
+from app.models.market_data_models import DBMarketDataCache
+from app.models.portfolio_models import DBPortfolio
+from app.services import money
+from app.services.invalidation_service import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+STARTING_CASH_MICROS = money.to_micros(DEFAULT_STARTING_CASH)
+
+# --- Order-statistics tree ---
+# A treap (randomised balanced BST) augmented with subtree sizes, so insert, remove,
+# "how many keys sort before this one" and "k-th smallest key" are all O(log n) expected.
+
+class _Node:
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key, priority: float):
+        self.key = key
+        self.priority = priority
+        self.size = 1
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node: Optional[_Node], key) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Splits a subtree into (keys < key, keys >= key)."""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    """Merges two subtrees where every key in `left` sorts before every key in `right`."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _remove(node: Optional[_Node], key) -> Optional[_Node]:
+    if node is None:
+        return None
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    else:
+        node.right = _remove(node.right, key)
+    _update(node)
+    return node
+
+
+class RankTree:
+    """
+    Sorted multiset of unique, comparable keys with O(log n) rank queries.
+    Keys must be unique; callers make them unique by including an id as a tie-breaker.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self._root: Optional[_Node] = None
+        self._rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def insert(self, key) -> None:
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key, self._rng.random())), right)
+
+    def remove(self, key) -> None:
+        self._root = _remove(self._root, key)
+
+    def rank(self, key) -> int:
+        """Returns the number of keys strictly smaller than `key` (its 0-based position if present)."""
+        node, smaller = self._root, 0
+        while node is not None:
+            if node.key < key:
+                smaller += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return smaller
+
+    def kth(self, index: int):
+        """Returns the key at 0-based position `index`."""
+        if index < 0 or index >= len(self):
+            raise IndexError("RankTree index out of range")
+        node = self._root
+        while node is not None:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.key
+            else:
+                index -= left_size + 1
+                node = node.right
+        raise IndexError("RankTree index out of range") # Unreachable while sizes are consistent
+
+    def slice(self, offset: int, limit: int) -> List:
+        """Returns up to `limit` keys in order starting at position `offset` (O(log n + limit))."""
+        result: List = []
+        if limit <= 0 or offset >= len(self):
+            return result
+        # Descend to the node at `offset`, remembering the ancestors we still have to visit in order.
+        stack: List[_Node] = []
+        node, index = self._root, max(offset, 0)
+        while node is not None:
+            left_size = _size(node.left)
+            if index < left_size:
+                stack.append(node)
+                node = node.left
+            elif index == left_size:
+                stack.append(node)
+                break
+            else:
+                index -= left_size + 1
+                node = node.right
+        # Standard in-order iteration from there.
+        while stack and len(result) < limit:
+            node = stack.pop()
+            result.append(node.key)
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
+        return result
+
+
+# --- Leaderboard ---
+
+class _PortfolioState:
+    # Money in integer micro-units (see app.services.money)
+    __slots__ = ("portfolio_id", "user_id", "portfolio_name", "cash_balance", "holdings", "market_value", "key")
+
+    def __init__(self, portfolio_id: int, user_id: int, portfolio_name: str, cash_balance: Decimal):
+        self.portfolio_id = portfolio_id
+        self.user_id = user_id
+        self.portfolio_name = portfolio_name
+        self.cash_balance = money.to_micros(cash_balance)
+        self.holdings: Dict[str, Tuple[int, int]] = {} # ticker -> (quantity, average_buy_price)
+        self.market_value = 0
+        self.key: Optional[Tuple[int, int]] = None
+
+    @property
+    def total_value(self) -> int:
+        return self.cash_balance + self.market_value
+
+
+class LeaderboardService:
+    """
+    Keeps every portfolio ranked by return without revaluing the whole table per request.
+
+    The ranking is built once from the database (portfolios, holdings and cached prices) and is
+    then maintained incrementally: a committed trade revalues only its portfolio, and a price
+    update revalues only the portfolios holding that ticker. Each revaluation is one O(log n)
+    remove/insert in the order-statistics tree.
+    Holdings without a cached price are valued at their average buy price. Values are kept in integer
+    micro-units, so revaluations are exact int arithmetic; Decimals only come in and go out.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tree = RankTree()
+        self._portfolios: Dict[int, _PortfolioState] = {}
+        self._by_user: Dict[int, Set[int]] = {}
+        self._by_ticker: Dict[str, Set[int]] = {} # ticker -> portfolio_ids holding it
+        self._prices: Dict[str, int] = {} # Micro-units
+        self.loaded = False
+
+    # --- Loading ---
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.rebuild(db)
+
+    async def ensure_loaded_async(self, db: AsyncSession) -> None:
+        if not self.loaded:
+            # rebuild is plain ORM querying; run_sync runs it on the async session's connection
+            await db.run_sync(self.rebuild)
+
+    def rebuild(self, db: Session) -> None:
+        """Rebuilds the whole ranking from the database (three queries, no per-portfolio lookups)."""
+        portfolios = db.query(
+            DBPortfolio.portfolio_id, DBPortfolio.user_id, DBPortfolio.portfolio_name, DBPortfolio.cash_balance
+        ).all()
+        holdings = db.query(
+            DBHolding.portfolio_id, DBHolding.ticker_symbol, DBHolding.quantity, DBHolding.average_buy_price
+        ).all()
+        prices = db.query(DBMarketDataCache.ticker_symbol, DBMarketDataCache.last_price).all()
+        self.load_snapshot(portfolios, holdings, prices)
+        logger.info(f"Leaderboard rebuilt with {len(portfolios)} portfolios and {len(holdings)} holdings.")
+
+    def load_snapshot(
+        self,
+        portfolios: Iterable[Tuple[int, int, str, Decimal]],
+        holdings: Iterable[Tuple[int, str, int, Decimal]],
+        prices: Iterable[Tuple[str, Decimal]],
+    ) -> None:
+        """
+        Replaces the current state with the given rows:
+        portfolios as (portfolio_id, user_id, portfolio_name, cash_balance),
+        holdings as (portfolio_id, ticker_symbol, quantity, average_buy_price),
+        prices as (ticker_symbol, last_price).
+        """
+        with self._lock:
+            self.reset()
+            self._prices = {ticker.upper(): money.to_micros(price) for ticker, price in prices}
+            for portfolio_id, user_id, portfolio_name, cash_balance in portfolios:
+                state = _PortfolioState(portfolio_id, user_id, portfolio_name, cash_balance)
+                self._portfolios[portfolio_id] = state
+                self._by_user.setdefault(user_id, set()).add(portfolio_id)
+            for portfolio_id, ticker_symbol, quantity, average_buy_price in holdings:
+                state = self._portfolios.get(portfolio_id)
+                if state is None or quantity <= 0:
+                    continue
+                ticker = ticker_symbol.upper()
+                state.holdings[ticker] = (quantity, money.to_micros(average_buy_price))
+                state.market_value += quantity * self._price_for(ticker, state.holdings[ticker][1])
+                self._by_ticker.setdefault(ticker, set()).add(portfolio_id)
+            for state in self._portfolios.values():
+                self._rekey(state)
+            self.loaded = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tree = RankTree()
+            self._portfolios.clear()
+            self._by_user.clear()
+            self._by_ticker.clear()
+            self._prices.clear()
+            self.loaded = False
+
+    # --- Incremental updates ---
+    # All hooks are no-ops until the first rebuild; the rebuild then reads the committed state.
+
+    def on_portfolio_upserted(self, portfolio_id: int, user_id: int, portfolio_name: str, cash_balance: Decimal) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            state = self._portfolios.get(portfolio_id)
+            if state is None:
+                state = _PortfolioState(portfolio_id, user_id, portfolio_name, cash_balance)
+                self._portfolios[portfolio_id] = state
+                self._by_user.setdefault(user_id, set()).add(portfolio_id)
+            else:
+                state.portfolio_name = portfolio_name
+                state.cash_balance = money.to_micros(cash_balance)
+            self._rekey(state)
+
+    def on_portfolio_removed(self, portfolio_id: int) -> None:
+        with self._lock:
+            state = self._portfolios.pop(portfolio_id, None)
+            if state is None:
+                return
+            if state.key is not None:
+                self._tree.remove(state.key)
+            self._by_user.get(state.user_id, set()).discard(portfolio_id)
+            for ticker in state.holdings:
+                self._by_ticker.get(ticker, set()).discard(portfolio_id)
+
+    def on_trade_committed(
+        self,
+        portfolio_id: int,
+        cash_balance: Decimal,
+        ticker_symbol: str,
+        quantity: int,
+        average_buy_price: Optional[Decimal],
+    ) -> None:
+        """
+        Applies the post-commit state of one portfolio after a trade:
+        its new cash balance and the resulting holding for the traded ticker (quantity 0 means sold out).
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            state = self._portfolios.get(portfolio_id)
+            if state is None:
+                return # Portfolio created before we loaded and not yet seen; the next rebuild picks it up.
+            ticker = ticker_symbol.upper()
+            previous = state.holdings.pop(ticker, None)
+            if previous is not None:
+                state.market_value -= previous[0] * self._price_for(ticker, previous[1])
+            if quantity > 0:
+                avg_price = money.to_micros(average_buy_price) if average_buy_price is not None else 0
+                state.holdings[ticker] = (quantity, avg_price)
+                state.market_value += quantity * self._price_for(ticker, avg_price)
+                self._by_ticker.setdefault(ticker, set()).add(portfolio_id)
+            else:
+                self._by_ticker.get(ticker, set()).discard(portfolio_id)
+            state.cash_balance = money.to_micros(cash_balance)
+            self._rekey(state)
+
+    def on_price_update(self, ticker_symbol: str, price: Decimal) -> None:
+        """Revalues only the portfolios that hold `ticker_symbol`."""
+        with self._lock:
+            if not self.loaded:
+                return
+            ticker = ticker_symbol.upper()
+            new_price = money.to_micros(price)
+            old_price = self._prices.get(ticker)
+            if old_price == new_price:
+                return
+            self._prices[ticker] = new_price
+            for portfolio_id in self._by_ticker.get(ticker, ()):
+                state = self._portfolios[portfolio_id]
+                quantity, avg_price = state.holdings[ticker]
+                previous_price = old_price if old_price is not None else avg_price
+                state.market_value += quantity * (new_price - previous_price)
+                self._rekey(state)
+
+    # --- Queries ---
+
+    def top(self, limit: int = 10, offset: int = 0) -> List[LeaderboardEntry]:
+        with self._lock:
+            keys = self._tree.slice(offset, limit)
+            return [self._entry(offset + i + 1, self._portfolios[key[1]]) for i, key in enumerate(keys)]
+
+    def rank_of(self, portfolio_id: int) -> Optional[LeaderboardEntry]:
+        with self._lock:
+            state = self._portfolios.get(portfolio_id)
+            if state is None or state.key is None:
+                return None
+            return self._entry(self._tree.rank(state.key) + 1, state)
+
+    def ranks_for_user(self, user_id: int) -> List[LeaderboardEntry]:
+        with self._lock:
+            entries = [self.rank_of(portfolio_id) for portfolio_id in self._by_user.get(user_id, ())]
+            return sorted((e for e in entries if e is not None), key=lambda e: e.rank)
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    # --- Internals ---
+
+    def _price_for(self, ticker: str, fallback: int) -> int:
+        return self._prices.get(ticker, fallback)
+
+    def _rekey(self, state: _PortfolioState) -> None:
+        if state.key is not None:
+            self._tree.remove(state.key)
+        state.key = (-state.total_value, state.portfolio_id) # Highest value first, ties by portfolio_id
+        self._tree.insert(state.key)
+
+    @staticmethod
+    def _entry(rank: int, state: _PortfolioState) -> LeaderboardEntry:
+        total_value = state.total_value
+        return LeaderboardEntry(
+            rank=rank,
+            portfolio_id=state.portfolio_id,
+            user_id=state.user_id,
+            portfolio_name=state.portfolio_name,
+            total_value=money.from_micros(total_value),
+            return_pct=money.percent(total_value - STARTING_CASH_MICROS, STARTING_CASH_MICROS),
+        )
+
+
+# Process-wide instance, used by the leaderboard routes and kept current by the cache events of every worker.
+leaderboard = LeaderboardService()
+
+invalidation_bus.register("trade", leaderboard.on_trade_committed)
+invalidation_bus.register("price", leaderboard.on_price_update)
+invalidation_bus.register("portfolio", leaderboard.on_portfolio_upserted)
+invalidation_bus.register("portfolio_removed", leaderboard.on_portfolio_removed)
+invalidation_bus.register_resync(leaderboard.reset) # Rebuilt from the database on next use
@@ -1,19 +1,25 @@
 import logging
 from decimal import Decimal
+from typing import Dict, Iterable
 import random
-import requests # For making HTTP requests
+import time
 from datetime import datetime, timedelta, timezone # For cache expiry and UTC timestamps
 
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings # For API Key and other settings
 from app.models.market_data_models import DBMarketDataCache
+from app.services.metrics_service import FINNHUB_REQUEST_DURATION, MARKETDATA_CACHE, MARKETDATA_PRICE_SOURCE
+from app.services.invalidation_service import invalidation_bus
 
 # Configure logging (ensure it's configured, or use FastAPI's logger)
 logger = logging.getLogger(__name__)
 # logging.basicConfig(level=logging.INFO) # Can be configured in main app or config
 
-FINNHUB_BASE_URL = "https://finnhub.io/api/v1"
+FINNHUB_BASE_URL = settings.FINNHUB_BASE_URL
 CACHE_EXPIRY_SECONDS = 60  # Cache prices for 60 seconds
 
 # --- CRUD operations for MarketDataCache (can be embedded or separated) ---
@@ -39,6 +45,8 @@ def update_cache_entry(db: Session, ticker_symbol: str, price: Decimal) -> DBMar
         db.add(cached_item)
     db.commit() # Commit here as this is a self-contained cache update operation
     db.refresh(cached_item)
+    # Every worker revalues the portfolios holding this ticker and pushes it to its price streams
+    invalidation_bus.publish("price", ticker_symbol, price)
     return cached_item
 
 # --- Price Fetching Logic ---
@@ -49,24 +57,66 @@ def get_real_current_price_with_source(db: Session, ticker_symbol: str) -> tuple
     Returns the price and the source ("cached", "realtime_finnhub", "api_key_missing", "finnhub_error", "processing_error").
     """
     normalized_ticker = ticker_symbol.upper()
-    source = "unknown" # Default source
 
     # 1. Check Cache
     cached_data = get_cache_entry(db, normalized_ticker)
+    if _record_cache_lookup(cached_data):
+        logger.debug(f"Returning cached price for {normalized_ticker}: {cached_data.last_price}")
+        return cached_data.last_price, "cached"
     if cached_data:
-        current_time_utc = datetime.now(timezone.utc)
-        if cached_data.last_updated + timedelta(seconds=CACHE_EXPIRY_SECONDS) > current_time_utc:
-            logger.info(f"Returning cached price for {normalized_ticker}: {cached_data.last_price}")
-            return cached_data.last_price, "cached"
-        else:
-            logger.info(f"Cache expired for {normalized_ticker}.")
-            source = "cache_expired_refreshing" # Will attempt refresh
+        logger.info(f"Cache expired for {normalized_ticker}. Refreshing from Finnhub.")
+
+    # 2. Fetch from Finnhub API (also updates the cache)
+    return _fetch_price_from_finnhub(db, normalized_ticker)
+
+
+def _is_cache_fresh(cached_data: DBMarketDataCache) -> bool:
+    last_updated = cached_data.last_updated
+    if last_updated.tzinfo is None: # SQLite drops the offset; timestamps are stored in UTC
+        last_updated = last_updated.replace(tzinfo=timezone.utc)
+    return last_updated + timedelta(seconds=CACHE_EXPIRY_SECONDS) > datetime.now(timezone.utc)
+
+
+def _record_cache_lookup(cached_data: DBMarketDataCache | None) -> bool:
+    """Returns whether the entry is fresh, counting the lookup as a cache hit, expired entry or miss."""
+    if cached_data is None:
+        MARKETDATA_CACHE.labels("miss").inc()
+        return False
+    fresh = _is_cache_fresh(cached_data)
+    MARKETDATA_CACHE.labels("hit" if fresh else "expired").inc()
+    return fresh
+
+
+def _fetch_price_from_finnhub(db: Session, normalized_ticker: str) -> tuple[Decimal | None, str]:
+    """
+    Fetches one quote from Finnhub and writes it to the cache.
+    Returns the price (or None) and the source / failure reason.
+    """
+    current_price, source = _request_finnhub_quote(normalized_ticker)
+    if current_price is not None:
+        # 3. Update Cache
+        update_cache_entry(db, normalized_ticker, current_price)
+        logger.info(f"Fetched real price for {normalized_ticker} from Finnhub and updated cache: {current_price}")
+    return current_price, source
+
 
-    # 2. Fetch from Finnhub API
+def _request_finnhub_quote(normalized_ticker: str) -> tuple[Decimal | None, str]:
+    """
+    Requests one quote from Finnhub (blocking HTTP, no database access).
+    Returns the price (or None) and the source / failure reason.
+    """
     if not settings.FINNHUB_API_KEY:
         logger.error("FINNHUB_API_KEY not set. Cannot fetch real market data.")
         return None, "api_key_missing"
 
+    start = time.perf_counter()
+    current_price, source = _call_finnhub_quote(normalized_ticker)
+    FINNHUB_REQUEST_DURATION.labels(source).observe(time.perf_counter() - start)
+    return current_price, source
+
+
+def _call_finnhub_quote(normalized_ticker: str) -> tuple[Decimal | None, str]:
+    import requests # Imported on first use; most requests are served from the cache
     try:
         logger.info(f"Fetching real price for {normalized_ticker} from Finnhub...")
         response = requests.get(
@@ -89,12 +139,7 @@ def get_real_current_price_with_source(db: Session, ticker_symbol: str) -> tuple
             # For now, if 'c' is 0 or None, treat as no reliable current price found.
             return None, "finnhub_no_data"
 
-        current_price = Decimal(str(current_price_value))
-
-        # 3. Update Cache
-        update_cache_entry(db, normalized_ticker, current_price)
-        logger.info(f"Fetched real price for {normalized_ticker} from Finnhub and updated cache: {current_price}")
-        return current_price, "realtime_finnhub"
+        return Decimal(str(current_price_value)), "realtime_finnhub"
 
     except requests.exceptions.Timeout:
         logger.error(f"Timeout when fetching price for {normalized_ticker} from Finnhub.")
@@ -112,6 +157,37 @@ def get_real_current_price_with_source(db: Session, ticker_symbol: str) -> tuple
     return None, source
 
 
+def get_prices_for_tickers(db: Session, ticker_symbols: Iterable[str]) -> Dict[str, Decimal]:
+    """
+    Prices a set of tickers in one batch, keyed by upper-cased ticker.
+    All cache entries are read with a single query; only missing or expired tickers go to Finnhub
+    (which has no batch quote endpoint), and anything still unpriced falls back to mock prices,
+    so every requested ticker gets a price.
+    """
+    tickers = sorted({t.upper() for t in ticker_symbols})
+    if not tickers:
+        return {}
+
+    prices: Dict[str, Decimal] = {}
+    cached_rows = db.query(DBMarketDataCache).filter(DBMarketDataCache.ticker_symbol.in_(tickers)).all()
+    cached_by_ticker = {cached_data.ticker_symbol: cached_data for cached_data in cached_rows}
+
+    for ticker in tickers:
+        cached_data = cached_by_ticker.get(ticker)
+        if _record_cache_lookup(cached_data):
+            price, source = cached_data.last_price, "cached"
+        else:
+            price, source = _fetch_price_from_finnhub(db, ticker)
+            if price is None:
+                logger.warning(f"Failed to get real price for {ticker} (reason: {source}). Falling back to mock price.")
+                price, source = _get_mock_current_price_with_source(ticker, reason=f"real_price_fetch_failed_{source}")
+        MARKETDATA_PRICE_SOURCE.labels(source).inc()
+        prices[ticker] = price
+
+    logger.info(f"Priced {len(tickers)} tickers in one batch ({len(cached_rows)} cache rows read).")
+    return prices
+
+
 MOCK_PRICES = {
     "AAPL": Decimal("170.25"), "MSFT": Decimal("300.50"), "GOOGL": Decimal("2750.75"),
     "TSLA": Decimal("1000.00"), "NVDA": Decimal("250.60"), "AMZN": Decimal("3200.00"),
@@ -142,12 +218,14 @@ def get_current_price_with_source_info(db: Session, ticker_symbol: str) -> tuple
     price, source = get_real_current_price_with_source(db, ticker_symbol)
 
     if price is not None:
+        MARKETDATA_PRICE_SOURCE.labels(source).inc()
         return price, source
     else:
         # If real price fetch failed (price is None), source indicates the reason for failure.
         # We then fallback to mock price.
         logger.warning(f"Failed to get real price for {ticker_symbol} (reason: {source}). Falling back to mock price.")
         mock_price, mock_source = _get_mock_current_price_with_source(ticker_symbol, reason=f"real_price_fetch_failed_{source}")
+        MARKETDATA_PRICE_SOURCE.labels(mock_source).inc()
         return mock_price, mock_source # mock_source will be mock_fixed or mock_random
 
 # This function is used by crud_trade.py, ensure it still returns just Decimal or update crud_trade.py
@@ -165,6 +243,100 @@ def get_price_for_trade(db: Session, ticker_symbol: str) -> Decimal:
         return Decimal("1.00")
     return price
 
+# --- Async variants (AsyncSession) ---
+# Same behaviour as the functions above. Cache reads/writes go through the async session; the Finnhub
+# request itself still uses `requests` and runs in the threadpool so it does not block the event loop.
+
+async def get_cache_entry_async(db: AsyncSession, ticker_symbol: str) -> DBMarketDataCache | None:
+    return await db.scalar(
+        select(DBMarketDataCache).where(DBMarketDataCache.ticker_symbol == ticker_symbol).limit(1)
+    )
+
+async def update_cache_entry_async(db: AsyncSession, ticker_symbol: str, price: Decimal) -> DBMarketDataCache:
+    """
+    Creates or updates a cache entry. Commits are handled by this function.
+    """
+    cached_item = await get_cache_entry_async(db, ticker_symbol)
+    if cached_item:
+        cached_item.last_price = price
+        cached_item.last_updated = datetime.now(timezone.utc)
+    else:
+        cached_item = DBMarketDataCache(ticker_symbol=ticker_symbol, last_price=price)
+        db.add(cached_item)
+    await db.commit()
+    await db.refresh(cached_item)
+    # Every worker revalues the portfolios holding this ticker and pushes it to its price streams
+    invalidation_bus.publish("price", ticker_symbol, price)
+    return cached_item
+
+async def _fetch_price_from_finnhub_async(db: AsyncSession, normalized_ticker: str) -> tuple[Decimal | None, str]:
+    current_price, source = await run_in_threadpool(_request_finnhub_quote, normalized_ticker)
+    if current_price is not None:
+        await update_cache_entry_async(db, normalized_ticker, current_price)
+        logger.info(f"Fetched real price for {normalized_ticker} from Finnhub and updated cache: {current_price}")
+    return current_price, source
+
+async def get_real_current_price_with_source_async(
+    db: AsyncSession, ticker_symbol: str, read_db: AsyncSession | None = None
+) -> tuple[Decimal | None, str]:
+    """
+    If read_db (e.g. a replica session) is given, the cache is read from it first; the primary is only
+    checked, and the cache refreshed through db, when the replica's copy is missing or expired.
+    """
+    normalized_ticker = ticker_symbol.upper()
+    cached_data = await get_cache_entry_async(read_db or db, normalized_ticker)
+    if read_db is not None and not (cached_data and _is_cache_fresh(cached_data)):
+        cached_data = await get_cache_entry_async(db, normalized_ticker) # The replica may lag the primary
+    if _record_cache_lookup(cached_data):
+        logger.debug(f"Returning cached price for {normalized_ticker}: {cached_data.last_price}")
+        return cached_data.last_price, "cached"
+    if cached_data:
+        logger.info(f"Cache expired for {normalized_ticker}. Refreshing from Finnhub.")
+    return await _fetch_price_from_finnhub_async(db, normalized_ticker)
+
+async def get_current_price_with_source_info_async(
+    db: AsyncSession, ticker_symbol: str, read_db: AsyncSession | None = None
+) -> tuple[Decimal | None, str]:
+    price, source = await get_real_current_price_with_source_async(db, ticker_symbol, read_db=read_db)
+    if price is None:
+        logger.warning(f"Failed to get real price for {ticker_symbol} (reason: {source}). Falling back to mock price.")
+        price, source = _get_mock_current_price_with_source(ticker_symbol, reason=f"real_price_fetch_failed_{source}")
+    MARKETDATA_PRICE_SOURCE.labels(source).inc()
+    return price, source
+
+async def get_price_for_trade_async(db: AsyncSession, ticker_symbol: str) -> Decimal:
+    price, _ = await get_current_price_with_source_info_async(db, ticker_symbol)
+    if price is None: # Should theoretically not happen with current mock fallback
+        logger.error(f"CRITICAL: Price for {ticker_symbol} resolved to None even after mock fallback. Defaulting to 1.00")
+        return Decimal("1.00")
+    return price
+
+async def get_prices_for_tickers_async(db: AsyncSession, ticker_symbols: Iterable[str]) -> Dict[str, Decimal]:
+    tickers = sorted({t.upper() for t in ticker_symbols})
+    if not tickers:
+        return {}
+
+    prices: Dict[str, Decimal] = {}
+    cached_rows = list(await db.scalars(
+        select(DBMarketDataCache).where(DBMarketDataCache.ticker_symbol.in_(tickers))
+    ))
+    cached_by_ticker = {cached_data.ticker_symbol: cached_data for cached_data in cached_rows}
+
+    for ticker in tickers:
+        cached_data = cached_by_ticker.get(ticker)
+        if _record_cache_lookup(cached_data):
+            price, source = cached_data.last_price, "cached"
+        else:
+            price, source = await _fetch_price_from_finnhub_async(db, ticker)
+            if price is None:
+                logger.warning(f"Failed to get real price for {ticker} (reason: {source}). Falling back to mock price.")
+                price, source = _get_mock_current_price_with_source(ticker, reason=f"real_price_fetch_failed_{source}")
+        MARKETDATA_PRICE_SOURCE.labels(source).inc()
+        prices[ticker] = price
+
+    logger.info(f"Priced {len(tickers)} tickers in one batch ({len(cached_rows)} cache rows read).")
+    return prices
+
 # Original get_mock_current_price can be an alias or deprecated if needed
 # For clarity, it's better to use _get_mock_current_price_with_source internally
 # and let get_price_for_trade handle the fallback logic.
@@ -0,0 +1,244 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds (upper bounds); observations above the last one only count towards +Inf.
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Primitives ---
+# Values are kept in per-thread shards: a thread only ever writes its own shard, so recording takes no
+# lock (one thread-local lookup plus a few list operations). Reads sum all shards; a read racing a
+# write may miss that one update, which is fine for monitoring. Shards of finished threads are kept,
+# so counts never go backwards.
+
+class _Sharded:
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[list] = []
+        self._shards_lock = threading.Lock() # Only taken when a thread records for the first time
+
+    def _shard(self) -> list:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0] * self._width
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _totals(self) -> list:
+        totals = [0] * self._width
+        for shard in list(self._shards):
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    """Monotonic counter."""
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._totals()[0]
+
+
+class Histogram(_Sharded):
+    """Fixed-bucket histogram."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket, one for +Inf, then sum and count
+        super().__init__(len(self.buckets) + 3)
+
+    def observe(self, value: float) -> None:
+        shard = self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Cumulative bucket counts keyed by upper bound (as in Prometheus), plus count and sum."""
+        totals = self._totals()
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), totals):
+            running += bucket_count
+            cumulative[_format_bound(bound)] = running
+        return {"buckets": cumulative, "count": totals[-1], "sum": round(totals[-2], 6)}
+
+# --- Named, labelled metrics and the registry ---
+
+class MetricFamily:
+    """A named metric with a fixed set of label names; one Counter or Histogram per label combination."""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str] = (), factory=None):
+        self.kind = kind # "counter" or "histogram"
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Returns the child for these label values (positional, in labelnames order), creating it once."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._children_lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        return list(self._children.items())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None: # Re-registration (e.g. a module imported twice) returns the original
+                return existing
+            self._families[family.name] = family
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily("counter", name, documentation, labelnames, Counter))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> MetricFamily:
+        return self._register(MetricFamily("histogram", name, documentation, labelnames, lambda: Histogram(buckets)))
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Registers a callable returning extra exposition lines (e.g. gauges read at scrape time)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for family in sorted(self._families.values(), key=lambda f: f.name):
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in sorted(family.children(), key=lambda item: item[0]):
+                label_pairs = list(zip(family.labelnames, values))
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_format_labels(label_pairs)} {_format_value(child.value)}")
+                    continue
+                snapshot = child.snapshot()
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f"{family.name}_bucket{_format_labels(label_pairs + [('le', bound)])} {count}")
+                lines.append(f"{family.name}_sum{_format_labels(label_pairs)} {_format_value(snapshot['sum'])}")
+                lines.append(f"{family.name}_count{_format_labels(label_pairs)} {snapshot['count']}")
+        for collector in list(self._collectors):
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Exposition lines for a gauge read at scrape time, for use in collectors."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{_format_labels(list(labels.items()))} {_format_value(value)}" for labels, value in samples)
+    return lines
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Application metrics ---
+# Defined here so every module records into the same families.
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code.", ("method", "route", "status")
+)
+HTTP_REQUEST_ERRORS = REGISTRY.counter(
+    "http_request_errors_total", "HTTP requests that failed with a 5xx status or an unhandled exception.", ("method", "route")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to serve an HTTP request, by method and route template.", ("method", "route")
+)
+MARKETDATA_CACHE = REGISTRY.counter(
+    "marketdata_cache_lookups_total", "Price cache lookups by result (hit, miss, expired).", ("result",)
+)
+MARKETDATA_PRICE_SOURCE = REGISTRY.counter(
+    "marketdata_prices_total", "Prices served by source (cached, realtime_finnhub, mock_fixed, ...).", ("source",)
+)
+FINNHUB_REQUEST_DURATION = REGISTRY.histogram(
+    "finnhub_request_duration_seconds", "Finnhub quote request latency by outcome.", ("outcome",)
+)
+TRADE_COMMIT_DURATION = REGISTRY.histogram(
+    "trade_commit_duration_seconds", "Time to commit a trade transaction (single trade or atomic batch).", ("kind",)
+)
+TRADE_FAILURES = REGISTRY.counter(
+    "trade_failures_total", "Trades rejected by the trade rules or failing to commit.", ("kind", "reason")
+)
+DB_POOL_CHECKOUT_WAIT = REGISTRY.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting to check out a pooled connection.", ("pool",)
+)
+DB_POOL_CHECKOUT_TIMEOUTS = REGISTRY.counter(
+    "db_pool_checkout_timeouts_total", "Connection checkouts that timed out.", ("pool",)
+)
+
+
+class PoolMetrics:
+    """Checkout wait times and timeouts of one connection pool (see database.InstrumentedPoolMixin)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wait_seconds: Histogram = DB_POOL_CHECKOUT_WAIT.labels(name)
+        self._timeouts: Counter = DB_POOL_CHECKOUT_TIMEOUTS.labels(name)
+
+    def record_timeout(self) -> None:
+        self._timeouts.inc()
+
+    @property
+    def timeouts(self) -> int:
+        return self._timeouts.value
+
+    def snapshot(self) -> dict:
+        return {"checkout_wait_seconds": self.wait_seconds.snapshot(), "checkout_timeouts": self.timeouts}
+
+
+_pool_metrics: Dict[str, PoolMetrics] = {}
+_pool_metrics_lock = threading.Lock()
+
+def pool_metrics(name: str) -> PoolMetrics:
+    """Returns the metrics of the named pool, created on first use. Survives engine.dispose()."""
+    metrics = _pool_metrics.get(name)
+    if metrics is None:
+        with _pool_metrics_lock:
+            metrics = _pool_metrics.setdefault(name, PoolMetrics(name))
+    return metrics
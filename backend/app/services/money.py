@@ -0,0 +1,70 @@
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+from typing import Union
+
+# Fixed-point money for the trade engine, valuation and analytics: amounts are plain ints of
+# micro-units (10**-6 of a currency unit), so adding, comparing and multiplying by a quantity are
+# exact int operations, and amounts can be kept in array("q") / int64 columns for batch work.
+# Decimal stays the type at the edges (ORM columns, pydantic models, the bus); convert once on the
+# way in and once on the way out.
+#
+# Rounding happens only where these functions say so:
+# - to_micros rounds half-even to the micro-unit, or to `places` when asked (prices are taken to the
+#   cent half-up, as a NUMERIC(12, 2) column stores them).
+# - divide/divide_to round the exact quotient once, to an integer or straight to `places` (never to
+#   micro-units first, which could round twice).
+# - from_micros quantizes half-even by default, as Decimal.quantize does in the default context, so
+#   responses read the same as when they were computed with Decimals.
+# No ORM or FastAPI imports here, as in trade_rules.
+
+MICRO_PLACES = 6
+MICROS = 10 ** MICRO_PLACES # Micro-units per currency unit
+MONEY_PLACES = 2 # Scale of the money columns
+CENT = 10 ** (MICRO_PLACES - MONEY_PLACES) # Micro-units per cent
+
+_ROUNDINGS = (ROUND_HALF_UP, ROUND_HALF_EVEN)
+
+Amount = Union[Decimal, int, str, float]
+
+
+def to_micros(value: Amount, places: int = MICRO_PLACES, rounding: str = ROUND_HALF_EVEN) -> int:
+    """
+    A Decimal (or int, str, float) amount in micro-units, rounded to `places` decimals with `rounding`.
+    Floats are read by their shortest repr, like Decimal(str(value)) elsewhere.
+    """
+    if type(value) is int:
+        return value * MICROS
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int(value.scaleb(places).to_integral_value(rounding)) * 10 ** (MICRO_PLACES - places)
+
+
+def from_micros(micros: int, places: int = MONEY_PLACES, rounding: str = ROUND_HALF_EVEN) -> Decimal:
+    """A micro-unit amount as a Decimal with `places` decimals (Decimal("12.30") at the default scale)."""
+    return Decimal(divide(micros, 10 ** (MICRO_PLACES - places), rounding)).scaleb(-places)
+
+
+def divide(numerator: int, denominator: int, rounding: str = ROUND_HALF_UP) -> int:
+    """numerator / denominator (denominator > 0) rounded to an integer, ties by `rounding`."""
+    quotient, remainder = divmod(numerator, denominator) # Floored: 0 <= remainder < denominator
+    twice = 2 * remainder
+    if twice > denominator:
+        return quotient + 1
+    if twice < denominator:
+        return quotient
+    if rounding == ROUND_HALF_UP: # Away from zero
+        return quotient + 1 if numerator > 0 else quotient
+    if rounding == ROUND_HALF_EVEN:
+        return quotient + (quotient & 1)
+    raise ValueError(f"Unsupported rounding {rounding!r}; use one of {_ROUNDINGS}")
+
+
+def divide_to(numerator: int, denominator: int, places: int = MONEY_PLACES, rounding: str = ROUND_HALF_UP) -> int:
+    """numerator / denominator (micro-units, denominator > 0) in micro-units rounded to `places` decimals."""
+    step = 10 ** (MICRO_PLACES - places)
+    return divide(numerator, denominator * step, rounding) * step
+
+
+def percent(part: int, whole: int, places: int = 4) -> Decimal:
+    """part / whole * 100 as a Decimal with `places` decimals, half-even (whole > 0)."""
+    return Decimal(divide(part * 100 * 10 ** places, whole, ROUND_HALF_EVEN)).scaleb(-places)
+
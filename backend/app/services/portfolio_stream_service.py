@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services import money
+from app.services.invalidation_service import invalidation_bus
+from app.services.leaderboard_service import STARTING_CASH_MICROS
+from app.services.metrics_service import REGISTRY, gauge_lines
+from app.services.price_stream_service import PriceSubscription, call_on_loop, price_hub
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_STREAM_MESSAGES = REGISTRY.counter(
+    "portfolio_stream_messages_total",
+    "Messages sent to portfolio stream clients, by type (snapshot or patch).",
+    ("type",),
+)
+_SNAPSHOTS = PORTFOLIO_STREAM_MESSAGES.labels("snapshot")
+_PATCHES = PORTFOLIO_STREAM_MESSAGES.labels("patch")
+
+
+def _money(micros: int) -> str:
+    return str(money.from_micros(micros))
+
+
+def merge_patch(old: dict, new: dict) -> dict:
+    """
+    The JSON Merge Patch (RFC 7396) turning `old` into `new`: changed and added keys with their new
+    values, nested objects as patches of their own, and null for removed keys. {} if nothing changed.
+    """
+    patch = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = merge_patch(previous, value)
+            if nested:
+                patch[key] = nested
+        elif key not in old or value != previous:
+            patch[key] = value
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    return patch
+
+
+class _PortfolioView:
+    """
+    Live state of one streamed portfolio, shared by all its subscriptions.
+    Rendered lazily (once per change, however many clients read it) and the patch from the previous
+    rendering is kept, so clients that keep up share one patch as well. Money in integer micro-units.
+    """
+
+    __slots__ = ("portfolio_id", "cash_balance", "holdings", "loaded", "subscriptions", "_pending", "_rendered", "_patch")
+
+    def __init__(self, portfolio_id: int):
+        self.portfolio_id = portfolio_id
+        self.cash_balance = 0
+        self.holdings: Dict[str, Tuple[int, int]] = {} # ticker -> (quantity, average_buy_price)
+        self.loaded = False
+        self.subscriptions: Set["PortfolioSubscription"] = set()
+        self._pending: List[Tuple[Decimal, str, int, Optional[Decimal]]] = [] # Trades committed while loading
+        self._rendered: Optional[dict] = None
+        self._patch: Optional[Tuple[dict, dict, dict]] = None # (from, to, patch)
+
+    def render(self, prices: Dict[str, int]) -> dict:
+        if self._rendered is None:
+            holdings = {}
+            market_value = cost_basis = 0
+            for ticker, (quantity, average_buy_price) in sorted(self.holdings.items()):
+                price = prices.get(ticker, average_buy_price) # Valued at cost until priced, as on the leaderboard
+                value = quantity * price
+                market_value += value
+                cost_basis += quantity * average_buy_price
+                holdings[ticker] = {
+                    "quantity": quantity,
+                    "average_buy_price": _money(average_buy_price),
+                    "price": _money(price),
+                    "market_value": _money(value),
+                    "unrealized_pnl": _money(value - quantity * average_buy_price),
+                }
+            total_value = self.cash_balance + market_value
+            self._rendered = {
+                "cash_balance": _money(self.cash_balance),
+                "market_value": _money(market_value),
+                "total_value": _money(total_value),
+                "unrealized_pnl": _money(market_value - cost_basis),
+                "return_pct": str(money.percent(total_value - STARTING_CASH_MICROS, STARTING_CASH_MICROS)),
+                "holdings": holdings,
+            }
+        return self._rendered
+
+    def patch(self, sent: dict, current: dict) -> dict:
+        if self._patch is None or self._patch[0] is not sent or self._patch[1] is not current:
+            self._patch = (sent, current, merge_patch(sent, current))
+        return self._patch[2]
+
+    def changed(self) -> None:
+        self._rendered = None
+        for subscription in self.subscriptions:
+            subscription._ready.set()
+
+
+class PortfolioSubscription:
+    """
+    One client streaming one portfolio. The first message is a snapshot; after that each message is a
+    merge patch from what this client last received to the current state, so a slow client gets one
+    patch covering everything it missed instead of a queue of them. Used from the hub's event loop only.
+    """
+
+    __slots__ = ("hub", "view", "closed", "_sent", "_ready")
+
+    def __init__(self, hub: "PortfolioStreamHub", view: _PortfolioView):
+        self.hub = hub
+        self.view = view
+        self.closed = False
+        self._sent: Optional[dict] = None
+        self._ready = asyncio.Event()
+        if view.loaded:
+            self._ready.set()
+
+    async def next_message(self, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Waits for a change and returns the message to send as (type, JSON): first ("snapshot",
+        {"portfolio_id", ...state}), then ("patch", {...changes}). Returns None after `timeout` seconds
+        without changes (time for a heartbeat) and once closed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), None if deadline is None else max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                return None
+            self._ready.clear()
+            if self.closed:
+                return None
+            current = self.view.render(self.hub._prices)
+            sent, self._sent = self._sent, current
+            if sent is None:
+                _SNAPSHOTS.inc()
+                return "snapshot", json.dumps({"portfolio_id": self.view.portfolio_id, **current})
+            patch = self.view.patch(sent, current)
+            if patch: # Otherwise nothing visible changed (e.g. a price move below a cent)
+                _PATCHES.inc()
+                return "patch", json.dumps(patch)
+
+    def close(self) -> None:
+        self.hub.close(self)
+
+
+class PortfolioStreamHub:
+    """
+    Live valuation of the portfolios clients are streaming (see GET /portfolios/{id}/stream).
+
+    Each streamed portfolio has one view (cash and holdings), kept current by the trade hooks; the hub
+    indexes the views by the tickers they hold, so a price update revalues only the portfolios holding
+    that ticker. Prices come from the price stream hub, through one subscription covering every ticker
+    held by a streamed portfolio (which also keeps those tickers refreshed). Per process, as price_hub.
+    """
+
+    def __init__(self):
+        self._views: Dict[int, _PortfolioView] = {}
+        self._by_ticker: Dict[str, Set[int]] = {} # ticker -> streamed portfolio_ids holding it
+        self._prices: Dict[str, int] = {} # Micro-units
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._feed: Optional[PriceSubscription] = None
+        self._pump: Optional[asyncio.Task] = None
+
+    # --- Subscriptions (event loop only) ---
+
+    def open(self, portfolio_id: int) -> PortfolioSubscription:
+        """
+        Subscribes to a portfolio. Until its view is loaded (see `load`), trades committed for it are kept
+        and replayed afterwards, so the caller can read the snapshot from the database after opening.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._views:
+                raise RuntimeError("The portfolio stream hub is already serving another event loop")
+            self._loop = loop
+        if self._feed is None:
+            self._feed = price_hub.open()
+            self._pump = loop.create_task(self._pump_prices(self._feed))
+        view = self._views.get(portfolio_id)
+        if view is None:
+            view = self._views[portfolio_id] = _PortfolioView(portfolio_id)
+        subscription = PortfolioSubscription(self, view)
+        view.subscriptions.add(subscription)
+        return subscription
+
+    def load(
+        self,
+        portfolio_id: int,
+        cash_balance: Decimal,
+        holdings: Iterable[Tuple[str, int, Decimal]],
+        prices: Dict[str, Decimal],
+    ) -> None:
+        """
+        Fills a view from the database: holdings as (ticker_symbol, quantity, average_buy_price) and
+        prices for them. A no-op if the view is already loaded (it has been live since).
+        """
+        view = self._views.get(portfolio_id)
+        if view is None or view.loaded:
+            return
+        for ticker, price in prices.items():
+            self._prices.setdefault(ticker.upper(), money.to_micros(price)) # The feed may already have a newer one
+        view.cash_balance = money.to_micros(cash_balance)
+        for ticker_symbol, quantity, average_buy_price in holdings:
+            if quantity > 0:
+                self._set_holding(view, ticker_symbol.upper(), quantity, money.to_micros(average_buy_price))
+        view.loaded = True
+        pending, view._pending = view._pending, []
+        for trade in pending:
+            self._apply_trade(view, *trade) # Post-commit states, so replaying one already in the snapshot is harmless
+        view.changed()
+
+    def close(self, subscription: PortfolioSubscription) -> None:
+        subscription.closed = True
+        subscription._ready.set()
+        view = subscription.view
+        view.subscriptions.discard(subscription)
+        if view.subscriptions or self._views.get(view.portfolio_id) is not view:
+            return
+        del self._views[view.portfolio_id]
+        for ticker in list(view.holdings):
+            self._drop_ticker(view.portfolio_id, ticker)
+        if not self._views and self._feed is not None:
+            self._feed.close() # Ends the pump
+            self._feed = self._pump = None
+
+    # --- Hooks (any thread) ---
+
+    def on_trade_committed(
+        self,
+        portfolio_id: int,
+        cash_balance: Decimal,
+        ticker_symbol: str,
+        quantity: int,
+        average_buy_price: Optional[Decimal],
+    ) -> None:
+        """Same post-commit state as LeaderboardService.on_trade_committed."""
+        if self._loop is not None:
+            call_on_loop(self._loop, self._on_trade, portfolio_id, cash_balance, ticker_symbol, quantity, average_buy_price)
+
+    def on_portfolio_removed(self, portfolio_id: int) -> None:
+        """Ends the streams of a deleted portfolio."""
+        if self._loop is not None:
+            call_on_loop(self._loop, self._on_removed, portfolio_id)
+
+    def end_all(self) -> None:
+        """Ends every stream, e.g. when trades may have been missed; clients reconnect for a fresh snapshot."""
+        if self._loop is not None:
+            call_on_loop(self._loop, self._end_all)
+
+    # --- Internals ---
+
+    def _on_trade(self, portfolio_id: int, *trade) -> None:
+        view = self._views.get(portfolio_id)
+        if view is None:
+            return # Nobody streams it
+        if not view.loaded:
+            view._pending.append(trade)
+            return
+        self._apply_trade(view, *trade)
+        view.changed()
+
+    def _apply_trade(
+        self, view: _PortfolioView, cash_balance: Decimal, ticker_symbol: str, quantity: int, average_buy_price: Optional[Decimal]
+    ) -> None:
+        view.cash_balance = money.to_micros(cash_balance)
+        ticker = ticker_symbol.upper()
+        if quantity > 0:
+            avg_price = money.to_micros(average_buy_price) if average_buy_price is not None else 0
+            self._set_holding(view, ticker, quantity, avg_price)
+        elif view.holdings.pop(ticker, None) is not None:
+            self._drop_ticker(view.portfolio_id, ticker)
+
+    def _on_removed(self, portfolio_id: int) -> None:
+        view = self._views.get(portfolio_id)
+        if view is not None:
+            for subscription in list(view.subscriptions):
+                subscription.close()
+
+    def _end_all(self) -> None:
+        for view in list(self._views.values()):
+            for subscription in list(view.subscriptions):
+                subscription.close()
+
+    def _set_holding(self, view: _PortfolioView, ticker: str, quantity: int, average_buy_price: int) -> None:
+        view.holdings[ticker] = (quantity, average_buy_price)
+        portfolio_ids = self._by_ticker.get(ticker)
+        if portfolio_ids is None:
+            portfolio_ids = self._by_ticker[ticker] = set()
+            self._feed.subscribe([ticker]) # Gets the latest price right away if the price hub has one
+        portfolio_ids.add(view.portfolio_id)
+
+    def _drop_ticker(self, portfolio_id: int, ticker: str) -> None:
+        portfolio_ids = self._by_ticker.get(ticker)
+        if portfolio_ids is None:
+            return
+        portfolio_ids.discard(portfolio_id)
+        if not portfolio_ids:
+            del self._by_ticker[ticker]
+            self._prices.pop(ticker, None)
+            self._feed.unsubscribe([ticker])
+
+    def _on_price(self, ticker: str, price: Decimal) -> None:
+        portfolio_ids = self._by_ticker.get(ticker)
+        if portfolio_ids is None:
+            return
+        price = money.to_micros(price)
+        if self._prices.get(ticker) == price:
+            return
+        self._prices[ticker] = price
+        for portfolio_id in portfolio_ids: # Only the portfolios holding it
+            self._views[portfolio_id].changed()
+
+    async def _pump_prices(self, feed: PriceSubscription) -> None:
+        while not feed.closed:
+            for update in await feed.next_updates():
+                self._on_price(update.ticker_symbol, update.price)
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": sum(len(view.subscriptions) for view in self._views.values()),
+            "portfolios": len(self._views),
+            "tickers": len(self._by_ticker),
+        }
+
+    def reset(self) -> None:
+        self._end_all()
+        self._prices.clear()
+        self._loop = None
+
+
+portfolio_hub = PortfolioStreamHub()
+
+invalidation_bus.register("trade", portfolio_hub.on_trade_committed)
+invalidation_bus.register("portfolio_removed", portfolio_hub.on_portfolio_removed)
+invalidation_bus.register_resync(portfolio_hub.end_all)
+
+
+def _stream_gauges():
+    stats = portfolio_hub.stats()
+    yield from gauge_lines("portfolio_stream_subscriptions", "Open portfolio stream connections.", [({}, stats["subscriptions"])])
+    yield from gauge_lines("portfolio_stream_portfolios", "Portfolios with at least one stream open.", [({}, stats["portfolios"])])
+
+REGISTRY.add_collector(_stream_gauges)
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app.config import settings
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import REGISTRY, gauge_lines
+
+logger = logging.getLogger(__name__)
+
+PRICE_STREAM_UPDATES = REGISTRY.counter(
+    "price_stream_updates_total",
+    "Price updates handed to stream subscribers (delivered), or replaced by a newer one before delivery (conflated).",
+    ("result",),
+)
+_DELIVERED = PRICE_STREAM_UPDATES.labels("delivered")
+_CONFLATED = PRICE_STREAM_UPDATES.labels("conflated")
+
+
+def call_on_loop(loop: asyncio.AbstractEventLoop, callback: Callable[..., None], *args: Any) -> None:
+    """
+    Runs `callback(*args)` on `loop`: right away when called from it, otherwise scheduled thread-safely
+    (e.g. from sync routes and crud running in the threadpool). Does nothing once the loop is closed.
+    """
+    if loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        callback(*args)
+    else:
+        loop.call_soon_threadsafe(callback, *args)
+
+
+class PriceUpdate:
+    """One recorded price, encoded once for every subscriber and transport."""
+
+    __slots__ = ("ticker_symbol", "price", "source", "timestamp", "json", "sse")
+
+    def __init__(self, ticker_symbol: str, price: Decimal, source: str, timestamp: Optional[datetime] = None):
+        self.ticker_symbol = ticker_symbol
+        self.price = price
+        self.source = source
+        self.timestamp = timestamp or datetime.now(timezone.utc)
+        self.json = json.dumps({
+            "type": "price",
+            "ticker_symbol": ticker_symbol,
+            "price": str(price), # A string, as in the JSON API
+            "source": source,
+            "timestamp": self.timestamp.isoformat(),
+        })
+        self.sse = f"event: price\ndata: {self.json}\n\n".encode()
+
+
+class PriceSubscription:
+    """
+    One client's subscription: its tickers and, per ticker, the latest update it has not received yet.
+    A newer price for a ticker replaces the pending one (conflation), so a slow client holds at most one
+    update per ticker and only ever receives the latest price. Used from the hub's event loop only.
+    """
+
+    __slots__ = ("hub", "tickers", "closed", "_pending", "_ready")
+
+    def __init__(self, hub: "PriceStreamHub"):
+        self.hub = hub
+        self.tickers: Set[str] = set()
+        self.closed = False
+        self._pending: Dict[str, PriceUpdate] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, update: PriceUpdate) -> None:
+        if update.ticker_symbol in self._pending:
+            _CONFLATED.inc()
+        self._pending[update.ticker_symbol] = update
+        self._ready.set()
+
+    async def next_updates(self, timeout: Optional[float] = None) -> List[PriceUpdate]:
+        """
+        Waits until there is something to send and returns it (the latest update per ticker).
+        Returns [] after `timeout` seconds without updates (time for a heartbeat) and once closed.
+        """
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        if self.closed:
+            return []
+        pending, self._pending = self._pending, {}
+        _DELIVERED.inc(len(pending))
+        return list(pending.values())
+
+    def subscribe(self, tickers: Iterable[str]) -> None:
+        self.hub.subscribe(self, tickers)
+
+    def unsubscribe(self, tickers: Iterable[str]) -> None:
+        self.hub.unsubscribe(self, tickers)
+
+    def close(self) -> None:
+        """Leaves the hub and wakes a pending next_updates (which then returns [])."""
+        self.hub.close(self)
+
+
+class PriceStreamHub:
+    """
+    In-process fan-out of recorded prices to streaming clients (see the /marketdata/stream routes).
+
+    Subscriptions are indexed by ticker, so a price is encoded once and offered only to the clients
+    subscribed to that ticker; offering is a dict assignment per subscriber and never waits for a client.
+    market_data_service publishes every price it records (i.e. fetches from Finnhub), from the event loop
+    or from a threadpool thread. While anyone is subscribed, a refresher re-prices the subscribed tickers
+    every PRICE_STREAM_REFRESH_SECONDS through the usual cache, so the streams keep moving without
+    pollers (one Finnhub request per expired ticker, however many clients watch it).
+    The hub is per process: a price recorded by one worker reaches that worker's subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[PriceSubscription]] = {}
+        self._subscriptions: Set[PriceSubscription] = set()
+        self._latest: Dict[str, PriceUpdate] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    # --- Subscriptions (event loop only) ---
+
+    def open(self) -> PriceSubscription:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._subscriptions:
+                raise RuntimeError("The price stream hub is already serving another event loop")
+            self._loop = loop
+        subscription = PriceSubscription(self)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def subscribe(self, subscription: PriceSubscription, tickers: Iterable[str]) -> None:
+        """Adds tickers; those with a known price get it right away."""
+        for ticker in tickers:
+            if ticker in subscription.tickers:
+                continue
+            subscription.tickers.add(ticker)
+            self._subscribers.setdefault(ticker, set()).add(subscription)
+            latest = self._latest.get(ticker)
+            if latest is not None:
+                subscription.offer(latest)
+        self._ensure_refresher()
+
+    def unsubscribe(self, subscription: PriceSubscription, tickers: Iterable[str]) -> None:
+        for ticker in tickers:
+            subscription.tickers.discard(ticker)
+            subscribers = self._subscribers.get(ticker)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[ticker]
+
+    def close(self, subscription: PriceSubscription) -> None:
+        self.unsubscribe(subscription, list(subscription.tickers))
+        self._subscriptions.discard(subscription)
+        subscription.closed = True
+        subscription._ready.set()
+        if not self._subscriptions and self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    def latest(self, ticker_symbol: str) -> Optional[PriceUpdate]:
+        return self._latest.get(ticker_symbol)
+
+    # --- Publishing (any thread) ---
+
+    def publish(self, ticker_symbol: str, price: Decimal, source: str = "realtime_finnhub") -> None:
+        if self._loop is None:
+            return # Nobody has ever subscribed in this process
+        call_on_loop(self._loop, self._fan_out, PriceUpdate(ticker_symbol.upper(), price, source))
+
+    def _fan_out(self, update: PriceUpdate) -> None:
+        self._latest[update.ticker_symbol] = update
+        for subscription in self._subscribers.get(update.ticker_symbol, ()):
+            subscription.offer(update)
+
+    # --- Refresher ---
+
+    def _ensure_refresher(self) -> None:
+        interval = settings.PRICE_STREAM_REFRESH_SECONDS
+        if interval > 0 and self._refresher is None and self._subscribers:
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop(interval))
+
+    async def _refresh_loop(self, interval: float) -> None:
+        from app import database
+        from app.services import market_data_service
+
+        while True:
+            await asyncio.sleep(interval)
+            tickers = list(self._subscribers)
+            if not tickers:
+                continue
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    await market_data_service.get_prices_for_tickers_async(db, tickers)
+            except Exception:
+                # Cancelled by close() mid-refresh (the session close may report it as a database error)
+                if asyncio.current_task().cancelling():
+                    raise asyncio.CancelledError
+                logger.exception(f"Refreshing {len(tickers)} streamed tickers failed")
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self._subscriptions),
+            "tickers": len(self._subscribers),
+            "ticker_subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+        }
+
+    def reset(self) -> None:
+        for subscription in list(self._subscriptions):
+            self.close(subscription)
+        self._latest.clear()
+        self._loop = None
+
+
+price_hub = PriceStreamHub()
+
+invalidation_bus.register("price", lambda ticker_symbol, price: price_hub.publish(ticker_symbol, Decimal(price)))
+
+
+def _stream_gauges():
+    stats = price_hub.stats()
+    yield from gauge_lines("price_stream_subscriptions", "Open price stream connections.", [({}, stats["subscriptions"])])
+    yield from gauge_lines("price_stream_tickers", "Tickers with at least one stream subscriber.", [({}, stats["tickers"])])
+
+REGISTRY.add_collector(_stream_gauges)
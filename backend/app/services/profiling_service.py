@@ -0,0 +1,249 @@
+import cProfile
+import hashlib
+import hmac
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.profiling_models import Hotspot, ProfileDetail, ProfileSummary, ProfilingState
+
+HOTSPOT_LIMIT = 30
+MAX_STACK_DEPTH = 64
+MIN_STACK_SECONDS = 1e-6 # Stacks below a microsecond are dropped from the collapsed output
+
+# --- Signed profiling requests ---
+# A token lets one client profile requests to one path until it expires, without admin access:
+# X-Profile-Request: <expires unix time>.<hex HMAC-SHA256 of "<expires>:<path>">
+
+def _signature(path: str, expires_at: int, key: str) -> str:
+    return hmac.new(key.encode(), f"{expires_at}:{path}".encode(), hashlib.sha256).hexdigest()
+
+def sign_profile_request(path: str, expires_at: int, key: Optional[str] = None) -> str:
+    key = key or settings.PROFILING_SIGNING_KEY
+    if not key:
+        raise ValueError("PROFILING_SIGNING_KEY is not set")
+    return f"{expires_at}.{_signature(path, expires_at, key)}"
+
+def verify_profile_request(header_value: str, path: str, key: Optional[str] = None, now: Optional[float] = None) -> bool:
+    key = key or settings.PROFILING_SIGNING_KEY
+    if not key or not header_value:
+        return False
+    expires_text, _, signature = header_value.partition(".")
+    try:
+        expires_at = int(expires_text)
+    except ValueError:
+        return False
+    if expires_at < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(signature, _signature(path, expires_at, key))
+
+# --- Turning a cProfile run into hotspots and collapsed stacks ---
+
+def _label(func: Tuple[str, int, str]) -> str:
+    filename, lineno, name = func
+    if filename == "~": # Built-ins: ('~', 0, "<built-in method time.sleep>")
+        return name.replace(";", ",")
+    parts = filename.replace("\\", "/").split("/")
+    if "site-packages" in parts:
+        parts = parts[parts.index("site-packages") + 1:]
+    elif "backend" in parts:
+        parts = parts[parts.index("backend") + 1:]
+    else:
+        parts = parts[-2:]
+    return f"{name} ({'/'.join(parts)}:{lineno})".replace(";", ",")
+
+def hotspots(stats: pstats.Stats, limit: int = HOTSPOT_LIMIT) -> List[Hotspot]:
+    """Functions with the most own time."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        Hotspot(function=_label(func), calls=nc, own_seconds=round(tt, 6), cumulative_seconds=round(ct, 6))
+        for func, (cc, nc, tt, ct, callers) in rows
+    ]
+
+def collapsed_stacks(stats: pstats.Stats) -> str:
+    """
+    Flamegraph input in the collapsed format ("root;caller;callee <microseconds>" per line), accepted by
+    flamegraph.pl, speedscope and similar tools.
+
+    cProfile records caller/callee pairs, not full stacks, so stacks are reconstructed from the call
+    graph: a function's time along a path is its cumulative time from that caller, scaled down the path.
+    Recursion is cut at the first repeat, so the result is an approximation.
+    """
+    entries = stats.stats
+    children: Dict[tuple, List[Tuple[tuple, float]]] = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, caller_stats in callers.items():
+            children.setdefault(caller, []).append((func, caller_stats[3])) # Cumulative time of func from caller
+
+    totals: Dict[str, float] = {}
+
+    def walk(func: tuple, path: List[str], on_path: set, budget: float) -> None:
+        cc, nc, tt, ct, callers = entries[func]
+        if budget < MIN_STACK_SECONDS or ct <= 0:
+            return
+        fraction = min(1.0, budget / ct)
+        path.append(_label(func))
+        on_path.add(func)
+        stack = ";".join(path)
+        totals[stack] = totals.get(stack, 0.0) + tt * fraction
+        if len(path) < MAX_STACK_DEPTH:
+            for child, child_time in children.get(func, ()):
+                if child not in on_path and child in entries:
+                    walk(child, path, on_path, child_time * fraction)
+        on_path.discard(func)
+        path.pop()
+
+    roots = [func for func, (cc, nc, tt, ct, callers) in entries.items() if not callers]
+    for root in roots:
+        walk(root, [], set(), entries[root][3])
+
+    return "\n".join(
+        f"{stack} {round(seconds * 1_000_000)}"
+        for stack, seconds in sorted(totals.items())
+        if round(seconds * 1_000_000) > 0
+    ) + "\n"
+
+# --- Profiler state ---
+
+class _StoredProfile:
+    __slots__ = ("detail", "stats", "collapsed")
+
+    def __init__(self, detail: ProfileDetail, stats: pstats.Stats):
+        self.detail = detail
+        self.stats = stats # Raw; turned into collapsed stacks on first download (see get_collapsed)
+        self.collapsed: Optional[str] = None
+
+
+class ProfilingService:
+    """
+    Decides which requests to profile and keeps the most recent results.
+    cProfile profiles the event loop thread, so work of other requests interleaving at awaits shows
+    up too, and code run in the threadpool does not; only one request is profiled at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = threading.Lock() # Held while a request is being profiled
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.profile_next = 0
+        self.path_prefix = ""
+        self._profiles: "OrderedDict[str, _StoredProfile]" = OrderedDict()
+
+    # Controls
+
+    def configure(
+        self, sample_rate: Optional[float] = None, profile_next: Optional[int] = None, path_prefix: Optional[str] = None
+    ) -> ProfilingState:
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if profile_next is not None:
+                self.profile_next = profile_next
+            if path_prefix is not None:
+                self.path_prefix = path_prefix
+        return self.state()
+
+    def state(self) -> ProfilingState:
+        return ProfilingState(
+            sample_rate=self.sample_rate, profile_next=self.profile_next,
+            path_prefix=self.path_prefix, stored_profiles=len(self._profiles),
+        )
+
+    def choose_trigger(self, path: str, profile_header: Optional[str]) -> Optional[str]:
+        """Returns why this request should be profiled, or None. Cheap when nothing is requested."""
+        if profile_header is not None and verify_profile_request(profile_header, path):
+            return "signed_header"
+        if self.profile_next and path.startswith(self.path_prefix):
+            with self._lock:
+                if self.profile_next > 0:
+                    self.profile_next -= 1
+                    return "armed"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    # Profiling
+
+    def start(self, trigger: Optional[str] = None) -> Optional[cProfile.Profile]:
+        """
+        Starts a profiler, or returns None if another request is already being profiled. An "armed"
+        request that cannot be profiled gives its slot back, so the next matching request takes it.
+        """
+        if not self._active.acquire(blocking=False):
+            self._give_back(trigger)
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # Another profiling tool is active in this interpreter
+            self._active.release()
+            self._give_back(trigger)
+            return None
+        return profiler
+
+    def _give_back(self, trigger: Optional[str]) -> None:
+        if trigger == "armed":
+            with self._lock:
+                self.profile_next += 1
+
+    def finish(
+        self, profiler: cProfile.Profile, *, method: str, path: str, route: Optional[str],
+        status_code: int, duration: float, trigger: str,
+    ) -> str:
+        """Stops the profiler, stores the result and returns its profile_id."""
+        try:
+            profiler.disable()
+        finally:
+            self._active.release()
+        stats = pstats.Stats(profiler)
+        profile_id = uuid.uuid4().hex[:16]
+        detail = ProfileDetail(
+            profile_id=profile_id,
+            created_at=datetime.now(timezone.utc),
+            method=method,
+            path=path,
+            route=route,
+            status_code=status_code,
+            duration_ms=round(duration * 1000, 3),
+            trigger=trigger,
+            hotspots=hotspots(stats),
+        )
+        stored = _StoredProfile(detail, stats)
+        with self._lock:
+            self._profiles[profile_id] = stored
+            while len(self._profiles) > max(settings.PROFILING_MAX_STORED, 1):
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    # Results
+
+    def list_profiles(self) -> List[ProfileSummary]:
+        with self._lock:
+            stored = list(self._profiles.values())
+        return [ProfileSummary(**p.detail.model_dump(exclude={"hotspots"})) for p in reversed(stored)]
+
+    def get_profile(self, profile_id: str) -> Optional[ProfileDetail]:
+        stored = self._profiles.get(profile_id)
+        return stored.detail if stored else None
+
+    def get_collapsed(self, profile_id: str) -> Optional[str]:
+        """Collapsed stacks of a stored profile, built on first use (CPU-bound: call it off the event loop)."""
+        stored = self._profiles.get(profile_id)
+        if stored is None:
+            return None
+        if stored.collapsed is None:
+            stored.collapsed = collapsed_stacks(stored.stats)
+        return stored.collapsed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+profiler_service = ProfilingService()
@@ -0,0 +1,220 @@
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.crud import crud_holding, crud_trade
+from app.crud.aio import crud_holding as aio_crud_holding, crud_trade as aio_crud_trade
+from app.models.holding_models import DBHolding
+from app.models.portfolio_models import DBPortfolio
+from app.models.rebalance_models import (
+    BulkRebalanceItem, BulkRebalanceResult, RebalancePlan, RebalanceResult
+)
+from app.models.trade_models import Trade, TradeCreate, TradeTypeEnum
+from app.services import trade_rules
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import TRADE_COMMIT_DURATION, TRADE_FAILURES
+from app.services.market_data_service import get_prices_for_tickers, get_prices_for_tickers_async
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+BULK_CHUNK_SIZE = 500 # Portfolios loaded, planned and committed together in bulk mode
+
+# --- Planning (pure) ---
+
+def plan_rebalance(
+    cash_balance: Decimal,
+    holdings: Dict[str, int],
+    prices: Dict[str, Decimal],
+    target_weights: Dict[str, Decimal],
+) -> RebalancePlan:
+    """
+    Computes the smallest set of whole-share orders that moves a portfolio towards its target weights:
+    at most one order per ticker, sells first, then buys limited to the cash available after the sells.
+
+    holdings maps the stored ticker symbol to its quantity; prices and target_weights are keyed by
+    upper-cased ticker. Held tickers without a target weight are sold completely.
+    """
+    stored_symbol = {ticker.upper(): ticker for ticker in holdings}
+    held = {ticker.upper(): quantity for ticker, quantity in holdings.items()}
+    batch_prices = {ticker: Decimal(price).quantize(CENT, rounding=ROUND_HALF_UP) for ticker, price in prices.items()}
+
+    total_value = Decimal(cash_balance) + sum(
+        (quantity * batch_prices[ticker] for ticker, quantity in held.items()), Decimal("0")
+    )
+
+    sells: List[TradeCreate] = []
+    buys: List[Tuple[str, int, Decimal]] = []
+    cash_after = Decimal(cash_balance)
+    for ticker in sorted(set(held) | set(target_weights)):
+        price = batch_prices.get(ticker)
+        if not price or price <= 0:
+            logger.warning(f"No usable price for {ticker}; leaving it out of the rebalance.")
+            continue
+        target_quantity = int(target_weights.get(ticker, Decimal("0")) * total_value // price)
+        delta = target_quantity - held.get(ticker, 0)
+        if delta < 0:
+            sells.append(TradeCreate(
+                ticker_symbol=stored_symbol.get(ticker, ticker), trade_type=TradeTypeEnum.SELL, quantity=-delta, price=price
+            ))
+            cash_after += price * -delta
+        elif delta > 0:
+            buys.append((ticker, delta, price))
+
+    # Flooring every target keeps the buys within the post-sell cash at these prices;
+    # the explicit check only guards against rounding at the edges.
+    orders = list(sells)
+    for ticker, quantity, price in sorted(buys, key=lambda b: b[1] * b[2], reverse=True):
+        quantity = min(quantity, int(cash_after // price))
+        if quantity <= 0:
+            continue
+        orders.append(TradeCreate(
+            ticker_symbol=stored_symbol.get(ticker, ticker), trade_type=TradeTypeEnum.BUY, quantity=quantity, price=price
+        ))
+        cash_after -= price * quantity
+
+    return RebalancePlan(
+        total_value=total_value.quantize(CENT),
+        cash_before=Decimal(cash_balance).quantize(CENT),
+        cash_after=cash_after.quantize(CENT),
+        orders=orders,
+    )
+
+# --- Execution ---
+
+def rebalance_portfolio(
+    db: Session, db_portfolio: DBPortfolio, target_weights: Dict[str, Decimal], dry_run: bool = False
+) -> RebalanceResult:
+    """
+    Prices every involved ticker in one batch, plans the orders and, unless dry_run, executes them
+    as one atomic transaction through the trade logic.
+    """
+    db_holdings = crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[db_portfolio.portfolio_id])
+    holdings = {h.ticker_symbol: h.quantity for h in db_holdings}
+    prices = get_prices_for_tickers(db, list(holdings) + list(target_weights))
+    plan = plan_rebalance(db_portfolio.cash_balance, holdings, prices, target_weights)
+
+    trades: List[Trade] = []
+    if not dry_run and plan.orders:
+        db_trades = crud_trade.create_portfolio_trades_atomically(db, plan.orders, db_portfolio.portfolio_id)
+        trades = [Trade.model_validate(t) for t in db_trades]
+        logger.info(f"Rebalanced portfolio {db_portfolio.portfolio_id} with {len(trades)} trades.")
+
+    return RebalanceResult(**plan.model_dump(), portfolio_id=db_portfolio.portfolio_id, dry_run=dry_run, trades=trades)
+
+async def rebalance_portfolio_async(
+    db: AsyncSession, db_portfolio: DBPortfolio, target_weights: Dict[str, Decimal], dry_run: bool = False
+) -> RebalanceResult:
+    """
+    Async counterpart of rebalance_portfolio, for request handlers using an AsyncSession.
+    """
+    db_holdings = await aio_crud_holding.get_holdings_for_portfolios(db, portfolio_ids=[db_portfolio.portfolio_id])
+    holdings = {h.ticker_symbol: h.quantity for h in db_holdings}
+    prices = await get_prices_for_tickers_async(db, list(holdings) + list(target_weights))
+    plan = plan_rebalance(db_portfolio.cash_balance, holdings, prices, target_weights)
+
+    trades: List[Trade] = []
+    if not dry_run and plan.orders:
+        db_trades = await aio_crud_trade.create_portfolio_trades_atomically(db, plan.orders, db_portfolio.portfolio_id)
+        trades = [Trade.model_validate(t) for t in db_trades]
+        logger.info(f"Rebalanced portfolio {db_portfolio.portfolio_id} with {len(trades)} trades.")
+
+    return RebalanceResult(**plan.model_dump(), portfolio_id=db_portfolio.portfolio_id, dry_run=dry_run, trades=trades)
+
+
+def rebalance_portfolios_bulk(
+    db: Session,
+    user_id: int,
+    portfolio_ids: Sequence[int],
+    target_weights: Dict[str, Decimal],
+    dry_run: bool = False,
+    chunk_size: int = BULK_CHUNK_SIZE,
+) -> BulkRebalanceResult:
+    """
+    Rebalances many portfolios owned by user_id to the same target weights in one job.
+
+    Work is done in chunks: each chunk loads its portfolios and holdings with one query each,
+    prices only tickers not seen in earlier chunks, and commits once. Every portfolio runs in its own
+    SAVEPOINT, so one portfolio failing the trade rules does not undo the rest of the chunk.
+    """
+    unique_ids = list(dict.fromkeys(portfolio_ids))
+    prices: Dict[str, Decimal] = {}
+    results: List[BulkRebalanceItem] = []
+
+    for start in range(0, len(unique_ids), chunk_size):
+        chunk_ids = unique_ids[start:start + chunk_size]
+        db_portfolios = (
+            db.query(DBPortfolio)
+            .filter(DBPortfolio.portfolio_id.in_(chunk_ids), DBPortfolio.user_id == user_id)
+            .all()
+        )
+        portfolios_by_id = {p.portfolio_id: p for p in db_portfolios}
+        holdings_by_portfolio: Dict[int, Dict[str, DBHolding]] = {p.portfolio_id: {} for p in db_portfolios}
+        for h in crud_holding.get_holdings_for_portfolios(db, portfolio_ids=list(portfolios_by_id)):
+            holdings_by_portfolio[h.portfolio_id][h.ticker_symbol] = h
+
+        needed = {t.upper() for held in holdings_by_portfolio.values() for t in held} | set(target_weights)
+        missing = needed - prices.keys()
+        if missing:
+            prices.update(get_prices_for_tickers(db, missing))
+
+        committed_updates = [] # Leaderboard updates, applied once the chunk is committed
+        for portfolio_id in chunk_ids:
+            db_portfolio = portfolios_by_id.get(portfolio_id)
+            if db_portfolio is None:
+                results.append(BulkRebalanceItem(
+                    portfolio_id=portfolio_id, status="not_found", detail="Portfolio not found or not owned by user"
+                ))
+                continue
+
+            holdings_map = holdings_by_portfolio[portfolio_id]
+            plan = plan_rebalance(
+                db_portfolio.cash_balance, {t: h.quantity for t, h in holdings_map.items()}, prices, target_weights
+            )
+            if not plan.orders:
+                results.append(BulkRebalanceItem(portfolio_id=portfolio_id, status="unchanged"))
+                continue
+            if dry_run:
+                results.append(BulkRebalanceItem(portfolio_id=portfolio_id, status="planned", order_count=len(plan.orders)))
+                continue
+
+            savepoint = db.begin_nested()
+            try:
+                staged = [
+                    crud_trade.stage_portfolio_trade(db, db_portfolio, order, order.price, holdings_map)
+                    for order in plan.orders
+                ]
+                savepoint.commit()
+            except trade_rules.TradeRuleError as e:
+                savepoint.rollback()
+                TRADE_FAILURES.labels("bulk", "rule_violation").inc()
+                results.append(BulkRebalanceItem(portfolio_id=portfolio_id, status="failed", detail=e.detail))
+                continue
+
+            cash_balance = db_portfolio.cash_balance # Read before commit expires the instance
+            committed_updates.extend(
+                (portfolio_id, cash_balance, db_trade.ticker_symbol, quantity, average_price)
+                for db_trade, quantity, average_price in staged
+            )
+            results.append(BulkRebalanceItem(portfolio_id=portfolio_id, status="rebalanced", order_count=len(staged)))
+
+        if not dry_run:
+            commit_start = time.perf_counter()
+            db.commit()
+            TRADE_COMMIT_DURATION.labels("bulk").observe(time.perf_counter() - commit_start)
+            for portfolio_id, cash_balance, ticker_symbol, quantity, average_price in committed_updates:
+                invalidation_bus.publish("trade", portfolio_id, cash_balance, ticker_symbol, quantity, average_price)
+        logger.info(f"Bulk rebalance processed {min(start + chunk_size, len(unique_ids))}/{len(unique_ids)} portfolios.")
+
+    failed = sum(1 for r in results if r.status in ("failed", "not_found"))
+    return BulkRebalanceResult(
+        dry_run=dry_run,
+        requested=len(unique_ids),
+        succeeded=len(results) - failed,
+        failed=failed,
+        results=results,
+    )
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_right
+from typing import List, Optional, Set, Tuple
+
+from app.config import settings
+from app.crud.aio import crud_trade_event
+from app.crud.crud_trade_event import is_gap_marker
+from app.models.trade_event_models import DBTradeEvent, TradeEvent
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import REGISTRY, gauge_lines
+from app.services.price_stream_service import call_on_loop
+
+logger = logging.getLogger(__name__)
+
+TRADE_EVENTS_DELIVERED = REGISTRY.counter(
+    "trade_events_delivered_total",
+    "Trade events sent to stream consumers, by where they were read: the relay's memory (buffer) or the outbox table (table).",
+    ("source",),
+)
+_FROM_BUFFER = TRADE_EVENTS_DELIVERED.labels("buffer")
+_FROM_TABLE = TRADE_EVENTS_DELIVERED.labels("table")
+TRADE_EVENT_RELAY_READS = REGISTRY.counter(
+    "trade_event_relay_reads_total", "Outbox queries made by the relay to pick up new trade events (any number of consumers)."
+)
+TRADE_EVENT_GAPS_FILLED = REGISTRY.counter(
+    "trade_event_gaps_filled_total",
+    "Outbox offsets filled with a gap marker after waiting for them (ids of rolled-back transactions).",
+)
+
+
+def encode_trade_event(db_event: DBTradeEvent) -> bytes:
+    """One server-sent event, with the offset as its id so clients resume with Last-Event-ID."""
+    data = TradeEvent.model_validate(db_event).model_dump_json()
+    return f"id: {db_event.event_id}\nevent: trade\ndata: {data}\n\n".encode()
+
+
+class OutboxReader:
+    """
+    Reads committed trade_events rows in offset order, from a position (the last offset read) onwards.
+
+    Offsets are sequence values, and a transaction may commit after one that took a later offset. So
+    the reader hands out rows in offset order only, holding back at a missing offset. Once the offset
+    has been missing for TRADE_EVENT_GAP_SECONDS, the reader claims it with a gap marker
+    (crud_trade_event.gap_marker): the insert waits for a transaction still holding the offset and fails
+    if that transaction commits, whose event is then read as usual. Every offset thus ends up with its
+    committed event or a marker, the same for every reader (and for consumers paging the table);
+    markers move the position on but are never handed out.
+    """
+
+    __slots__ = ("position", "_gap")
+
+    def __init__(self, position: int = 0):
+        self.position = position
+        self._gap: Optional[Tuple[int, float]] = None # (missing offset, first seen)
+
+    @property
+    def waiting(self) -> bool:
+        """True while held back at a missing offset (read again within TRADE_EVENT_GAP_SECONDS)."""
+        return self._gap is not None
+
+    async def read_batch(self, db, limit: int) -> Tuple[List[DBTradeEvent], bool]:
+        """The next events (from at most `limit` rows) and whether there may be more right away."""
+        rows = await crud_trade_event.get_trade_events(db, after=self.position, limit=limit)
+        accepted = []
+        expected = self.position + 1
+        next_offset = None
+        for row in rows:
+            if row.event_id != expected:
+                next_offset = row.event_id
+                break
+            if not is_gap_marker(row):
+                accepted.append(row)
+            expected = row.event_id + 1
+        self.position = expected - 1
+        if next_offset is None:
+            self._gap = None
+            return accepted, len(rows) == limit
+        if accepted or not self._gap_expired(expected):
+            return accepted, bool(accepted) # Rows read so far go out first: filling rolls back the session
+        for offset in range(expected, next_offset):
+            if await crud_trade_event.fill_trade_event_gap(db, offset):
+                TRADE_EVENT_GAPS_FILLED.labels().inc()
+        self._gap = None
+        return [], True # Read again: the filled offsets hold markers or their late events
+
+    def _gap_expired(self, missing: int) -> bool:
+        now = time.monotonic()
+        if self._gap is None or self._gap[0] != missing:
+            self._gap = (missing, now)
+        return now - self._gap[1] >= settings.TRADE_EVENT_GAP_SECONDS
+
+
+class TradeEventSubscription:
+    """One consumer of the trade event stream, with its own cursor (the last offset it received)."""
+
+    __slots__ = ("relay", "cursor", "closed", "_ready")
+
+    def __init__(self, relay: "TradeEventRelay", cursor: int):
+        self.relay = relay
+        self.cursor = cursor
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    async def next_batch(self, timeout: Optional[float] = None) -> Optional[List[bytes]]:
+        """
+        The encoded events after the cursor (at most TRADE_EVENT_BATCH_SIZE), in offset order, waiting for
+        new ones if the consumer is up to date. [] after `timeout` seconds without events; None once closed.
+        """
+        while not self.closed:
+            self._ready.clear() # Before looking, so an event relayed meanwhile still wakes the wait below
+            if self.cursor < self.relay.head:
+                self.cursor, events = await self.relay.read(self.cursor, settings.TRADE_EVENT_BATCH_SIZE)
+                if events:
+                    return events
+                continue
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return None
+
+    def close(self) -> None:
+        self.relay.close(self)
+
+
+class TradeEventRelay:
+    """
+    Streams the trade_events outbox to any number of consumers (see the /trade-events/stream route).
+
+    Trade writes stage an outbox row in the trade's transaction (crud_trade_event.stage_trade_event), so
+    the stream holds exactly the committed trades, in commit-safe offset order. One relay task per
+    process follows the outbox: woken by the "trade" event every worker publishes after a commit (see
+    invalidation_service; every TRADE_EVENT_POLL_SECONDS at worst), it reads the new rows in batches
+    with one primary-key range query, encodes each event once and keeps the latest
+    TRADE_EVENT_BUFFER_SIZE in memory. Consumers only move their own cursor: those at the head are
+    served from memory, those further back (resuming from an old offset) page through the table
+    themselves. The trades table is never polled.
+
+    The relay reads with an OutboxReader, so events are relayed in offset order even when transactions
+    commit out of order.
+    """
+
+    def __init__(self):
+        self.head = 0 # Last offset relayed
+        self._floor = 0 # Offsets up to here are read from the table; the buffer holds the ones after it
+        self._offsets: List[int] = []
+        self._events: List[bytes] = []
+        self._reader = OutboxReader()
+        self._subscriptions: Set[TradeEventSubscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sessions = None # async_sessionmaker for outbox reads; None means database.AsyncSessionLocal (the primary)
+
+    def _sessionmaker(self):
+        if self.sessions is not None:
+            return self.sessions
+        from app import database
+        return database.AsyncSessionLocal
+
+    # --- Subscriptions (event loop only) ---
+
+    async def open(self, after: Optional[int] = None) -> TradeEventSubscription:
+        """A consumer receiving the events after offset `after`, or only new ones if None."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._subscriptions:
+                raise RuntimeError("The trade event relay is already serving another event loop")
+            self._loop, self._wakeup, self._start_lock, self._task = loop, asyncio.Event(), asyncio.Lock(), None
+        async with self._start_lock:
+            if self._task is None:
+                async with self._sessionmaker()() as db:
+                    self.head = self._floor = await crud_trade_event.get_last_trade_event_id(db)
+                self._offsets, self._events, self._reader = [], [], OutboxReader(self.head)
+                self._task = loop.create_task(self._relay_loop())
+        subscription = TradeEventSubscription(self, self.head if after is None else after)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def close(self, subscription: TradeEventSubscription) -> None:
+        self._subscriptions.discard(subscription)
+        subscription.closed = True
+        subscription._ready.set()
+        if not self._subscriptions and self._task is not None:
+            self._task.cancel() # Restarted from the table's head by the next consumer
+            self._task = None
+
+    async def read(self, after: int, limit: int) -> Tuple[int, List[bytes]]:
+        """(new cursor, encoded events) for a consumer at offset `after`."""
+        if after >= self._floor:
+            start = bisect_right(self._offsets, after)
+            events = self._events[start:start + limit]
+            _FROM_BUFFER.inc(len(events))
+            return (self._offsets[start + len(events) - 1] if events else after), events
+        # Behind the buffer: a page from the table, up to where the buffer takes over
+        floor = self._floor
+        async with self._sessionmaker()() as db:
+            rows = await crud_trade_event.get_trade_events(db, after=after, limit=limit, up_to=floor)
+        events = [encode_trade_event(row) for row in rows if not is_gap_marker(row)]
+        _FROM_TABLE.inc(len(events))
+        return (rows[-1].event_id if len(rows) == limit else floor), events
+
+    # --- Relay ---
+
+    def notify(self) -> None:
+        """New events may have been committed (any thread)."""
+        if self._loop is not None and self._task is not None:
+            call_on_loop(self._loop, self._wakeup.set)
+
+    async def _relay_loop(self) -> None:
+        while True:
+            timeout = settings.TRADE_EVENT_POLL_SECONDS
+            if self._reader.waiting:
+                timeout = min(timeout, settings.TRADE_EVENT_GAP_SECONDS)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self._relay_batch():
+                    pass
+            except Exception:
+                # Cancelled by close() mid-batch: closing the session can turn the CancelledError into a
+                # database error, which must still end the task rather than leave a second relay polling
+                if asyncio.current_task().cancelling():
+                    raise asyncio.CancelledError
+                logger.exception("Relaying trade events failed")
+
+    async def _relay_batch(self) -> bool:
+        """Moves the head over the next batch of committed events; True if there may be more."""
+        async with self._sessionmaker()() as db:
+            accepted, more = await self._reader.read_batch(db, settings.TRADE_EVENT_BATCH_SIZE)
+        TRADE_EVENT_RELAY_READS.labels().inc()
+        if not accepted:
+            return more
+        self._offsets.extend(row.event_id for row in accepted)
+        self._events.extend(encode_trade_event(row) for row in accepted)
+        self.head = accepted[-1].event_id
+        if len(self._offsets) > settings.TRADE_EVENT_BUFFER_SIZE:
+            drop = len(self._offsets) - settings.TRADE_EVENT_BUFFER_SIZE // 2 # Trimmed in halves, not per batch
+            self._floor = self._offsets[drop - 1]
+            del self._offsets[:drop], self._events[:drop]
+        for subscription in self._subscriptions:
+            subscription._ready.set()
+        return more
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self._subscriptions),
+            "head": self.head,
+            "buffered": len(self._offsets),
+            "lagging": sum(1 for s in self._subscriptions if s.cursor < self.head),
+        }
+
+    def reset(self) -> None:
+        for subscription in list(self._subscriptions):
+            self.close(subscription)
+        self._loop = None
+        self.sessions = None
+
+
+trade_event_relay = TradeEventRelay()
+
+# Every committed trade, in this worker or another, is published on the bus after its commit
+invalidation_bus.register("trade", lambda *args: trade_event_relay.notify())
+invalidation_bus.register_resync(trade_event_relay.notify) # Wake-ups may have been missed
+
+
+def _relay_gauges():
+    stats = trade_event_relay.stats()
+    yield from gauge_lines("trade_event_subscriptions", "Open trade event stream consumers.", [({}, stats["subscriptions"])])
+    yield from gauge_lines("trade_event_relay_head", "Last trade event offset relayed.", [({}, stats["head"])])
+    yield from gauge_lines(
+        "trade_event_consumers_lagging", "Consumers whose cursor is behind the relay's head.", [({}, stats["lagging"])]
+    )
+
+REGISTRY.add_collector(_relay_gauges)
@@ -0,0 +1,548 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process writer lock, run a single worker
+    fcntl = None
+
+from app.config import settings
+from app.models.trade_event_models import DBTradeEvent
+from app.services import money
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import REGISTRY, gauge_lines
+from app.services.price_stream_service import call_on_loop
+from app.services.trade_event_service import OutboxReader
+
+logger = logging.getLogger(__name__)
+
+TRADE_JOURNAL_RECORDS = REGISTRY.counter(
+    "trade_journal_records_total", "Trade records appended to the journal (writer) or applied to the position book (all workers).",
+    ("action",),
+)
+_APPENDED = TRADE_JOURNAL_RECORDS.labels("appended")
+_APPLIED = TRADE_JOURNAL_RECORDS.labels("applied")
+
+# --- Record format ---
+# Fixed-width little-endian records: offset (the trade_events id), trade_id, portfolio_id, timestamp (µs since
+# the epoch), price, average buy price and cash balance after the trade (in cents, as the DECIMAL(.., 2) columns
+# store them), quantity, position after the trade, ticker (NUL-padded), side (0 BUY, 1 SELL), padding, and a
+# CRC32 of everything before it, so a record torn by a crash is detected.
+RECORD = struct.Struct("<7q2i20sB7xI")
+RECORD_SIZE = RECORD.size
+_BODY_SIZE = RECORD_SIZE - 4 # What the CRC covers
+_CRC = struct.Struct("<I")
+_OFFSET = struct.Struct("<q")
+# Slot 0 of every segment is its header: magic, format version, record size, segment number
+HEADER = struct.Struct("<4sHHq")
+MAGIC = b"TRJ1"
+SNAPSHOT_MAGIC = b"TRS1"
+_SIDES = ("BUY", "SELL")
+
+
+def to_cents(value: Decimal) -> int:
+    return money.to_micros(value, money.MONEY_PLACES) // money.CENT
+
+
+def from_cents(cents: int) -> Decimal:
+    return money.from_micros(cents * money.CENT)
+
+
+class JournalRecord(NamedTuple):
+    offset: int
+    trade_id: int
+    portfolio_id: int
+    timestamp_us: int
+    price: int # Cents
+    average_buy_price: int # Cents
+    cash_balance: int # Cents
+    quantity: int
+    position_quantity: int
+    ticker_symbol: str
+    trade_type: str
+
+
+def encode_record(record: JournalRecord) -> bytes:
+    data = bytearray(RECORD.pack(
+        record.offset, record.trade_id, record.portfolio_id, record.timestamp_us, record.price,
+        record.average_buy_price, record.cash_balance, record.quantity, record.position_quantity,
+        record.ticker_symbol.encode(), _SIDES.index(record.trade_type), 0,
+    ))
+    _CRC.pack_into(data, _BODY_SIZE, zlib.crc32(data[:_BODY_SIZE]))
+    return bytes(data)
+
+
+def record_from_event(db_event: DBTradeEvent) -> JournalRecord:
+    created_at = db_event.created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None: # SQLite hands back naive UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return JournalRecord(
+        db_event.event_id, db_event.trade_id, db_event.portfolio_id, int(created_at.timestamp() * 1_000_000),
+        to_cents(db_event.price), to_cents(db_event.average_buy_price), to_cents(db_event.cash_balance),
+        db_event.quantity, db_event.position_quantity, db_event.ticker_symbol, db_event.trade_type,
+    )
+
+
+def _decode(buffer, position: int) -> Optional[JournalRecord]:
+    """The record at `position`, or None for an empty slot or a torn record."""
+    data = buffer[position:position + RECORD_SIZE]
+    *numbers, ticker, side, crc = RECORD.unpack(data)
+    if numbers[0] == 0 or crc != zlib.crc32(data[:_BODY_SIZE]):
+        return None
+    return JournalRecord(*numbers, ticker.rstrip(b"\0").decode(), _SIDES[side])
+
+
+# --- Journal ---
+
+class _Segment:
+    __slots__ = ("path", "number", "file", "map", "count")
+
+    def __init__(self, path: str, number: int, writable: bool):
+        self.path = path
+        self.number = number
+        self.file = open(path, "r+b" if writable else "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, record_size, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != 1 or record_size != RECORD_SIZE:
+            self.close()
+            raise ValueError(f"{path} is not a version 1 trade journal segment")
+        self.count = self._find_end()
+
+    @property
+    def capacity(self) -> int:
+        return len(self.map) // RECORD_SIZE - 1
+
+    def offset_at(self, index: int) -> int:
+        return _OFFSET.unpack_from(self.map, (index + 1) * RECORD_SIZE)[0]
+
+    def _find_end(self) -> int:
+        # Records are written front to back, so the filled slots are a prefix: binary search its end
+        low, high = 0, self.capacity
+        while low < high:
+            middle = (low + high) // 2
+            if self.offset_at(middle) != 0:
+                low = middle + 1
+            else:
+                high = middle
+        # A crash can leave the last record half written
+        while low > 0 and _decode(self.map, low * RECORD_SIZE) is None:
+            low -= 1
+        return low
+
+    def index_after(self, offset: int) -> int:
+        """Index of the first record with an offset above `offset` (offsets only grow)."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.offset_at(middle) <= offset:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+
+class TradeJournal:
+    """
+    Append-only binary journal of committed trades, in segments of fixed-width records.
+
+    Each segment is a file preallocated for TRADE_JOURNAL_SEGMENT_RECORDS records and memory-mapped, so
+    appending is a copy into the map and replay is a sequential scan of it (no per-record syscalls or
+    parsing beyond struct unpacking). Records are ordered by offset (the trade_events id). Opened for
+    writing by one process at a time (see TradeJournalService); readers may open it concurrently.
+    """
+
+    def __init__(self, directory: str, writable: bool = False, segment_records: Optional[int] = None):
+        self.directory = directory
+        self.writable = writable
+        self.segment_records = segment_records or settings.TRADE_JOURNAL_SEGMENT_RECORDS
+        os.makedirs(directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(directory) if name.startswith("segment-") and name.endswith(".journal"))
+        self._segments: List[_Segment] = [
+            # Only the last segment is ever appended to
+            _Segment(os.path.join(directory, name), int(name[len("segment-"):-len(".journal")]), writable and i == len(names) - 1)
+            for i, name in enumerate(names)
+        ]
+
+    @property
+    def head(self) -> int:
+        """Offset of the last record (0 when empty)."""
+        for segment in reversed(self._segments):
+            if segment.count:
+                return segment.offset_at(segment.count - 1)
+        return 0
+
+    @property
+    def record_count(self) -> int:
+        return sum(segment.count for segment in self._segments)
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    def append(self, records: Iterable[JournalRecord]) -> int:
+        """Appends records with offsets above the head (others are skipped); returns how many were written."""
+        if not self.writable:
+            raise RuntimeError("The trade journal was opened read-only")
+        head = self.head
+        written = 0
+        for record in records:
+            if record.offset <= head:
+                continue
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment.count == segment.capacity:
+                segment = self._new_segment()
+            position = (segment.count + 1) * RECORD_SIZE
+            segment.map[position:position + RECORD_SIZE] = encode_record(record)
+            segment.count += 1
+            head = record.offset
+            written += 1
+        return written
+
+    def _new_segment(self) -> _Segment:
+        if self._segments:
+            self._segments[-1].map.flush()
+        number = self._segments[-1].number + 1 if self._segments else 1
+        path = os.path.join(self.directory, f"segment-{number:08d}.journal")
+        with open(path, "wb") as file:
+            file.truncate((self.segment_records + 1) * RECORD_SIZE) # Sparse until written
+            file.write(HEADER.pack(MAGIC, 1, RECORD_SIZE, number))
+        segment = _Segment(path, number, writable=True)
+        self._segments.append(segment)
+        return segment
+
+    def flush(self) -> None:
+        """Makes what was appended durable (msync of the segment being written)."""
+        if self._segments:
+            self._segments[-1].map.flush()
+
+    def replay(self, after: int = 0) -> Iterator[JournalRecord]:
+        """The records with offsets above `after`, in order."""
+        crc32 = zlib.crc32
+        for segment in self._segments:
+            start = segment.index_after(after)
+            data = segment.map[(start + 1) * RECORD_SIZE:(segment.count + 1) * RECORD_SIZE] # One sequential copy
+            for position, (*numbers, ticker, side, crc) in zip(range(0, len(data), RECORD_SIZE), RECORD.iter_unpack(data)):
+                if crc != crc32(data[position:position + _BODY_SIZE]):
+                    return # Torn by a writer that crashed (or is still writing): the end of the journal
+                yield JournalRecord(*numbers, ticker.rstrip(b"\0").decode(), _SIDES[side])
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+
+
+# --- Derived state and snapshots ---
+
+class PositionBook:
+    """
+    Positions derived from the journal: per portfolio, its cash balance and per ticker (quantity,
+    average buy price), all in cents, as of `offset`. Snapshots of it bound the replay after a restart.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.portfolios: Dict[int, Tuple[int, Dict[str, Tuple[int, int]]]] = {}
+
+    def apply(self, record: JournalRecord) -> None:
+        if record.offset <= self.offset:
+            return
+        _, holdings = self.portfolios.get(record.portfolio_id, (0, {}))
+        if record.position_quantity > 0:
+            holdings[record.ticker_symbol] = (record.position_quantity, record.average_buy_price)
+        else:
+            holdings.pop(record.ticker_symbol, None)
+        self.portfolios[record.portfolio_id] = (record.cash_balance, holdings)
+        self.offset = record.offset
+
+    def holdings(self, portfolio_id: int) -> Dict[str, Tuple[int, Decimal]]:
+        """ticker -> (quantity, average_buy_price) for one portfolio."""
+        _, holdings = self.portfolios.get(portfolio_id, (0, {}))
+        return {ticker: (quantity, from_cents(average)) for ticker, (quantity, average) in holdings.items()}
+
+    # Snapshot layout: header, the distinct tickers, then per portfolio (id, cash, holding count) and the
+    # holdings of all portfolios in the same order as (ticker index, quantity, average), plus a CRC32.
+    _HEADER = struct.Struct("<4sHqIII")
+    _TICKER = struct.Struct("<20s")
+    _PORTFOLIO = struct.Struct("<qqI")
+    _HOLDING = struct.Struct("<Iqq")
+
+    def dump(self) -> bytes:
+        ticker_index: Dict[str, int] = {}
+        portfolios, holdings = [], []
+        for portfolio_id, (cash_balance, positions) in self.portfolios.items():
+            portfolios.append(self._PORTFOLIO.pack(portfolio_id, cash_balance, len(positions)))
+            for ticker, (quantity, average) in positions.items():
+                index = ticker_index.setdefault(ticker, len(ticker_index))
+                holdings.append(self._HOLDING.pack(index, quantity, average))
+        body = b"".join([
+            self._HEADER.pack(SNAPSHOT_MAGIC, 1, self.offset, len(ticker_index), len(portfolios), len(holdings)),
+            *(self._TICKER.pack(ticker.encode()) for ticker in ticker_index),
+            *portfolios,
+            *holdings,
+        ])
+        return body + _CRC.pack(zlib.crc32(body))
+
+    @classmethod
+    def load(cls, data: bytes) -> "PositionBook":
+        body, (crc,) = data[:-4], _CRC.unpack(data[-4:])
+        magic, version, offset, ticker_count, portfolio_count, holding_count = cls._HEADER.unpack_from(body)
+        if magic != SNAPSHOT_MAGIC or version != 1 or zlib.crc32(body) != crc:
+            raise ValueError("not a valid version 1 position snapshot")
+        book = cls()
+        book.offset = offset
+        position = cls._HEADER.size
+        end = position + ticker_count * cls._TICKER.size
+        tickers = [ticker.rstrip(b"\0").decode() for (ticker,) in cls._TICKER.iter_unpack(body[position:end])]
+        position, end = end, end + portfolio_count * cls._PORTFOLIO.size
+        portfolios = cls._PORTFOLIO.iter_unpack(body[position:end])
+        holdings = cls._HOLDING.iter_unpack(body[end:end + holding_count * cls._HOLDING.size])
+        for portfolio_id, cash_balance, count in portfolios:
+            book.portfolios[portfolio_id] = (
+                cash_balance, {tickers[index]: (quantity, average) for index, quantity, average in islice(holdings, count)}
+            )
+        return book
+
+
+def write_snapshot(directory: str, data: bytes, offset: int, keep: int = 2) -> str:
+    """Writes a snapshot atomically (temporary file, fsync, rename) and prunes all but the newest `keep`."""
+    path = os.path.join(directory, f"snapshot-{offset:020d}.snap")
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    snapshots = sorted(name for name in os.listdir(directory) if name.startswith("snapshot-") and name.endswith(".snap"))
+    for name in snapshots[:-keep]:
+        os.remove(os.path.join(directory, name))
+    return path
+
+
+def recover(journal: TradeJournal) -> Tuple[PositionBook, int, int]:
+    """
+    The position book from the newest valid snapshot plus the journal records after it, with the
+    snapshot's offset (0 without one) and the number of records replayed.
+    """
+    book = PositionBook()
+    snapshots = sorted(
+        (name for name in os.listdir(journal.directory) if name.startswith("snapshot-") and name.endswith(".snap")),
+        reverse=True,
+    )
+    for name in snapshots:
+        try:
+            with open(os.path.join(journal.directory, name), "rb") as file:
+                book = PositionBook.load(file.read())
+            break
+        except (OSError, ValueError, struct.error):
+            logger.warning(f"Ignoring unreadable trade journal snapshot {name}")
+    snapshot_offset = book.offset
+    replayed = 0
+    for record in journal.replay(after=book.offset):
+        book.apply(record)
+        replayed += 1
+    return book, snapshot_offset, replayed
+
+
+# --- Service ---
+
+class TradeJournalService:
+    """
+    Keeps the trade journal and the position book derived from it, in every worker that has
+    TRADE_JOURNAL_DIR set (a directory shared by the workers of one host).
+
+    At startup a worker recovers the book from the newest snapshot plus the journal records after it,
+    instead of re-reading trades or holdings. It then follows the trade_events outbox from there (woken
+    like the trade event relay, by the "trade" event published after every commit) and applies each new
+    trade to its book. One worker, the holder of the directory's lock, also appends the records to the
+    journal and writes a snapshot every TRADE_JOURNAL_SNAPSHOT_EVERY records; if it exits, another
+    worker takes the lock over on its next pass. The database stays the source of truth: the journal
+    is rebuilt from the outbox if deleted.
+    """
+
+    def __init__(self):
+        self.directory: Optional[str] = None
+        self.journal: Optional[TradeJournal] = None
+        self.book = PositionBook()
+        self.sessions = None # async_sessionmaker for outbox reads; None means database.AsyncSessionLocal
+        self._lock_file = None
+        self._reader: Optional[OutboxReader] = None
+        self._since_snapshot = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.recovery: dict = {}
+
+    @property
+    def writer(self) -> bool:
+        return self._lock_file is not None
+
+    def _sessionmaker(self):
+        if self.sessions is not None:
+            return self.sessions
+        from app import database
+        return database.AsyncSessionLocal
+
+    async def start(self, directory: Optional[str] = None, follow: bool = True) -> bool:
+        """Recovers the book and starts following the outbox; False if no journal directory is configured."""
+        directory = directory or settings.TRADE_JOURNAL_DIR
+        if not directory or self.directory is not None:
+            return False
+        self.directory = directory
+        started = time.perf_counter()
+        self.book, snapshot_offset, replayed = await asyncio.to_thread(self._recover)
+        self.recovery = {
+            "snapshot_offset": snapshot_offset, "replayed_records": replayed,
+            "seconds": round(time.perf_counter() - started, 6),
+        }
+        logger.info(
+            f"Trade journal recovered {len(self.book.portfolios)} portfolios at offset {self.book.offset} "
+            f"(snapshot at {snapshot_offset}, {replayed} records replayed) in {self.recovery['seconds']:.3f}s."
+        )
+        self._reader = OutboxReader(self.book.offset)
+        self._try_become_writer()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if follow:
+            self._task = self._loop.create_task(self._follow_loop())
+        return True
+
+    def _recover(self) -> Tuple[PositionBook, int, int]:
+        journal = TradeJournal(self.directory)
+        try:
+            return recover(journal)
+        finally:
+            journal.close()
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self.journal is not None:
+            self.journal.flush()
+            self.journal.close()
+            self.journal = None
+        if self._lock_file is not None:
+            self._lock_file.close() # Releases the lock
+            self._lock_file = None
+        self.directory = None
+        self._loop = None
+
+    def _try_become_writer(self) -> None:
+        if self.writer:
+            return
+        lock_file = open(os.path.join(self.directory, "writer.lock"), "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return
+        self._lock_file = lock_file
+        self.journal = TradeJournal(self.directory, writable=True)
+        # The journal may be behind this worker's book (the previous writer stopped early): re-read from there
+        self._reader = OutboxReader(min(self.journal.head, self._reader.position))
+        logger.info(f"This worker writes the trade journal in {self.directory} (head {self.journal.head}).")
+
+    # --- Following the outbox ---
+
+    def notify(self) -> None:
+        """New trades may have been committed (any thread)."""
+        if self._loop is not None and self._task is not None:
+            call_on_loop(self._loop, self._wakeup.set)
+
+    async def _follow_loop(self) -> None:
+        while True:
+            timeout = settings.TRADE_EVENT_POLL_SECONDS
+            if self._reader.waiting:
+                timeout = min(timeout, settings.TRADE_EVENT_GAP_SECONDS)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.catch_up()
+            except Exception:
+                # stop() cancelled it mid-read, surfacing as a database error from the session close:
+                # still end the task, or stop() would wait on it forever
+                if asyncio.current_task().cancelling():
+                    raise asyncio.CancelledError
+                logger.exception("Following the trade outbox into the journal failed")
+
+    async def catch_up(self) -> int:
+        """Reads the outbox up to its end; returns the number of new records."""
+        self._try_become_writer()
+        total = 0
+        more = True
+        while more:
+            async with self._sessionmaker()() as db:
+                rows, more = await self._reader.read_batch(db, settings.TRADE_EVENT_BATCH_SIZE)
+            if not rows:
+                continue # Gap markers only, or nothing (then `more` is False)
+            records = [record_from_event(row) for row in rows]
+            if self.journal is not None:
+                appended = self.journal.append(records)
+                _APPENDED.inc(appended)
+                self._since_snapshot += appended
+            for record in records:
+                if record.offset > self.book.offset:
+                    self.book.apply(record)
+                    _APPLIED.inc()
+            total += len(records)
+        if self.journal is not None and total:
+            await asyncio.to_thread(self.journal.flush)
+            if self._since_snapshot >= settings.TRADE_JOURNAL_SNAPSHOT_EVERY:
+                await self.snapshot()
+        return total
+
+    async def snapshot(self) -> Optional[str]:
+        """Writes a snapshot of the book (the writer only); the file is written off the event loop."""
+        if self.journal is None:
+            return None
+        data, offset = self.book.dump(), self.book.offset # Taken on the loop, between applies
+        self._since_snapshot = 0
+        return await asyncio.to_thread(write_snapshot, self.directory, data, offset)
+
+    # --- Introspection ---
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.directory is not None,
+            "writer": self.writer,
+            "offset": self.book.offset,
+            "portfolios": len(self.book.portfolios),
+            "journal_head": self.journal.head if self.journal is not None else None,
+            "segments": self.journal.segment_count if self.journal is not None else None,
+            "recovery": self.recovery,
+        }
+
+
+trade_journal = TradeJournalService()
+
+invalidation_bus.register("trade", lambda *args: trade_journal.notify())
+invalidation_bus.register_resync(trade_journal.notify)
+
+
+def _journal_gauges():
+    yield from gauge_lines("trade_journal_offset", "Last trade offset applied to this worker's position book.", [({}, trade_journal.book.offset)])
+    yield from gauge_lines("trade_journal_writer", "1 in the worker appending to the trade journal, else 0.", [({}, int(trade_journal.writer))])
+
+REGISTRY.add_collector(_journal_gauges)
@@ -0,0 +1,72 @@
+from typing import Tuple
+
+from app.services import money
+
+# Pure BUY/SELL cash and holdings rules, shared by crud_trade (database-backed trades)
+# and backtest_service (in-memory replays). No ORM or FastAPI imports here so the rules
+# can run in worker processes cheaply. Cash and prices are integer micro-units (see money);
+# prices are expected at the cent, as the trades table stores them.
+
+INSUFFICIENT_CASH_DETAIL = "Insufficient cash balance."
+INSUFFICIENT_QUANTITY_DETAIL = "Insufficient quantity to sell or holding does not exist."
+
+
+class TradeRuleError(ValueError):
+    """Raised when a trade violates the cash or holdings rules. `detail` is safe to show to clients."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def check_buy(cash_balance: int, price: int, quantity: int) -> int:
+    """
+    Validates a BUY against the available cash and returns its cost.
+    """
+    trade_cost = price * quantity
+    if cash_balance < trade_cost:
+        raise TradeRuleError(INSUFFICIENT_CASH_DETAIL)
+    return trade_cost
+
+
+def check_sell(held_quantity: int, quantity: int) -> int:
+    """
+    Validates a SELL against the held quantity and returns the quantity left afterwards.
+    A held_quantity of 0 means there is no holding.
+    """
+    if held_quantity < quantity:
+        raise TradeRuleError(INSUFFICIENT_QUANTITY_DETAIL)
+    return held_quantity - quantity
+
+
+def average_price_after_buy(held_quantity: int, average_buy_price: int, price: int, quantity: int) -> int:
+    """
+    Weighted average cost of a holding after buying `quantity` more at `price`,
+    rounded half-up to the cent: the value the holdings table keeps.
+    """
+    if held_quantity == 0:
+        return price
+    new_total_cost = (average_buy_price * held_quantity) + (price * quantity)
+    return money.divide_to(new_total_cost, held_quantity + quantity)
+
+
+def apply_buy(
+    cash_balance: int, held_quantity: int, average_buy_price: int, price: int, quantity: int
+) -> Tuple[int, int, int]:
+    """
+    Applies a BUY and returns (new_cash_balance, new_quantity, new_average_buy_price).
+    """
+    trade_cost = check_buy(cash_balance, price, quantity)
+    new_average = average_price_after_buy(held_quantity, average_buy_price, price, quantity)
+    return cash_balance - trade_cost, held_quantity + quantity, new_average
+
+
+def apply_sell(
+    cash_balance: int, held_quantity: int, average_buy_price: int, price: int, quantity: int
+) -> Tuple[int, int, int]:
+    """
+    Applies a SELL and returns (new_cash_balance, new_quantity, average_buy_price).
+    Selling does not change the average cost of what is left.
+    """
+    new_quantity = check_sell(held_quantity, quantity)
+    return cash_balance + price * quantity, new_quantity, average_buy_price
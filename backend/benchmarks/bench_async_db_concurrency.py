@@ -0,0 +1,107 @@
+"""
+Async database benchmark: how many concurrent requests one event loop (one uvicorn worker) serves.
+
+Each simulated request runs one query that waits on the database server for --query-delay seconds
+(pg_sleep on PostgreSQL). Two modes are compared:
+  sync_session   the old get_db path: a blocking Session called directly from an async handler,
+                 so every query stalls the event loop and requests run one after another;
+  async_session  the get_async_db path: AsyncSession on the async engine, so waits overlap.
+
+Run against the configured DATABASE_URL (PostgreSQL recommended; on SQLite a pg_sleep stand-in
+is registered on each connection), e.g.:
+    python benchmarks/bench_async_db_concurrency.py --concurrency 50 --requests 500
+
+Prints one JSON document with throughput and latency percentiles (milliseconds) per mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import event, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine  # noqa: E402
+from bench_login_storm import summarize  # noqa: E402
+
+WAIT_QUERY = text("SELECT pg_sleep(:delay)")
+
+
+def register_sqlite_sleep() -> None:
+    """SQLite has no server-side sleep; give both engines a pg_sleep that blocks the connection's thread."""
+    @event.listens_for(engine, "connect")
+    def sync_connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("pg_sleep", 1, time.sleep)
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def async_connect(dbapi_connection, connection_record):
+        dbapi_connection.run_async(lambda conn: conn.create_function("pg_sleep", 1, time.sleep))
+
+
+async def sync_request(query_delay: float) -> None:
+    with SessionLocal() as db:
+        db.execute(WAIT_QUERY, {"delay": query_delay})
+
+
+async def async_request(query_delay: float) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(WAIT_QUERY, {"delay": query_delay})
+
+
+async def run_mode(handler, args: argparse.Namespace) -> dict:
+    limiter = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+
+    async def one_request() -> None:
+        async with limiter:
+            start = time.perf_counter()
+            await handler(args.query_delay)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await handler(args.query_delay) # Warm the pool / driver
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 1),
+        "latency": summarize(latencies),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if engine.dialect.name == "sqlite":
+        register_sqlite_sleep()
+    try:
+        results = {
+            "sync_session": await run_mode(sync_request, args),
+            "async_session": await run_mode(async_request, args),
+        }
+    finally:
+        await async_engine.dispose()
+        engine.dispose()
+    speedup = results["async_session"]["requests_per_s"] / results["sync_session"]["requests_per_s"]
+    return {
+        "benchmark": "async_db_concurrency",
+        "dialect": engine.dialect.name,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "query_delay_s": args.query_delay,
+        **results,
+        "throughput_speedup": round(speedup, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per mode")
+    parser.add_argument("--query-delay", type=float, default=0.02, help="Seconds each query waits on the database")
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Backtest engine benchmark: one moving-average crossover backtest over --years of synthetic daily
+closes (see app.services.backtest_service), and a parameter sweep over the same bars.
+
+Reports, in milliseconds:
+  backtest_ms   one run_backtest (best of --repeat)
+  sweep_ms      run_parameter_sweep over every fast < slow combination of the windows below
+
+Needs no database:
+    python benchmarks/bench_backtest.py --years 10
+Prints one JSON document.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services import backtest_service  # noqa: E402
+
+FAST_WINDOWS = [5, 10, 20, 30]
+SLOW_WINDOWS = [50, 100, 150, 200]
+STARTING_CASH = Decimal("100000.00")
+
+
+def synthetic_closes(bar_count: int) -> list:
+    # A trending sine wave, as in tests/test_backtest.py: regular crossovers and a rising price level.
+    return [round(100 + i * 0.05 + 10 * math.sin(i / 15), 2) for i in range(bar_count)]
+
+
+def best_ms(function, repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+
+def run(args: argparse.Namespace) -> dict:
+    closes = synthetic_closes(252 * args.years)
+    grid = backtest_service.build_param_grid(FAST_WINDOWS, SLOW_WINDOWS)
+    return {
+        "benchmark": "backtest",
+        "bars": len(closes),
+        "sweep_size": len(grid),
+        "backtest_ms": best_ms(lambda: backtest_service.run_backtest(closes, 20, 50, STARTING_CASH), args.repeat),
+        "sweep_ms": best_ms(
+            lambda: backtest_service.run_parameter_sweep(closes, grid, STARTING_CASH, max_workers=args.workers), 1
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=10, help="Years of daily bars (252 per year)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs of the single backtest")
+    parser.add_argument("--workers", type=int, default=1, help="Sweep worker processes")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
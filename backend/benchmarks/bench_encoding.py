@@ -0,0 +1,112 @@
+"""
+Response encoding benchmark: payload size and encode time of the formats the API negotiates, for the
+large responses bot clients pull (a trade list, a holdings list and a quote batch).
+
+Formats (see app.services.encoding_service):
+  json              pydantic-core JSON, Decimals as strings (the default response)
+  msgpack           Accept: application/msgpack, Decimals as strings
+  msgpack_fixed     Accept: application/msgpack; decimal-scale=2, Decimals as integer cents
+each uncompressed and with gzip and zstd (what CompressionMiddleware sends for Accept-Encoding).
+Encode time covers model dump + encoding (+ compression); validation is shared by all formats and left out.
+
+Needs no database; the rows are synthetic:
+    python benchmarks/bench_encoding.py --rows 10000
+Prints one JSON document with bytes and milliseconds per payload and format.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.models import Holding, Trade  # noqa: E402
+from app.routes.market_data_routes import QuoteBatchResponse  # noqa: E402
+from app.routes.responses import ListResponder  # noqa: E402
+from app.services.encoding_service import available_encodings, compress, encode_msgpack  # noqa: E402
+
+TICKERS = ("AAPL", "MSFT", "GOOG", "NVDA", "AMZN", "TSLA", "META", "BTC-USD")
+
+
+def payloads(rows: int) -> dict:
+    """(adapter, validated value) per payload."""
+    start = datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)
+    trades = ListResponder(Trade)
+    holdings = ListResponder(Holding)
+    quotes = TypeAdapter(QuoteBatchResponse)
+    return {
+        "trade_list": (trades.adapter, trades.validate([
+            {
+                "trade_id": i, "portfolio_id": 1, "ticker_symbol": TICKERS[i % len(TICKERS)],
+                "trade_type": "BUY" if i % 3 else "SELL", "quantity": 1 + i % 50,
+                "price": Decimal(100 + i % 900) + Decimal("0.25"), "timestamp": start + timedelta(seconds=i),
+            }
+            for i in range(rows)
+        ])),
+        "holdings_list": (holdings.adapter, holdings.validate([
+            {
+                "holding_id": i, "portfolio_id": 1, "ticker_symbol": f"T{i:05d}", "quantity": 10 + i % 500,
+                "average_buy_price": Decimal(20 + i % 700) + Decimal("0.37"),
+            }
+            for i in range(rows // 10)
+        ])),
+        "quote_batch": (quotes, quotes.validate_python({
+            "prices": {f"T{i:03d}": Decimal(5 + i) + Decimal("0.99") for i in range(100)}
+        })),
+    }
+
+
+def encoders(adapter: TypeAdapter) -> dict[str, Callable[[object], bytes]]:
+    return {
+        "json": adapter.dump_json,
+        "msgpack": lambda value: encode_msgpack(adapter.dump_python(value)),
+        "msgpack_fixed": lambda value: encode_msgpack(adapter.dump_python(value), decimal_scale=2),
+    }
+
+
+def best_ms(step: Callable[[], bytes], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+
+def run(args: argparse.Namespace) -> dict:
+    results = {}
+    for payload_name, (adapter, value) in payloads(args.rows).items():
+        formats = {}
+        for format_name, encode in encoders(adapter).items():
+            body = encode(value)
+            variants = {"identity": {"bytes": len(body), "encode_ms": best_ms(lambda: encode(value), args.repeats)}}
+            for encoding in available_encodings():
+                variants[encoding] = {
+                    "bytes": len(compress(body, encoding)),
+                    "encode_ms": best_ms(lambda: compress(encode(value), encoding), args.repeats),
+                }
+            formats[format_name] = variants
+        json_bytes = formats["json"]["identity"]["bytes"]
+        for variants in formats.values():
+            for stats in variants.values():
+                stats["size_vs_json"] = round(stats["bytes"] / json_bytes, 3)
+        results[payload_name] = formats
+    return {"benchmark": "encoding", "rows": args.rows, "payloads": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Trades in the trade list (holdings get a tenth)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per format (the best one is reported)")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+List response microbenchmark: per-row cost of turning a page of trades into the response body, the
+old way (ORM objects, model_validate per row, FastAPI's response_model validation and JSON encoding)
+against the ListResponder path the list routes use now (column rows, one validation, pydantic-core JSON).
+
+Paths, each timed end to end from the SELECT to the response body bytes:
+  orm_model_validate   select(DBTrade) -> [Trade.model_validate(t)] -> serialize_response -> JSONResponse
+  rows_list_responder  select(columns).mappings() -> ListResponder(Trade).render
+and the encoding alone (rows already fetched), to separate it from the database:
+  encode_orm / encode_rows
+
+Seeds one portfolio with --rows trades in the configured DATABASE_URL and prints one JSON document
+with microseconds per row, e.g.:
+    python benchmarks/bench_list_serialization.py --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from decimal import Decimal
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.crud.aio import crud_trade  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import DBPortfolio, DBTrade, DBUser, Trade  # noqa: E402 -- registers every model
+from app.routes.responses import ListResponder  # noqa: E402
+
+TRADE_LIST_FIELD = create_model_field(name="Response", type_=List[Trade], mode="serialization")
+trade_list = ListResponder(Trade)
+
+
+async def seed(rows: int) -> int:
+    """A portfolio with `rows` trades. Returns its id."""
+    run_id = uuid.uuid4().hex[:8]
+    async with AsyncSessionLocal() as db:
+        user = DBUser(username=f"bench_{run_id}", email=f"bench_{run_id}@example.com", password_hash="x")
+        db.add(user)
+        await db.flush()
+        portfolio = DBPortfolio(user_id=user.user_id, portfolio_name="list bench", cash_balance=Decimal("0"))
+        db.add(portfolio)
+        await db.flush()
+        await db.execute(insert(DBTrade), [
+            {
+                "portfolio_id": portfolio.portfolio_id,
+                "ticker_symbol": ("AAPL", "MSFT", "GOOG", "NVDA")[i % 4],
+                "trade_type": "BUY" if i % 3 else "SELL",
+                "quantity": 1 + i % 50,
+                "price": Decimal(100 + i % 900) + Decimal("0.25"),
+            }
+            for i in range(rows)
+        ])
+        await db.commit()
+        return portfolio.portfolio_id
+
+
+async def encode_orm(db_trades) -> bytes:
+    # What the route did: validate each object, then FastAPI validates and encodes the list again
+    content = [Trade.model_validate(t) for t in db_trades]
+    content = await serialize_response(field=TRADE_LIST_FIELD, response_content=content, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def encode_rows(trade_rows) -> bytes:
+    return trade_list.render(trade_rows)
+
+
+async def best_of(repeats: int, step) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await step()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def run(args: argparse.Namespace) -> dict:
+    try:
+        portfolio_id = await seed(args.rows)
+        async with AsyncSessionLocal() as db:
+            async def fetch_orm():
+                db.expunge_all() # Otherwise later repeats reuse the identity map's objects
+                return await crud_trade.get_trades_by_portfolio(db, portfolio_id, limit=args.rows)
+
+            async def fetch_rows():
+                return await crud_trade.get_trade_rows_by_portfolio(db, portfolio_id, limit=args.rows)
+
+            async def orm_model_validate():
+                return await encode_orm(await fetch_orm())
+
+            async def rows_list_responder():
+                return encode_rows(await fetch_rows())
+
+            orm_body, rows_body = await orm_model_validate(), await rows_list_responder()
+            assert json.loads(orm_body) == json.loads(rows_body), "both paths must produce the same JSON"
+            db_trades, trade_rows = await fetch_orm(), await fetch_rows()
+
+            async def encode_orm_only():
+                return await encode_orm(db_trades)
+
+            async def encode_rows_only():
+                return encode_rows(trade_rows)
+
+            paths = {
+                "orm_model_validate": orm_model_validate,
+                "rows_list_responder": rows_list_responder,
+                "encode_orm": encode_orm_only,
+                "encode_rows": encode_rows_only,
+            }
+            results = {}
+            for name, step in paths.items():
+                await best_of(1, step) # Warm-up
+                seconds = await best_of(args.repeats, step)
+                results[name] = {"total_ms": round(seconds * 1000, 2), "per_row_us": round(seconds / args.rows * 1e6, 3)}
+    finally:
+        await async_engine.dispose()
+    return {
+        "benchmark": "list_serialization",
+        "dialect": async_engine.dialect.name,
+        "rows": args.rows,
+        "body_bytes": len(rows_body),
+        "paths": results,
+        "speedup": round(results["orm_model_validate"]["total_ms"] / results["rows_list_responder"]["total_ms"], 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Trades in the listed page")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per path (the best one is reported)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
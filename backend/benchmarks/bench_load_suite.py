@@ -0,0 +1,329 @@
+"""
+End-to-end load suite: drives the real app over HTTP with an async load generator and reports
+throughput and latency percentiles per scenario, as JSON that can be compared between commits.
+
+Scenarios (run in this order; pick a subset with --scenarios):
+  register_storm  concurrent sign-ups of fresh users
+  login_storm     concurrent logins of already registered users (bcrypt-bound)
+  quote_cold      first GET /marketdata/{ticker} for unseen tickers: cache miss + Finnhub round trip
+  quote_hot       repeated GET /marketdata/{ticker} for the same tickers: cache hits
+  trade_burst     server-priced BUY/SELL trades hammering a few hot portfolios
+  deep_history    GET .../trades pages of a portfolio holding --history-trades trades
+  poll_unchanged  a frontend polling /portfolios, .../holdings and .../trades of an unchanged portfolio,
+                  once re-downloading everything ("full") and once revalidating with If-None-Match
+                  ("conditional", answered with 304s)
+
+With --spawn the suite starts the Finnhub stand-in (benchmarks/finnhub_stub.py) and the app
+(uvicorn main:app) itself, on the DATABASE_URL of the environment. Use a local PostgreSQL that has
+been migrated (alembic upgrade head); the suite creates its own users and portfolios.
+    python benchmarks/bench_load_suite.py --spawn --output results/load-$(git rev-parse --short HEAD).json
+Without --spawn it targets an already running server (--base-url); start that server with
+FINNHUB_BASE_URL pointing at the stand-in, or quote_cold measures the real Finnhub.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import httpx
+
+from bench_login_storm import summarize
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCENARIOS = (
+    "register_storm", "login_storm", "quote_cold", "quote_hot", "trade_burst", "deep_history", "poll_unchanged"
+)
+PASSWORD = "load-test-password"
+
+
+async def run_load(
+    make_request: Callable[[int], Awaitable[httpx.Response]], total: int, concurrency: int
+) -> dict:
+    """Sends `total` requests, at most `concurrency` at a time; returns throughput, latency and status counts."""
+    limiter = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+
+    async def one_request(i: int) -> None:
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                response = await make_request(i)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "status_counts": dict(sorted(statuses.items())),
+    }
+
+# --- Fixtures created through the API ---
+
+async def register(client: httpx.AsyncClient, username: str) -> httpx.Response:
+    return await client.post(
+        "/users/register",
+        json={"username": username, "email": f"{username}@example.com", "password": PASSWORD},
+    )
+
+async def login_headers(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post("/users/login", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def create_portfolio(client: httpx.AsyncClient, headers: dict, name: str) -> int:
+    response = await client.post("/portfolios/", json={"portfolio_name": name}, headers=headers)
+    response.raise_for_status()
+    return response.json()["portfolio_id"]
+
+# --- Scenarios ---
+
+async def scenario_register_storm(client, ctx, args) -> dict:
+    usernames = [f"load_{ctx['run_id']}_{i}" for i in range(args.users)]
+    result = await run_load(lambda i: register(client, usernames[i]), args.users, args.concurrency)
+    ctx["usernames"] = usernames
+    return result
+
+async def scenario_login_storm(client, ctx, args) -> dict:
+    usernames = ctx.get("usernames")
+    if not usernames: # register_storm was skipped
+        usernames = [f"load_{ctx['run_id']}_{i}" for i in range(min(args.users, 20))]
+        await asyncio.gather(*(register(client, name) for name in usernames))
+    credentials = [{"username": name, "password": PASSWORD} for name in usernames]
+    return await run_load(
+        lambda i: client.post("/users/login", data=credentials[i % len(credentials)]),
+        args.logins, args.concurrency,
+    )
+
+async def scenario_quote_cold(client, ctx, args) -> dict:
+    # Tickers unique to this run, so every first lookup misses the cache
+    tickers = [f"L{ctx['run_id'][:6].upper()}{i}" for i in range(args.tickers)]
+    ctx["tickers"] = tickers
+    return await run_load(lambda i: client.get(f"/marketdata/{tickers[i]}"), len(tickers), args.concurrency)
+
+async def scenario_quote_hot(client, ctx, args) -> dict:
+    tickers = ctx.get("tickers") or ["AAPL", "MSFT", "GOOG"]
+    for ticker in tickers[:args.concurrency]: # Make sure each one is cached
+        await client.get(f"/marketdata/{ticker}")
+    return await run_load(
+        lambda i: client.get(f"/marketdata/{tickers[i % len(tickers)]}"), args.quotes, args.concurrency
+    )
+
+async def scenario_trade_burst(client, ctx, args) -> dict:
+    username = f"trader_{ctx['run_id']}"
+    (await register(client, username)).raise_for_status()
+    headers = await login_headers(client, username)
+    ticker = (ctx.get("tickers") or ["AAPL"])[0]
+    portfolios = [await create_portfolio(client, headers, f"hot {i}") for i in range(args.hot_portfolios)]
+    for portfolio_id in portfolios: # Seed a position so the SELLs below always have shares to sell
+        response = await client.post(
+            f"/portfolios/{portfolio_id}/trades/",
+            json={"ticker_symbol": ticker, "trade_type": "BUY", "quantity": 50},
+            headers=headers,
+        )
+        response.raise_for_status()
+
+    def trade(i: int):
+        return client.post(
+            f"/portfolios/{portfolios[i % len(portfolios)]}/trades/",
+            json={"ticker_symbol": ticker, "trade_type": "BUY" if i % 2 == 0 else "SELL", "quantity": 1},
+            headers=headers,
+        )
+
+    return await run_load(trade, args.trades, args.concurrency)
+
+async def scenario_deep_history(client, ctx, args) -> dict:
+    username = f"history_{ctx['run_id']}"
+    (await register(client, username)).raise_for_status()
+    headers = await login_headers(client, username)
+    portfolio_id = await create_portfolio(client, headers, "deep history")
+    trades_path = f"/portfolios/{portfolio_id}/trades/"
+
+    def seed(i: int): # Client-priced, so seeding does not touch the price cache or Finnhub
+        return client.post(
+            trades_path,
+            json={"ticker_symbol": f"H{i % 25}", "trade_type": "BUY", "quantity": 1, "price": "1.00"},
+            headers=headers,
+        )
+
+    await run_load(seed, args.history_trades, min(args.concurrency, 8))
+    pages = max(1, args.history_trades // args.page_size)
+    return await run_load(
+        lambda i: client.get(
+            trades_path, params={"skip": (i % pages) * args.page_size, "limit": args.page_size}, headers=headers
+        ),
+        args.history_reads, args.concurrency,
+    )
+
+async def scenario_poll_unchanged(client, ctx, args) -> dict:
+    username = f"poller_{ctx['run_id']}"
+    (await register(client, username)).raise_for_status()
+    headers = await login_headers(client, username)
+    portfolio_id = await create_portfolio(client, headers, "polled")
+    for i in range(args.page_size):
+        response = await client.post(
+            f"/portfolios/{portfolio_id}/trades/",
+            json={"ticker_symbol": f"P{i % 25}", "trade_type": "BUY", "quantity": 1, "price": "1.00"},
+            headers=headers,
+        )
+        response.raise_for_status()
+    paths = ["/portfolios/", f"/portfolios/{portfolio_id}/holdings", f"/portfolios/{portfolio_id}/trades/"]
+    etags = {path: (await client.get(path, headers=headers)).headers["etag"] for path in paths}
+
+    def poll(i: int, conditional: bool):
+        path = paths[i % len(paths)]
+        return client.get(path, headers={**headers, "If-None-Match": etags[path]} if conditional else headers)
+
+    full = await run_load(lambda i: poll(i, False), args.polls, args.concurrency)
+    conditional = await run_load(lambda i: poll(i, True), args.polls, args.concurrency)
+    return {"full": full, "conditional": conditional}
+
+SCENARIO_FUNCTIONS = {
+    "register_storm": scenario_register_storm,
+    "login_storm": scenario_login_storm,
+    "quote_cold": scenario_quote_cold,
+    "quote_hot": scenario_quote_hot,
+    "trade_burst": scenario_trade_burst,
+    "deep_history": scenario_deep_history,
+    "poll_unchanged": scenario_poll_unchanged,
+}
+
+# --- Spawned servers ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def spawn_servers(args: argparse.Namespace) -> tuple[str, list[subprocess.Popen]]:
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "finnhub_stub.py"),
+         "--port", str(stub_port), "--latency-ms", str(args.finnhub_latency_ms)],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "FINNHUB_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "FINNHUB_API_KEY": os.environ.get("FINNHUB_API_KEY") or "stub",
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    processes = [stub, app]
+    try:
+        wait_until_up(f"http://127.0.0.1:{stub_port}/docs")
+        base_url = f"http://127.0.0.1:{app_port}"
+        wait_until_up(base_url + "/")
+    except Exception:
+        stop_servers(processes)
+        raise
+    return base_url, processes
+
+def stop_servers(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def git_sha() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    ctx = {"run_id": uuid.uuid4().hex[:8]}
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        for name in args.scenarios:
+            results[name] = await SCENARIO_FUNCTIONS[name](client, ctx, args)
+    return {
+        "benchmark": "load_suite",
+        "git_sha": git_sha(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": base_url,
+        "params": {
+            key: value for key, value in vars(args).items() if key not in ("output", "spawn", "base_url")
+        },
+        "scenarios": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Server to test (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start the Finnhub stand-in and the app locally")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    parser.add_argument("--finnhub-latency-ms", type=float, default=80.0, help="Stand-in latency with --spawn")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run, in order"
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once")
+    parser.add_argument("--users", type=int, default=100, help="Sign-ups in register_storm")
+    parser.add_argument("--logins", type=int, default=200, help="Logins in login_storm")
+    parser.add_argument("--tickers", type=int, default=50, help="Distinct tickers in quote_cold / quote_hot")
+    parser.add_argument("--quotes", type=int, default=2000, help="Requests in quote_hot")
+    parser.add_argument("--hot-portfolios", type=int, default=2, help="Portfolios shared by trade_burst")
+    parser.add_argument("--trades", type=int, default=500, help="Trades in trade_burst")
+    parser.add_argument("--history-trades", type=int, default=2000, help="Trades seeded for deep_history")
+    parser.add_argument("--history-reads", type=int, default=500, help="Page reads in deep_history")
+    parser.add_argument("--page-size", type=int, default=100, help="Trades per page in deep_history")
+    parser.add_argument("--polls", type=int, default=1500, help="Requests per half of poll_unchanged")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    processes: list[subprocess.Popen] = []
+    base_url = args.base_url
+    if args.spawn:
+        base_url, processes = spawn_servers(args)
+    try:
+        result = asyncio.run(run(args, base_url))
+    finally:
+        stop_servers(processes)
+
+    document = json.dumps(result, indent=2)
+    print(document)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+
+
+if __name__ == "__main__":
+    main()
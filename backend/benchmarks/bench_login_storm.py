@@ -0,0 +1,106 @@
+"""
+Login storm benchmark: latency of GET /marketdata/{ticker} while many clients log in at once.
+
+bcrypt verification costs ~100-300ms of CPU per login. If it runs on the event loop, every other
+request in the worker waits behind it; this benchmark makes that visible as the /marketdata p99.
+
+Run against a live server with a database, e.g.:
+    uvicorn main:app --workers 1
+    python benchmarks/bench_login_storm.py --base-url http://localhost:8000 --storm-concurrency 50
+
+Prints one JSON document with the quiet and under-storm latency percentiles (milliseconds)
+and the login status-code counts (503s mean the login limiter shed load).
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+        "max_ms": round(max(samples), 2) if samples else 0.0,
+    }
+
+
+async def probe(client: httpx.AsyncClient, path: str, duration: float, interval: float) -> list[float]:
+    """Requests `path` every `interval` seconds for `duration` seconds and returns latencies in ms."""
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_worker(client: httpx.AsyncClient, credentials: dict, stop: asyncio.Event, statuses: Counter) -> None:
+    while not stop.is_set():
+        response = await client.post("/users/login", data=credentials)
+        statuses[response.status_code] += 1
+
+
+async def run(args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.storm_concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        suffix = uuid.uuid4().hex[:8]
+        credentials = {"username": f"storm_{suffix}", "password": "storm-password"}
+        response = await client.post(
+            "/users/register",
+            json={**credentials, "email": f"storm_{suffix}@example.com"},
+        )
+        response.raise_for_status()
+
+        path = f"/marketdata/{args.ticker}"
+        await client.get(path) # Warm the price cache so the probe measures the server, not Finnhub
+        quiet = await probe(client, path, args.duration, args.interval)
+
+        stop, statuses = asyncio.Event(), Counter()
+        storm = [
+            asyncio.create_task(login_worker(client, credentials, stop, statuses))
+            for _ in range(args.storm_concurrency)
+        ]
+        await asyncio.sleep(0.5) # Let the storm build up
+        under_storm = await probe(client, path, args.duration, args.interval)
+        stop.set()
+        await asyncio.gather(*storm)
+
+    return {
+        "benchmark": "login_storm",
+        "storm_concurrency": args.storm_concurrency,
+        "marketdata_quiet": summarize(quiet),
+        "marketdata_under_login_storm": summarize(under_storm),
+        "login_status_counts": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--ticker", default="AAPL")
+    parser.add_argument("--storm-concurrency", type=int, default=50, help="Concurrent clients logging in")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to probe in each phase")
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between probe requests")
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Money arithmetic benchmark: the integer micro-unit path (app.services.money, trade_rules) against the
+Decimal arithmetic it replaced, on random inputs checked to give the same results.
+
+Reports, in nanoseconds per operation:
+  average_cost       weighted average after a buy (Decimal division vs one rounded int division)
+  apply_buy          cash check, debit and new average for one buy
+  apply_buy_edges    the same, including the Decimal -> micro-unit -> Decimal conversions crud_trade does
+  valuation          cash + sum(quantity * price) over --holdings positions, then the return percentage
+                     (per position), from Decimals, from ints, and from array("q") columns
+
+Needs no database:
+    python benchmarks/bench_money.py --iterations 200000
+Prints one JSON document.
+"""
+import argparse
+import json
+import operator
+import os
+import random
+import sys
+import time
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services import money, trade_rules  # noqa: E402
+
+CENT = Decimal("0.01")
+PCT_QUANTUM = Decimal("0.0001")
+STARTING_CASH = Decimal("100000.00")
+
+
+# --- The Decimal path, as it was ---
+
+def decimal_average(held_quantity, average_buy_price, price, quantity):
+    if held_quantity == 0:
+        return price
+    return ((average_buy_price * held_quantity) + (price * quantity)) / (held_quantity + quantity)
+
+def decimal_apply_buy(cash_balance, held_quantity, average_buy_price, price, quantity):
+    trade_cost = price * quantity
+    if cash_balance < trade_cost:
+        raise trade_rules.TradeRuleError(trade_rules.INSUFFICIENT_CASH_DETAIL)
+    new_average = decimal_average(held_quantity, average_buy_price, price, quantity)
+    return cash_balance - trade_cost, held_quantity + quantity, new_average
+
+def decimal_valuation(cash, positions):
+    total = cash + sum((quantity * price for quantity, price in positions), Decimal("0"))
+    return total.quantize(CENT), ((total - STARTING_CASH) / STARTING_CASH * 100).quantize(PCT_QUANTUM)
+
+
+def ns_per_op(function, inputs, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in inputs:
+            function(*args)
+    return round((time.perf_counter() - start) / (len(inputs) * repeat) * 1e9, 1)
+
+
+def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(49)
+    trades = []
+    for _ in range(args.iterations):
+        held, quantity = rng.randrange(1, 10_000), rng.randrange(1, 1_000)
+        average, price = Decimal(rng.randrange(100, 1_000_000)) * CENT, Decimal(rng.randrange(100, 1_000_000)) * CENT
+        trades.append((Decimal(10 ** 9), held, average, price, quantity))
+    micro_trades = [
+        (money.to_micros(cash), held, money.to_micros(average), money.to_micros(price), quantity)
+        for cash, held, average, price, quantity in trades
+    ]
+    for decimal_trade, micro_trade in zip(trades[:1000], micro_trades[:1000]): # Same results
+        expected = decimal_apply_buy(*decimal_trade)
+        result = trade_rules.apply_buy(*micro_trade)
+        assert money.from_micros(result[0]) == expected[0] and money.from_micros(result[2]) == expected[2].quantize(CENT, ROUND_HALF_UP)
+
+    def edges(cash, held, average, price, quantity):
+        new_cash, new_quantity, new_average = trade_rules.apply_buy(
+            money.to_micros(cash), held, money.to_micros(average), money.to_micros(price, 2, ROUND_HALF_UP), quantity
+        )
+        return money.from_micros(new_cash), new_quantity, money.from_micros(new_average)
+
+    portfolios = max(1, args.iterations // args.holdings)
+    decimal_books = [
+        (Decimal(rng.randrange(0, 10 ** 7)) * CENT,
+         [(rng.randrange(1, 1_000), Decimal(rng.randrange(100, 1_000_000)) * CENT) for _ in range(args.holdings)])
+        for _ in range(portfolios)
+    ]
+    micro_books = [(money.to_micros(cash), [(q, money.to_micros(p)) for q, p in positions]) for cash, positions in decimal_books]
+    column_books = [
+        (cash, array("q", [q for q, _ in positions]), array("q", [p for _, p in positions])) for cash, positions in micro_books
+    ]
+    starting = money.to_micros(STARTING_CASH)
+
+    def micro_valuation(cash, positions):
+        total = cash + sum(quantity * price for quantity, price in positions)
+        return money.from_micros(total), money.percent(total - starting, starting)
+
+    def column_valuation(cash, quantities, prices):
+        total = cash + sum(map(operator.mul, quantities, prices))
+        return money.from_micros(total), money.percent(total - starting, starting)
+
+    for decimal_book, micro_book, column_book in zip(decimal_books, micro_books, column_books):
+        assert decimal_valuation(*decimal_book) == micro_valuation(*micro_book) == column_valuation(*column_book)
+
+    average_inputs = [trade[1:] for trade in trades]
+    micro_average_inputs = [trade[1:] for trade in micro_trades]
+    per_position = 1 / args.holdings
+    return {
+        "benchmark": "money",
+        "iterations": args.iterations,
+        "ns_per_op": {
+            "average_cost": {
+                "decimal": ns_per_op(decimal_average, average_inputs),
+                "micros": ns_per_op(trade_rules.average_price_after_buy, micro_average_inputs),
+            },
+            "apply_buy": {
+                "decimal": ns_per_op(decimal_apply_buy, trades),
+                "micros": ns_per_op(trade_rules.apply_buy, micro_trades),
+            },
+            "apply_buy_edges": {"micros": ns_per_op(edges, trades)},
+            "valuation_per_position": {
+                "decimal": round(ns_per_op(decimal_valuation, decimal_books) * per_position, 1),
+                "micros": round(ns_per_op(micro_valuation, micro_books) * per_position, 1),
+                "micros_columns": round(ns_per_op(column_valuation, column_books) * per_position, 1),
+            },
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="Trades (and valued positions) timed")
+    parser.add_argument("--holdings", type=int, default=50, help="Positions per valued portfolio")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
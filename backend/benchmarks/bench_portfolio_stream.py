@@ -0,0 +1,99 @@
+"""
+Portfolio stream benchmark: what a price tick costs with many portfolio streams open
+(see app.services.portfolio_stream_service).
+
+In one event loop, streams --portfolios portfolios holding --holdings of --tickers tickers each (one
+client per portfolio, reading as fast as it can), then publishes --rounds prices for every ticker.
+Reports:
+  tick_us            hub time per price tick: marking the portfolios that hold the ticker (the
+                     rendering and patching happen when their clients read, below)
+  message_us         per patch a client receives: render (once per portfolio) + merge patch + JSON,
+                     plus the task switch
+  revalued_per_tick  portfolios a tick touches, against --portfolios for a full revaluation
+  bytes              average snapshot size against average patch size
+
+Needs no database:
+    python benchmarks/bench_portfolio_stream.py --portfolios 10000
+Prints one JSON document.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.portfolio_stream_service import PortfolioStreamHub  # noqa: E402
+from app.services.price_stream_service import price_hub  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> dict:
+    hub = PortfolioStreamHub()
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    sizes = {"snapshot": [], "patch": []}
+
+    async def consume(subscription):
+        while True:
+            message = await subscription.next_message()
+            if message is None:
+                return
+            sizes[message[0]].append(len(message[1]))
+
+    subscriptions = []
+    for portfolio_id in range(args.portfolios):
+        subscription = hub.open(portfolio_id)
+        holdings = [(tickers[(portfolio_id * 7 + k) % len(tickers)], 10 + k, Decimal("100.00")) for k in range(args.holdings)]
+        hub.load(portfolio_id, Decimal("50000.00"), holdings, {ticker: Decimal("101.00") for ticker, _, _ in holdings})
+        subscriptions.append(subscription)
+    consumers = [asyncio.ensure_future(consume(subscription)) for subscription in subscriptions]
+    await asyncio.sleep(0.1) # Snapshots
+
+    tick_time, read_time, ticks = 0.0, 0.0, 0
+    for round_number in range(args.rounds):
+        start = time.perf_counter()
+        for i, ticker in enumerate(tickers):
+            hub._on_price(ticker, Decimal(102 + round_number) + Decimal(i % 100) / 100) # What the feed pump calls
+        tick_time += time.perf_counter() - start
+        ticks += len(tickers)
+        start = time.perf_counter()
+        while any(subscription._ready.is_set() for subscription in subscriptions):
+            await asyncio.sleep(0) # Until every client has read its patch
+        read_time += time.perf_counter() - start
+
+    for subscription in subscriptions:
+        subscription.close()
+    await asyncio.gather(*consumers)
+    price_hub.reset()
+
+    patches = len(sizes["patch"])
+    return {
+        "benchmark": "portfolio_stream",
+        "portfolios": args.portfolios,
+        "tickers": args.tickers,
+        "holdings_per_portfolio": args.holdings,
+        "tick_us": round(tick_time / ticks * 1e6, 2),
+        "message_us": round(read_time / max(patches, 1) * 1e6, 2),
+        "revalued_per_tick": round(args.portfolios * args.holdings / args.tickers, 1),
+        "messages": {"snapshot": len(sizes["snapshot"]), "patch": patches},
+        "bytes": {
+            "snapshot": round(sum(sizes["snapshot"]) / max(len(sizes["snapshot"]), 1)),
+            "patch": round(sum(sizes["patch"]) / max(patches, 1)),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--portfolios", type=int, default=10000, help="Streamed portfolios (one client each)")
+    parser.add_argument("--tickers", type=int, default=500, help="Distinct tickers")
+    parser.add_argument("--holdings", type=int, default=8, help="Holdings per portfolio")
+    parser.add_argument("--rounds", type=int, default=5, help="Prices published per ticker")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
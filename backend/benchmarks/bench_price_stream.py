@@ -0,0 +1,112 @@
+"""
+Price stream fan-out benchmark: what a recorded price costs when many clients stream it
+(see app.services.price_stream_service).
+
+In one event loop, opens --subscribers subscriptions spread over --tickers tickers (--per-client each)
+plus one consumer task per subscription standing in for a WebSocket writer, then publishes --rounds
+prices for every ticker. Reports:
+  memory_per_subscriber_bytes  tracemalloc growth per subscription + consumer task
+  publish_us                   time to fan one price out to its subscribers (encoding included)
+  delivery_ms                  p50/p99 from publish to a consumer holding the update
+  conflated                    updates replaced before delivery; with --slow, a share of the consumers
+                               sleeps between reads and shows how conflation bounds their backlog
+
+Needs no database:
+    python benchmarks/bench_price_stream.py --subscribers 10000
+Prints one JSON document.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.price_stream_service import PRICE_STREAM_UPDATES, PriceStreamHub  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> dict:
+    hub = PriceStreamHub()
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    published_at: dict = {}
+    latencies: list = []
+
+    async def consume(subscription, slow: bool):
+        while not subscription.closed:
+            updates = await subscription.next_updates()
+            now = time.perf_counter()
+            latencies.extend(now - published_at[update.price] for update in updates)
+            if slow:
+                await asyncio.sleep(args.slow_delay)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    subscriptions, consumers = [], []
+    for i in range(args.subscribers):
+        subscription = hub.open()
+        subscription.subscribe(tickers[(i + k) % len(tickers)] for k in range(args.per_client))
+        subscriptions.append(subscription)
+        consumers.append(asyncio.ensure_future(consume(subscription, slow=i < args.subscribers * args.slow)))
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    conflated_before = PRICE_STREAM_UPDATES.labels("conflated").value
+    delivered_before = PRICE_STREAM_UPDATES.labels("delivered").value
+    publish_times = []
+    price_id = 0
+    for _ in range(args.rounds):
+        for ticker in tickers:
+            price_id += 1
+            price = Decimal(price_id) / 100 # Unique, so consumers can look up when it was published
+            start = published_at[price] = time.perf_counter()
+            hub.publish(ticker, price)
+            publish_times.append(time.perf_counter() - start)
+        await asyncio.sleep(0.001) # Let the consumers run between rounds, as between ticks
+    await asyncio.sleep(args.slow_delay * 2)
+
+    for subscription in subscriptions:
+        subscription.close()
+    await asyncio.gather(*consumers)
+
+    latencies.sort()
+    return {
+        "benchmark": "price_stream",
+        "subscribers": args.subscribers,
+        "tickers": args.tickers,
+        "tickers_per_subscriber": args.per_client,
+        "slow_share": args.slow,
+        "memory_per_subscriber_bytes": round(memory / args.subscribers),
+        "publish_us": {
+            "subscribers_per_price": round(args.subscribers * args.per_client / args.tickers),
+            "p50": round(statistics.median(publish_times) * 1e6, 1),
+            "max": round(max(publish_times) * 1e6, 1),
+        },
+        "delivery_ms": {
+            "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        },
+        "delivered": PRICE_STREAM_UPDATES.labels("delivered").value - delivered_before,
+        "conflated": PRICE_STREAM_UPDATES.labels("conflated").value - conflated_before,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=10000, help="Concurrent subscriptions")
+    parser.add_argument("--tickers", type=int, default=500, help="Distinct tickers")
+    parser.add_argument("--per-client", type=int, default=5, help="Tickers per subscription")
+    parser.add_argument("--rounds", type=int, default=20, help="Prices published per ticker")
+    parser.add_argument("--slow", type=float, default=0.1, help="Share of consumers that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Seconds a slow consumer sleeps between reads")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Startup benchmark: import time and first-request latency of a fresh process, as a worker boot or
+test collection sees them.
+
+Each run starts a new interpreter and measures, in milliseconds:
+  import_models      `import app.models` (what CLI tools and Alembic scripts pay)
+  import_main        `import main` on top of that (routers, middlewares, create_app())
+  startup            lifespan startup (engine creation and instrumentation)
+  first_request      the first GET / after startup
+It also lists which of the lazily imported dependencies (passlib, jose, requests, multiprocessing,
+database drivers) were loaded by the import alone, so one creeping back to import time shows up.
+
+Runs against the configured DATABASE_URL (no query is made), e.g.:
+    python benchmarks/bench_startup.py --runs 10
+Prints one JSON document with the median and max of each measure.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LAZY_MODULES = ("passlib", "jose", "requests", "multiprocessing", "asyncpg", "aiosqlite", "psycopg2")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.models
+models_done = time.perf_counter()
+import main
+main_done = time.perf_counter()
+loaded = [name for name in LAZY_MODULES if name in sys.modules]
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+startup_start = time.perf_counter()
+client.__enter__()
+startup_done = time.perf_counter()
+response = client.get("/")
+first_done = time.perf_counter()
+client.__exit__(None, None, None)
+assert response.status_code == 200
+print(json.dumps({
+    "import_models": (models_done - start) * 1000,
+    "import_main": (main_done - models_done) * 1000,
+    "startup": (startup_done - startup_start) * 1000,
+    "first_request": (first_done - startup_done) * 1000,
+    "loaded_at_import": loaded,
+}))
+"""
+
+
+def run_once() -> dict:
+    code = f"LAZY_MODULES = {LAZY_MODULES!r}\n" + CHILD
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7, help="Fresh processes to measure")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    measures = {}
+    for name in ("import_models", "import_main", "startup", "first_request"):
+        samples = [run[name] for run in runs]
+        measures[name] = {"median_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1)}
+    total = [sum(run[name] for name in measures) for run in runs]
+    print(json.dumps({
+        "benchmark": "startup",
+        "runs": args.runs,
+        **measures,
+        "total_to_first_response": {"median_ms": round(statistics.median(total), 1), "max_ms": round(max(total), 1)},
+        "loaded_at_import": sorted({name for run in runs for name in run["loaded_at_import"]}),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Trade event relay benchmark: what following the trade_events outbox costs with many consumers
+(see app.services.trade_event_service).
+
+Against a throwaway SQLite file, opens --consumers stream consumers at the head, then commits --events outbox rows in transactions of --per-commit, waking the relay after
+each commit as the trade path does. Reports:
+  outbox_queries        queries the relay made, against one query per consumer and commit if every
+                        consumer polled the database itself
+  delivery_ms           p50/p99 from a commit to a consumer holding its events
+  events_per_second     events delivered to all consumers per second of wall time
+  replay_ms             one extra consumer reading the whole history from offset 0 (from the table
+                        for the events older than the relay's TRADE_EVENT_BUFFER_SIZE)
+
+    python benchmarks/bench_trade_events.py --consumers 1000 --events 20000
+Prints one JSON document.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.models.trade_event_models import DBTradeEvent  # noqa: E402
+from app.services.trade_event_service import TRADE_EVENT_RELAY_READS, TradeEventRelay  # noqa: E402
+
+
+async def run(args: argparse.Namespace, database_url: str) -> dict:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(lambda sync: DBTradeEvent.__table__.create(sync))
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    relay = TradeEventRelay()
+    relay.sessions = sessions
+
+    committed_at: dict = {} # last offset of a commit -> time
+    latencies: list = []
+
+    async def consume(subscription):
+        received = 0
+        while received < args.events:
+            batch = await subscription.next_batch(timeout=5)
+            if not batch:
+                raise RuntimeError("consumer stalled")
+            received += len(batch)
+            offset = subscription.cursor
+            if offset in committed_at:
+                latencies.append(time.perf_counter() - committed_at[offset])
+
+    subscriptions = [await relay.open() for _ in range(args.consumers)]
+    consumers = [asyncio.ensure_future(consume(subscription)) for subscription in subscriptions]
+    reads_before = TRADE_EVENT_RELAY_READS.labels().value
+
+    start = time.perf_counter()
+    offset = 0
+    while offset < args.events:
+        rows = [
+            {
+                "event_id": offset + i + 1, "trade_id": offset + i + 1, "portfolio_id": 1, "ticker_symbol": "AAPL",
+                "trade_type": "BUY", "quantity": 1, "price": Decimal("100.00"), "cash_balance": Decimal("1000.00"),
+                "position_quantity": offset + i + 1, "average_buy_price": Decimal("100.00"),
+            }
+            for i in range(min(args.per_commit, args.events - offset))
+        ]
+        async with sessions() as db:
+            await db.execute(insert(DBTradeEvent), rows)
+            await db.commit()
+        offset += len(rows)
+        committed_at[offset] = time.perf_counter()
+        relay.notify()
+        await asyncio.sleep(0) # Lets the relay and the consumers run between commits, as requests would
+    await asyncio.gather(*consumers)
+    elapsed = time.perf_counter() - start
+    relay_reads = int(TRADE_EVENT_RELAY_READS.labels().value - reads_before)
+
+    replay_start = time.perf_counter()
+    replay = await relay.open(after=0)
+    replayed = 0
+    while replayed < args.events:
+        replayed += len(await replay.next_batch(timeout=5))
+    replay_ms = (time.perf_counter() - replay_start) * 1000
+
+    for subscription in subscriptions + [replay]:
+        subscription.close()
+    await engine.dispose()
+
+    latencies.sort()
+    commits = -(-args.events // args.per_commit)
+    return {
+        "benchmark": "trade_events",
+        "consumers": args.consumers,
+        "events": args.events,
+        "commits": commits,
+        "outbox_queries": relay_reads,
+        "polling_queries_for_comparison": args.consumers * commits,
+        "delivery_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+            "p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else None,
+        },
+        "events_per_second": round(args.events * args.consumers / elapsed),
+        "replay_ms": round(replay_ms, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumers", type=int, default=1000, help="Stream consumers at the head")
+    parser.add_argument("--events", type=int, default=20000, help="Outbox rows committed")
+    parser.add_argument("--per-commit", type=int, default=10, help="Rows per transaction")
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="bench-trade-events-")
+    try:
+        print(json.dumps(asyncio.run(run(args, f"sqlite+aiosqlite:///{os.path.join(directory, 'events.db')}")), indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
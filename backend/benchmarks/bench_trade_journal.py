@@ -0,0 +1,104 @@
+"""
+Trade journal benchmark: appending to and recovering from the binary trade journal
+(see app.services.trade_journal_service).
+
+In a throwaway directory, appends --records trade records over --portfolios portfolios and --tickers
+tickers, then recovers the position book twice: from the journal alone (full replay) and from a
+snapshot taken --tail records before the end (snapshot + tail, what a restart does). Reports:
+  append_us              per record, flush included
+  replay_records_per_s   sequential replay of the memory-mapped segments into the book
+  recovery_ms            full replay against snapshot + tail
+  bytes_per_record       on disk, against the same trades as JSON lines
+
+Needs no database:
+    python benchmarks/bench_trade_journal.py --records 1000000
+Prints one JSON document.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.trade_journal_service import (  # noqa: E402
+    RECORD_SIZE, JournalRecord, PositionBook, TradeJournal, recover, write_snapshot,
+)
+
+
+def records(args: argparse.Namespace):
+    rng = random.Random(7)
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    for offset in range(1, args.records + 1):
+        yield JournalRecord(
+            offset, offset, rng.randrange(args.portfolios), 1_700_000_000_000_000 + offset, rng.randrange(1_000, 100_000),
+            rng.randrange(1_000, 100_000), rng.randrange(10_000_000), rng.randrange(1, 100), rng.randrange(0, 1_000),
+            rng.choice(tickers), rng.choice(("BUY", "SELL")),
+        )
+
+
+def run(args: argparse.Namespace, directory: str) -> dict:
+    journal = TradeJournal(directory, writable=True)
+    start = time.perf_counter()
+    batch = []
+    for record in records(args):
+        batch.append(record)
+        if len(batch) == 500: # One outbox batch
+            journal.append(batch)
+            batch = []
+    journal.append(batch)
+    journal.flush()
+    append_time = time.perf_counter() - start
+    sample = next(records(args))
+
+    start = time.perf_counter()
+    full, _, replayed = recover(journal)
+    full_time = time.perf_counter() - start
+
+    snapshot = PositionBook()
+    for record in journal.replay():
+        if record.offset > args.records - args.tail:
+            break
+        snapshot.apply(record)
+    write_snapshot(directory, snapshot.dump(), snapshot.offset)
+    start = time.perf_counter()
+    book, snapshot_offset, tail_replayed = recover(journal)
+    tail_time = time.perf_counter() - start
+    assert book.portfolios == full.portfolios
+    journal.close()
+
+    return {
+        "benchmark": "trade_journal",
+        "records": args.records,
+        "segments": -(-args.records // journal.segment_records),
+        "append_us": round(append_time / args.records * 1e6, 3),
+        "replay_records_per_s": round(replayed / full_time),
+        "recovery_ms": {
+            "full_replay": round(full_time * 1000, 1),
+            "snapshot_plus_tail": round(tail_time * 1000, 1),
+            "tail_records": tail_replayed,
+        },
+        "bytes_per_record": {"journal": RECORD_SIZE, "json_lines": len(json.dumps(sample._asdict())) + 1},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000, help="Trade records appended")
+    parser.add_argument("--portfolios", type=int, default=10_000, help="Distinct portfolios")
+    parser.add_argument("--tickers", type=int, default=500, help="Distinct tickers")
+    parser.add_argument("--tail", type=int, default=10_000, help="Records after the snapshot")
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="bench-trade-journal-")
+    try:
+        print(json.dumps(run(args, directory), indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Trade execution microbenchmarks: times each stage of crud_trade.create_portfolio_trade (the async
+version the routes use) on its own, against the configured DATABASE_URL, so a regression in one
+stage is not hidden by the others.
+
+Stages:
+  price_cache_hit    get_price_for_trade_async for a ticker with a fresh cache row
+  price_cache_miss   the same for an unseen ticker: cache lookup, Finnhub call, cache upsert + commit.
+                     The Finnhub call is replaced by an in-process quote unless --finnhub-base-url is
+                     given (e.g. benchmarks/finnhub_stub.py), so by default only our own overhead counts
+  holding_lookup     crud_holding.get_holding_by_portfolio_and_ticker
+  average_cost       trade_rules.average_price_after_buy (integer micro-unit math only)
+  commit_refresh     commit of a staged trade (trade, cash and holding rows) plus refresh of the trade
+  create_trade       the whole create_portfolio_trade with a cached price, for reference
+
+Each run is appended as one JSON line (with the git sha) to --history, and every stage is compared
+with the last recorded run on the same database dialect; stages whose median got slower than
+--regression-threshold are listed under "regressions". Use a migrated local database, e.g.:
+    python benchmarks/bench_trade_path.py --iterations 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Awaitable, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.config import settings  # noqa: E402
+from app.crud.aio import crud_holding, crud_trade  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine  # noqa: E402
+from app.models import DBPortfolio, DBUser, TradeCreate, TradeTypeEnum  # noqa: E402 -- registers every model
+from app.services import market_data_service, money, trade_rules  # noqa: E402
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(BENCHMARKS_DIR, "results", "trade_path.jsonl")
+STAGES = ("price_cache_hit", "price_cache_miss", "holding_lookup", "average_cost", "commit_refresh", "create_trade")
+HOT_TICKER = "BENCH"
+STAND_IN_PRICE = Decimal("123.45")
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_us(samples: list[float]) -> dict:
+    """Per-operation statistics in microseconds."""
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered)
+    return {
+        "iterations": len(ordered),
+        "mean_us": round(mean * 1e6, 2),
+        "p50_us": round(percentile(ordered, 50) * 1e6, 2),
+        "p95_us": round(percentile(ordered, 95) * 1e6, 2),
+        "p99_us": round(percentile(ordered, 99) * 1e6, 2),
+        "ops_per_s": round(1 / mean, 1) if mean else 0.0,
+    }
+
+
+async def time_stage(step: Callable[[int], Awaitable[float | None]], iterations: int, warmup: int) -> dict:
+    """
+    Runs step(i) warmup + iterations times. A step returns its own elapsed seconds when only part of
+    it should count (e.g. the commit but not the staging before it), or None to be timed whole.
+    """
+    samples = []
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        measured = await step(i)
+        elapsed = time.perf_counter() - start if measured is None else measured
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize_us(samples)
+
+# --- Fixtures ---
+
+async def create_fixtures(run_id: str) -> int:
+    """A user and a portfolio holding HOT_TICKER, plus a fresh cache row for it. Returns the portfolio id."""
+    async with AsyncSessionLocal() as db:
+        user = DBUser(username=f"bench_{run_id}", email=f"bench_{run_id}@example.com", password_hash="x")
+        db.add(user)
+        await db.flush()
+        portfolio = DBPortfolio(user_id=user.user_id, portfolio_name="trade path bench", cash_balance=Decimal("1000000000"))
+        db.add(portfolio)
+        await db.commit()
+        await market_data_service.update_cache_entry_async(db, HOT_TICKER, STAND_IN_PRICE)
+        await crud_trade.create_portfolio_trade(
+            db, TradeCreate(ticker_symbol=HOT_TICKER, trade_type=TradeTypeEnum.BUY, quantity=100, price=STAND_IN_PRICE),
+            portfolio.portfolio_id,
+        )
+        return portfolio.portfolio_id
+
+def use_finnhub_stand_in(base_url: str | None) -> None:
+    if not settings.FINNHUB_API_KEY:
+        settings.FINNHUB_API_KEY = "bench"
+    if base_url:
+        market_data_service.FINNHUB_BASE_URL = base_url.rstrip("/")
+    else:
+        market_data_service._call_finnhub_quote = lambda ticker: (STAND_IN_PRICE, "realtime_finnhub")
+
+# --- Stages ---
+
+async def run_stages(args: argparse.Namespace, portfolio_id: int, run_id: str) -> dict:
+    results = {}
+    async with AsyncSessionLocal() as db:
+        async def price_cache_hit(i):
+            await market_data_service.get_price_for_trade_async(db, HOT_TICKER)
+
+        async def price_cache_miss(i):
+            await market_data_service.get_price_for_trade_async(db, f"M{run_id[:6]}{i}")
+
+        async def holding_lookup(i):
+            await crud_holding.get_holding_by_portfolio_and_ticker(db, portfolio_id=portfolio_id, ticker_symbol=HOT_TICKER)
+
+        held_quantity, held_average, price = 1000, money.to_micros(Decimal("101.37")), money.to_micros(STAND_IN_PRICE)
+        async def average_cost(i):
+            # Many calls per sample: one call is too short to time on its own
+            start = time.perf_counter()
+            for _ in range(100):
+                trade_rules.average_price_after_buy(held_quantity, held_average, price, 7)
+            return (time.perf_counter() - start) / 100
+
+        portfolio = await db.get(DBPortfolio, portfolio_id)
+        async def commit_refresh(i):
+            trade = TradeCreate(
+                ticker_symbol=HOT_TICKER, trade_type=TradeTypeEnum.BUY if i % 2 == 0 else TradeTypeEnum.SELL,
+                quantity=1, price=STAND_IN_PRICE,
+            )
+            db_trade, _, _ = await crud_trade.stage_portfolio_trade(db, portfolio, trade, STAND_IN_PRICE)
+            start = time.perf_counter()
+            await db.commit()
+            await db.refresh(db_trade)
+            return time.perf_counter() - start
+
+        async def create_trade(i):
+            trade = TradeCreate(
+                ticker_symbol=HOT_TICKER, trade_type=TradeTypeEnum.BUY if i % 2 == 0 else TradeTypeEnum.SELL, quantity=1
+            )
+            await crud_trade.create_portfolio_trade(db, trade, portfolio_id)
+
+        steps = {
+            "price_cache_hit": price_cache_hit,
+            "price_cache_miss": price_cache_miss,
+            "holding_lookup": holding_lookup,
+            "average_cost": average_cost,
+            "commit_refresh": commit_refresh,
+            "create_trade": create_trade,
+        }
+        for name in args.stages:
+            results[name] = await time_stage(steps[name], args.iterations, args.warmup)
+    return results
+
+# --- History ---
+
+def git_sha() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def previous_run(history_path: str, dialect: str) -> dict | None:
+    if not os.path.exists(history_path):
+        return None
+    last = None
+    with open(history_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("dialect") == dialect:
+                last = record
+    return last
+
+def compare(stages: dict, previous: dict | None, threshold: float) -> tuple[dict, list[str]]:
+    """Median ratio of each stage against the previous run, and the stages slower than threshold."""
+    if previous is None:
+        return {}, []
+    ratios, regressions = {}, []
+    for name, stats in stages.items():
+        before = previous.get("stages", {}).get(name)
+        if not before or not before.get("p50_us"):
+            continue
+        ratio = round(stats["p50_us"] / before["p50_us"], 3)
+        ratios[name] = ratio
+        if ratio > threshold:
+            regressions.append(name)
+    return ratios, regressions
+
+
+async def run(args: argparse.Namespace) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    use_finnhub_stand_in(args.finnhub_base_url)
+    try:
+        portfolio_id = await create_fixtures(run_id)
+        stages = await run_stages(args, portfolio_id, run_id)
+    finally:
+        await async_engine.dispose()
+    return {
+        "benchmark": "trade_path",
+        "git_sha": git_sha(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "dialect": async_engine.dialect.name,
+        "finnhub": args.finnhub_base_url or "in_process",
+        "stages": stages,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300, help="Timed iterations per stage")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed iterations before each stage")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--finnhub-base-url", help="Real HTTP Finnhub (stand-in) for price_cache_miss")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file the run is appended to")
+    parser.add_argument("--no-record", action="store_true", help="Compare with the history but do not append")
+    parser.add_argument("--regression-threshold", type=float, default=1.2, help="Median ratio flagged as a regression")
+    args = parser.parse_args()
+
+    record = asyncio.run(run(args))
+    ratios, regressions = compare(record["stages"], previous_run(args.history, record["dialect"]), args.regression_threshold)
+    if not args.no_record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    print(json.dumps({**record, "p50_ratio_vs_previous": ratios, "regressions": regressions}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Local Finnhub stand-in for benchmarks: serves GET /quote?symbol=...&token=... like Finnhub's quote API.
+
+Prices follow a small random walk per symbol and every response waits --latency-ms first, so
+cache misses cost roughly what a real Finnhub round trip would without depending on the network
+or the free-tier rate limit. Point the app at it with FINNHUB_BASE_URL, e.g.:
+    python benchmarks/finnhub_stub.py --port 9100 --latency-ms 80
+    FINNHUB_BASE_URL=http://127.0.0.1:9100 FINNHUB_API_KEY=stub uvicorn main:app
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI, Query
+
+stub = FastAPI(title="Finnhub stand-in")
+stub.state.latency_s = 0.08
+_prices: dict[str, float] = {}
+
+
+@stub.get("/quote")
+async def quote(symbol: str = Query(...), token: str = Query("")):
+    await asyncio.sleep(stub.state.latency_s)
+    previous = _prices.get(symbol, random.uniform(50, 500))
+    price = round(max(1.0, previous * (1 + random.gauss(0, 0.002))), 2)
+    _prices[symbol] = price
+    return {"c": price, "pc": round(previous, 2), "t": int(time.time())}
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Delay before every quote response")
+    args = parser.parse_args()
+    stub.state.latency_s = args.latency_ms / 1000
+    uvicorn.run(stub, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
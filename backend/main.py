@@ -1,18 +1,89 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
+
+from app import database
+from app.config import settings
+from app.middleware.query_stats import instrument_engine
+from app.services.invalidation_service import invalidation_bus
+from app.services.trade_journal_service import trade_journal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engines (and their drivers and pools) are created at startup, not when the app module is imported.
+    engines = database.init_engines()
+    # Per-request SQL statement count and DB time (response headers, budget warnings)
+    instrument_engine(engines.engine)
+    instrument_engine(engines.async_engine.sync_engine)
+    if engines.replica_async_engine is not None:
+        instrument_engine(engines.replica_async_engine.sync_engine)
+    # Cache events from the other workers (PostgreSQL only)
+    await invalidation_bus.start()
+    # Position book from the journal's newest snapshot and tail (TRADE_JOURNAL_DIR only)
+    await trade_journal.start()
+    yield
+    await trade_journal.stop()
+    await invalidation_bus.stop()
+    # Pooled async connections belong to this event loop; close them with it.
+    await engines.async_engine.dispose()
+    if engines.replica_async_engine is not None:
+        await engines.replica_async_engine.dispose()
+
+
+def create_app() -> FastAPI:
+    """
+    Builds the application: middlewares and routers. Importing this module only defines the factory and the
+    default `app`; engines are created by the lifespan. Run with `uvicorn main:app`, or
+    `uvicorn --factory main:create_app` to build the app in each worker.
+    """
+    from app.middleware.compression import CompressionMiddleware
+    from app.middleware.metrics import MetricsMiddleware
+    from app.middleware.profiling import ProfilingMiddleware
+    from app.middleware.query_stats import QueryStatsMiddleware
+    from app.routes.responses import validation_error_handler
+    from app.routes import (
+        admin_routes,
+        backtest_routes,
+        leaderboard_routes,
+        market_data_routes,
+        monitoring_routes,
+        portfolio_routes,
+        trade_event_routes,
+        trade_routes,
+        user_routes,
+    )
+
+    settings.log_warnings()
+    app = FastAPI(lifespan=lifespan)
+    app.add_exception_handler(RequestValidationError, validation_error_handler)
+
+    # On-demand cProfile of selected requests (innermost, so it profiles the handler, not the other middlewares)
+    if settings.PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(QueryStatsMiddleware)
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(CompressionMiddleware)
+    # Per-route request counts, errors and latency for /metrics (outermost, so it times everything)
+    app.add_middleware(MetricsMiddleware)
 
-app = FastAPI()
+    app.include_router(user_routes.router)
+    app.include_router(portfolio_routes.router) # Handles /portfolios
+    # trade_routes router will handle paths like /portfolios/{portfolio_id}/trades
+    app.include_router(trade_routes.router, prefix="/portfolios/{portfolio_id}/trades")
+    app.include_router(market_data_routes.router) # Handles /marketdata
+    app.include_router(leaderboard_routes.router)
+    app.include_router(backtest_routes.router)
+    app.include_router(monitoring_routes.router)
+    app.include_router(admin_routes.router)
+    app.include_router(trade_event_routes.router)
 
-# Import routers
-from app.routes import user_routes
-from app.routes import portfolio_routes
-from app.routes import trade_routes
+    @app.get("/")
+    async def root():
+        return {"message": "Hello World"}
 
-app.include_router(user_routes.router)
-app.include_router(portfolio_routes.router) # Handles /portfolios
-# trade_routes router will handle paths like /portfolios/{portfolio_id}/trades
-app.include_router(trade_routes.router, prefix="/portfolios/{portfolio_id}/trades")
+    return app
 
 
-@app.get("/")
-async def root():
-    return {"message": "Hello World"}
+app = create_app()
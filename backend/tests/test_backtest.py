@@ -0,0 +1,64 @@
+import json
+import math
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from app.services import backtest_service
+
+# The engine is pure and in-memory, so these tests need no database (except the route's).
+
+def _synthetic_closes(bar_count: int) -> list[float]:
+    # A trending sine wave: produces regular crossovers and a rising price level.
+    return [round(100 + i * 0.05 + 10 * math.sin(i / 15), 2) for i in range(bar_count)]
+
+
+def test_backtest_no_crossover_keeps_cash():
+    summary = backtest_service.run_backtest([100.0] * 50, 3, 10, Decimal("1000.00"))
+    assert summary.trade_count == 0
+    assert summary.final_value == Decimal("1000.00")
+    assert summary.total_return_pct == Decimal("0.0000")
+
+
+def test_backtest_follows_trade_rules():
+    # Flat, then a rally (fast SMA crosses above -> BUY), then a slump (crosses below -> SELL).
+    closes = [10.0] * 5 + [11.0, 12.0, 13.0, 14.0] + [9.0, 8.0, 7.0, 6.0]
+    summary = backtest_service.run_backtest(closes, 2, 4, Decimal("100.00"))
+
+    assert summary.trade_count == 2
+    # Bought 9 whole shares at 11.00 (cash 1.00), sold all 9 at 9.00 on the cross back down.
+    assert summary.final_value == Decimal("82.00")
+    assert summary.total_return_pct == Decimal("-18.0000")
+    assert summary.max_drawdown_pct > 0
+
+
+def test_parameter_sweep_parallel_matches_serial():
+    closes = _synthetic_closes(600)
+    grid = backtest_service.build_param_grid([5, 10, 20], [30, 50])
+    assert len(grid) == 6
+
+    serial = backtest_service.run_parameter_sweep(closes, grid, Decimal("100000.00"), max_workers=1)
+    parallel = backtest_service.run_parameter_sweep(closes, grid, Decimal("100000.00"), max_workers=2)
+    assert serial == parallel
+    assert [(s.fast_window, s.slow_window) for s in serial] == [(p.fast_window, p.slow_window) for p in grid]
+
+
+def test_ten_year_daily_backtest():
+    summary = backtest_service.run_backtest(_synthetic_closes(252 * 10), 20, 50, Decimal("100000.00"))
+    assert summary.bar_count == 2520
+    assert summary.trade_count > 0 # Timing is in benchmarks/bench_backtest.py
+
+
+def test_backtest_request_validation(client: TestClient, get_test_user_token: str):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    request = {"ticker_symbol": "aapl", "fast_windows": [2], "slow_windows": [4]}
+    for bad_close in (float("nan"), float("inf"), 0.0, -1.0):
+        closes = [10.0] * 5 + [bad_close] + [11.0] * 5
+        body = json.dumps({**request, "closes": closes}) # NaN/Infinity literals, which the JSON parser accepts
+        response = client.post("/backtests/", content=body, headers={**headers, "Content-Type": "application/json"})
+        assert response.status_code == 422, bad_close
+        assert response.json()["detail"][0]["loc"] == ["body", "closes", 5]
+
+    response = client.post("/backtests/", json={**request, "closes": [10.0] * 10, "starting_cash": 0}, headers=headers)
+    assert response.status_code == 201
+    assert [(r["starting_cash"], r["final_value"]) for r in response.json()] == [("0.00", "0.00")] # Not the default
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def portfolio(client: TestClient, get_test_user_token: str) -> tuple[dict, int]:
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Polled"}, headers=headers).json()["portfolio_id"]
+    client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 10, "price": 150.00}, headers=headers)
+    return headers, portfolio_id
+
+def revalidate(client: TestClient, url: str, headers: dict, etag: str):
+    return client.get(url, headers={**headers, "If-None-Match": etag})
+
+def test_unchanged_lists_return_304_without_the_list_query(client: TestClient, portfolio):
+    headers, portfolio_id = portfolio
+    for url in (f"/portfolios/{portfolio_id}/holdings", f"/portfolios/{portfolio_id}/trades/", f"/portfolios/{portfolio_id}", "/portfolios/"):
+        first = client.get(url, headers=headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        again = revalidate(client, url, headers, etag)
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+        if url.endswith(("holdings", "trades/")):
+            assert int(again.headers["x-db-query-count"]) < int(first.headers["x-db-query-count"])
+
+        assert revalidate(client, url, headers, 'W/"stale", ' + etag).status_code == 304
+        assert revalidate(client, url, headers, 'W/"stale"').status_code == 200
+
+def test_writes_change_the_etags(client: TestClient, portfolio):
+    headers, portfolio_id = portfolio
+    trades_url, holdings_url = f"/portfolios/{portfolio_id}/trades/", f"/portfolios/{portfolio_id}/holdings"
+
+    def etags():
+        return {url: client.get(url, headers=headers).headers["etag"]
+                for url in (trades_url, holdings_url, f"/portfolios/{portfolio_id}", "/portfolios/")}
+
+    before = etags()
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "SELL", "quantity": 5, "price": 155.00}, headers=headers)
+    after_trade = etags()
+    assert all(after_trade[url] != before[url] for url in before)
+    assert revalidate(client, holdings_url, headers, before[holdings_url]).status_code == 200
+
+    trade_id = client.get(trades_url, headers=headers).json()[0]["trade_id"]
+    client.put(f"{trades_url}{trade_id}", json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 11, "price": 150.00}, headers=headers)
+    after_update = etags()
+    assert after_update[trades_url] != after_trade[trades_url]
+
+    client.put(f"/portfolios/{portfolio_id}", json={"portfolio_name": "Renamed"}, headers=headers)
+    after_rename = etags()
+    assert after_rename[f"/portfolios/{portfolio_id}"] != after_update[f"/portfolios/{portfolio_id}"]
+
+    client.post("/portfolios/", json={"portfolio_name": "Second"}, headers=headers)
+    assert etags()["/portfolios/"] != after_rename["/portfolios/"]
+
+def test_etags_depend_on_page_and_format(client: TestClient, portfolio):
+    headers, portfolio_id = portfolio
+    url = f"/portfolios/{portfolio_id}/trades/"
+    etag = client.get(url, headers=headers).headers["etag"]
+    assert client.get(f"{url}?limit=1", headers={**headers, "If-None-Match": etag}).status_code == 200
+    assert client.get(url, headers={**headers, "If-None-Match": etag, "Accept": "application/msgpack"}).status_code == 200
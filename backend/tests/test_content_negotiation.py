@@ -0,0 +1,113 @@
+import gzip
+
+import msgpack
+import pytest
+import zstandard
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.compression import CompressionMiddleware
+from app.services.encoding_service import JSON_FORMAT, choose_encoding, encode_msgpack, negotiate_format
+
+MSGPACK = "application/msgpack"
+
+@pytest.fixture
+def portfolio_with_trades(client: TestClient, get_test_user_token: str) -> tuple[dict, int]:
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Negotiation"}, headers=headers).json()["portfolio_id"]
+    for quantity, price in ((5, 300.00), (2, 2500.50)):
+        client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "MSFT", "trade_type": "BUY", "quantity": quantity, "price": price}, headers=headers)
+    return headers, portfolio_id
+
+def test_negotiate_format():
+    assert negotiate_format(None) is JSON_FORMAT
+    assert negotiate_format("*/*") is JSON_FORMAT
+    assert negotiate_format("application/msgpack;q=0.5, application/json") is JSON_FORMAT
+    assert negotiate_format("application/msgpack, */*;q=0.1").media_type == MSGPACK
+    assert negotiate_format("application/x-msgpack").decimal_scale is None
+    assert negotiate_format("application/msgpack; decimal-scale=2").decimal_scale == 2
+    assert negotiate_format("application/msgpack; decimal-scale=99").decimal_scale is None # Out of range: strings
+
+    assert choose_encoding("gzip, zstd") == "zstd"
+    assert choose_encoding("gzip, zstd;q=0.5") == "gzip"
+    assert choose_encoding("br, identity") is None
+    assert choose_encoding("*;q=0, gzip;q=0") is None
+
+def test_msgpack_fixed_point_decimals():
+    from decimal import Decimal
+    assert msgpack.unpackb(encode_msgpack({"p": Decimal("2500.5")})) == {"p": "2500.5"}
+    assert msgpack.unpackb(encode_msgpack({"p": Decimal("2500.5")}, decimal_scale=2)) == {"p": 250050}
+    assert msgpack.unpackb(encode_msgpack([Decimal("0.125"), Decimal("0.135")], decimal_scale=2)) == [12, 14] # Half-even
+
+def test_trade_list_as_msgpack(client: TestClient, portfolio_with_trades):
+    headers, portfolio_id = portfolio_with_trades
+    as_json = client.get(f"/portfolios/{portfolio_id}/trades/", headers=headers)
+    assert as_json.headers["content-type"] == "application/json"
+    assert "Accept" in as_json.headers["vary"]
+
+    response = client.get(f"/portfolios/{portfolio_id}/trades/", headers={**headers, "Accept": MSGPACK})
+    assert response.headers["content-type"] == MSGPACK
+    trades = msgpack.unpackb(response.content, timestamp=3) # Timestamps as datetimes
+    assert [t["price"] for t in trades] == ["300.00", "2500.50"]
+    assert [t["trade_id"] for t in trades] == [t["trade_id"] for t in as_json.json()]
+    assert trades[0]["timestamp"].tzinfo is not None
+
+    response = client.get(f"/portfolios/{portfolio_id}/trades/", headers={**headers, "Accept": f"{MSGPACK}; decimal-scale=2"})
+    assert response.headers["content-type"] == f"{MSGPACK}; decimal-scale=2"
+    assert [t["price"] for t in msgpack.unpackb(response.content)] == [30000, 250050]
+
+def test_model_routes_as_msgpack(client: TestClient, portfolio_with_trades):
+    headers, portfolio_id = portfolio_with_trades
+    headers = {**headers, "Accept": f"{MSGPACK}; decimal-scale=2"}
+
+    created = client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "NVDA", "trade_type": "BUY", "quantity": 1, "price": 200.00}, headers=headers)
+    assert created.status_code == 201
+    assert msgpack.unpackb(created.content)["price"] == 20000
+
+    portfolio = msgpack.unpackb(client.get(f"/portfolios/{portfolio_id}", headers=headers).content)
+    assert portfolio["portfolio_id"] == portfolio_id
+    quotes = msgpack.unpackb(client.get("/marketdata/?tickers=aapl,MSFT", headers=headers).content)
+    assert set(quotes["prices"]) == {"AAPL", "MSFT"}
+    assert all(isinstance(price, int) for price in quotes["prices"].values())
+
+    # Errors keep their JSON body
+    missing = client.get("/portfolios/999999", headers=headers)
+    assert missing.status_code == 404
+    assert missing.headers["content-type"] == "application/json"
+
+def test_large_responses_are_compressed(client: TestClient, portfolio_with_trades, monkeypatch):
+    headers, portfolio_id = portfolio_with_trades
+    middleware = next(m for m in client.app.user_middleware if m.cls is CompressionMiddleware)
+    monkeypatch.setitem(middleware.kwargs, "minimum_size", 100)
+    client.app.middleware_stack = None # Rebuild with the lowered threshold
+
+    url = f"/portfolios/{portfolio_id}/trades/"
+    plain = client.get(url, headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    for encoding, decompress in (("gzip", gzip.decompress), ("zstd", zstandard.ZstdDecompressor().decompress)):
+        # Read the raw bytes: the test client would transparently decode gzip
+        with client.stream("GET", url, headers={**headers, "Accept-Encoding": encoding}) as response:
+            assert response.headers["content-encoding"] == encoding
+            assert "Accept-Encoding" in response.headers["vary"]
+            body = b"".join(response.iter_raw())
+        assert int(response.headers["content-length"]) == len(body)
+        assert decompress(body) == plain.content
+    client.app.middleware_stack = None
+
+def test_small_and_streamed_responses_are_not_compressed():
+    app = FastAPI()
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("x" * 10)
+
+    @app.get("/streamed")
+    def streamed():
+        return StreamingResponse(iter([b"x" * 2000, b"y" * 2000]), media_type="text/plain")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    with TestClient(app) as c:
+        for path in ("/small", "/streamed"):
+            with c.stream("GET", path, headers={"Accept-Encoding": "gzip"}) as response:
+                assert "content-encoding" not in response.headers
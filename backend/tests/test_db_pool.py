@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from app.database import instrumented_pool_class
+from app.services.metrics_service import Histogram, pool_metrics
+
+# A throwaway SQLite engine is enough to exercise the pool instrumentation.
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.01": 1, "0.1": 3, "1.0": 4, "+Inf": 5}
+    assert snapshot["count"] == 5
+    assert snapshot["sum"] == pytest.approx(5.605)
+
+def test_pool_records_checkout_waits_and_timeouts():
+    metrics = pool_metrics("test_pool")
+    test_engine = create_engine(
+        "sqlite://",
+        poolclass=instrumented_pool_class(QueuePool, "test_pool"),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    try:
+        with test_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            assert test_engine.pool.checkedout() == 1
+            with pytest.raises(exc.TimeoutError):
+                test_engine.connect() # The only connection is checked out
+        assert metrics.timeouts == 1
+        assert metrics.wait_seconds.snapshot()["count"] == 2
+
+        test_engine.dispose() # The recreated pool keeps reporting to the same metrics
+        with test_engine.connect():
+            pass
+        assert metrics.wait_seconds.snapshot()["count"] == 3
+    finally:
+        test_engine.dispose()
@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from app.services.holdings_index_service import HOLDINGS_INDEX_LOOKUPS, HoldingsIndex, holdings_index
+
+
+def lookups(result: str) -> int:
+    return HOLDINGS_INDEX_LOOKUPS.labels(result).value
+
+def test_index_serves_only_the_loaded_version():
+    index = HoldingsIndex()
+    token = index.load(1, 3, [("AAPL", 10, Decimal("150.00")), ("MSFT", 0, Decimal("1.00"))])
+    holdings, _ = index.lookup(1, 3)
+    assert holdings == {"AAPL": (10, 150_000_000)} # Empty positions are not kept
+    assert index.lookup(1, 4) is None and index.lookup(2, 3) is None
+
+    # The trade's own event, then its confirm: the entry is exact at the new version
+    index.on_trade_committed(1, Decimal("0"), "AAPL", 4, Decimal("150.00"))
+    assert index.lookup(1, 3) is None # Untagged until confirmed
+    index.confirm(1, token, 4)
+    assert index.lookup(1, 4)[0] == {"AAPL": (4, 150_000_000)}
+    assert holdings == {"AAPL": (10, 150_000_000)} # A reader's reference is never changed under it
+
+    # Another worker's trade lands between this worker's event and its confirm: stays untagged
+    _, token = index.lookup(1, 4)
+    index.on_trade_committed(1, Decimal("0"), "AAPL", 0, None)
+    index.on_trade_committed(1, Decimal("0"), "MSFT", 5, Decimal("10.00"))
+    index.confirm(1, token, 5)
+    assert index.lookup(1, 5) is None
+
+    # Another worker committed between this worker's read and its commit, and its event is not here
+    # yet: the commit left the portfolio at more than the loaded version + 1, so the entry stays untagged
+    token = index.load(1, 6, [])
+    index.on_trade_committed(1, Decimal("0"), "AAPL", 1, Decimal("10.00"))
+    index.confirm(1, token, 8)
+    assert index.lookup(1, 8) is None and index.lookup(1, 7) is None
+
+    index.load(1, 6, [])
+    index.on_portfolio_removed(1)
+    assert index.stats() == {"portfolios": 0, "holdings": 0}
+
+def test_index_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr("app.config.settings.HOLDINGS_INDEX_MAX_PORTFOLIOS", 2)
+    index = HoldingsIndex()
+    index.load(1, 1, [])
+    index.load(2, 1, [])
+    index.lookup(1, 1)
+    index.load(3, 1, [])
+    assert index.lookup(2, 1) is None
+    assert index.lookup(1, 1) is not None and index.lookup(3, 1) is not None
+
+def test_trades_are_checked_against_the_index(client: TestClient, get_test_user_token: str):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Indexed"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+
+    def trade(trade_type: str, quantity: int, price: float = 10.00):
+        return client.post(
+            trades_url, json={"ticker_symbol": "AAPL", "trade_type": trade_type, "quantity": quantity, "price": price},
+            headers=headers,
+        )
+
+    hits, misses = lookups("hit"), lookups("miss")
+    first = trade("BUY", 10)
+    assert first.status_code == 201
+    assert (lookups("hit") - hits, lookups("miss") - misses) == (0, 1) # Loaded from the database
+    second = trade("BUY", 10, 20.00)
+    assert second.status_code == 201
+    assert lookups("hit") - hits == 1
+    assert int(second.headers["x-db-query-count"]) < int(first.headers["x-db-query-count"])
+
+    assert trade("SELL", 21).status_code == 400 # Oversell caught from the index
+    assert trade("SELL", 5).status_code == 201 # Partial sell: the row is updated by statement
+    holdings = client.get(f"/portfolios/{portfolio_id}/holdings", headers=headers).json()
+    assert [(h["ticker_symbol"], h["quantity"], h["average_buy_price"]) for h in holdings] == [("AAPL", 15, "15.00")]
+
+    # A trade on another worker untags the entry: the next trade reloads from the database
+    holdings_index.on_trade_committed(portfolio_id, Decimal("0"), "AAPL", 15, Decimal("15.00"))
+    misses = lookups("miss")
+    assert trade("SELL", 15).status_code == 201 # Closes the position: the row is deleted by statement
+    assert lookups("miss") - misses == 1
+    assert client.get(f"/portfolios/{portfolio_id}/holdings", headers=headers).json() == []
+    assert holdings_index.lookup(portfolio_id, 0) is None
+
+    assert trade("SELL", 1).status_code == 400
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import Base
+from app.models.user_models import DBUser, User
+from app.services import auth_service
+from app.services.invalidation_service import (
+    INVALIDATION_LATENCY, MAX_PAYLOAD_BYTES, RESYNC, InvalidationBus, bus_dsn, invalidation_bus,
+)
+
+def notification(*events, origin: str = "other-worker", sent_at: float | None = None) -> str:
+    """A NOTIFY payload as another worker would send it."""
+    return json.dumps({"o": origin, "t": sent_at or time.time(), "e": [list(e) for e in events]})
+
+def test_events_apply_here_and_from_other_workers():
+    bus = InvalidationBus()
+    applied, resyncs = [], []
+    bus.register("price", lambda *args: 1 / 0) # A failing cache neither fails the publisher nor the other caches
+    bus.register("price", lambda ticker, price: applied.append((ticker, Decimal(price))))
+    bus.register_resync(lambda: resyncs.append(True))
+
+    bus.publish("price", "AAPL", Decimal("1.50"))
+    assert applied == [("AAPL", Decimal("1.50"))]
+    assert not bus._outbox # Not started: nothing to send
+
+    latency = INVALIDATION_LATENCY.labels().snapshot()
+    bus._on_notification(None, 0, "cache_invalidation", notification(["price", "MSFT", "2.25"], [RESYNC], sent_at=time.time() - 0.05))
+    bus._on_notification(None, 0, "cache_invalidation", notification(["price", "TSLA", "3"], origin=bus.origin)) # Its own
+    bus._on_notification(None, 0, "cache_invalidation", "not json")
+    assert applied == [("AAPL", Decimal("1.50")), ("MSFT", Decimal("2.25"))]
+    assert resyncs == [True]
+    after = INVALIDATION_LATENCY.labels().snapshot()
+    assert after["count"] == latency["count"] + 1
+    assert after["sum"] - latency["sum"] >= 0.05
+
+def test_events_are_sent_in_batches_that_fit_a_notification():
+    bus = InvalidationBus()
+    for i in range(1000):
+        bus._outbox.append((time.time(), ["trade", i, Decimal("99000.00"), f"T{i}", 10, Decimal("12.34")]))
+    payload, count = bus._next_batch()
+    message = json.loads(payload)
+    assert len(payload.encode()) <= MAX_PAYLOAD_BYTES
+    assert 100 < count < 1000 and len(message["e"]) == count
+    assert message["o"] == bus.origin and message["e"][0] == ["trade", 0, "99000.00", "T0", 10, "12.34"]
+
+    bus._outbox.clear()
+    bus._outbox.append((time.time(), ["user", "x" * MAX_PAYLOAD_BYTES]))
+    payload, count = bus._next_batch()
+    assert count == 1 and json.loads(payload)["e"] == [[RESYNC]] # Too large: the others drop their caches instead
+
+def test_events_published_from_any_thread_are_sent():
+    class RecordingConnection:
+        def __init__(self):
+            self.payloads = []
+
+        def is_closed(self):
+            return False
+
+        async def execute(self, query, channel, payload):
+            self.payloads.append(payload)
+
+    async def scenario():
+        bus, connection = InvalidationBus(), RecordingConnection()
+        bus._loop, bus._wakeup = asyncio.get_running_loop(), asyncio.Event()
+        sender = asyncio.ensure_future(bus._send_forever(connection))
+        await asyncio.to_thread(bus.publish, "user", 5) # e.g. a sync route in the threadpool
+        bus.publish("user", 6)
+        for _ in range(100):
+            if sum(len(json.loads(p)["e"]) for p in connection.payloads) == 2:
+                break
+            await asyncio.sleep(0.01)
+        sender.cancel()
+        return [event for payload in connection.payloads for event in json.loads(payload)["e"]], len(bus._outbox)
+
+    assert asyncio.run(scenario()) == ([["user", 5], ["user", 6]], 0)
+
+def test_unsent_events_are_capped_by_one_resync(monkeypatch):
+    monkeypatch.setattr(settings, "INVALIDATION_MAX_PENDING", 100)
+
+    class FailingConnection:
+        def is_closed(self):
+            return False
+
+        async def execute(self, query, channel, payload):
+            raise ConnectionError("database down")
+
+    async def scenario():
+        bus = InvalidationBus()
+        bus._loop, bus._wakeup = asyncio.get_running_loop(), asyncio.Event()
+        for i in range(250): # Published while the connection is down
+            bus.publish("price", f"T{i}", "1.00")
+        backlog = [event for _, event in bus._outbox]
+        with pytest.raises(ConnectionError):
+            await bus._send_forever(FailingConnection())
+        bus.publish("price", "AAPL", "2.00")
+        return backlog, [event for _, event in bus._outbox]
+
+    backlog, after_reconnect = asyncio.run(scenario())
+    assert len(backlog) == 50 and backlog[0] == [RESYNC] and backlog[1] == ["price", "T201", "1.00"] # T200 overflowed: covered by the resync
+    assert after_reconnect == [*backlog, ["price", "AAPL", "2.00"]]
+
+def test_user_changes_are_published_when_they_commit():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        db_user = DBUser(username="bus", email="bus@example.com", password_hash="x")
+        session.add(db_user)
+        session.commit()
+        user_id = db_user.user_id
+        auth_service.cache_user(User.model_validate(db_user))
+
+        db_user.email = "rolled-back@example.com"
+        session.flush()
+        session.rollback()
+        assert user_id in auth_service._user_cache
+
+        db_user.email = "changed@example.com"
+        session.commit()
+        assert user_id not in auth_service._user_cache
+    engine.dispose()
+
+def test_other_workers_events_reach_this_workers_caches(client: TestClient, get_test_user_token: str):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    user_id = client.get("/users/me", headers=headers).json()["user_id"]
+    assert user_id in auth_service._user_cache
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Elsewhere"}, headers=headers).json()["portfolio_id"]
+    assert client.get("/leaderboard/", headers=headers).json()[0]["total_value"] == "100000.00"
+
+    def receive(*events):
+        invalidation_bus._on_notification(None, 0, settings.INVALIDATION_CHANNEL, notification(*events))
+
+    receive(["user", user_id])
+    assert user_id not in auth_service._user_cache
+    # Another worker committed a trade and then recorded a price: this worker's leaderboard follows
+    receive(["trade", portfolio_id, "90000.00", "ZZZZ", 100, "100.00"], ["price", "ZZZZ", "110.00"])
+    entry = client.get("/leaderboard/", headers=headers).json()[0]
+    assert (entry["portfolio_id"], entry["total_value"]) == (portfolio_id, "101000.00")
+    receive(["portfolio_removed", portfolio_id])
+    assert client.get("/leaderboard/", headers=headers).json() == []
+
+    stats = client.get("/monitoring/invalidation").json()
+    assert stats["enabled"] is (bus_dsn(settings.SQLALCHEMY_DATABASE_URL) is not None)
+    assert stats["latency_seconds"]["count"] >= 1
+
+@pytest.mark.skipif(bus_dsn(settings.SQLALCHEMY_DATABASE_URL) is None, reason="needs PostgreSQL (TEST_DATABASE_URL)")
+def test_events_travel_between_workers_over_postgres():
+    async def scenario():
+        sender, receiver = InvalidationBus(), InvalidationBus()
+        received: asyncio.Queue = asyncio.Queue()
+        receiver.register("price", lambda ticker, price: received.put_nowait((ticker, price)))
+        assert await sender.start() and await receiver.start()
+        try:
+            sender.publish("price", "AAPL", Decimal("123.45"))
+            return await asyncio.wait_for(received.get(), 5)
+        finally:
+            await sender.stop()
+            await receiver.stop()
+
+    assert asyncio.run(scenario()) == ("AAPL", "123.45")
@@ -0,0 +1,93 @@
+import random
+from decimal import Decimal
+
+from app.services.leaderboard_service import LeaderboardService, RankTree
+
+# These tests exercise the in-memory ranking directly; no database is needed.
+
+def test_rank_tree_matches_sorted_list():
+    rng = random.Random(42)
+    tree = RankTree(seed=1)
+    reference: list[tuple[int, int]] = []
+
+    for i in range(2000):
+        if reference and rng.random() < 0.3:
+            key = reference.pop(rng.randrange(len(reference)))
+            tree.remove(key)
+        else:
+            key = (rng.randint(-1000, 1000), i)
+            reference.append(key)
+            tree.insert(key)
+        reference.sort()
+
+    assert len(tree) == len(reference)
+    for position, key in enumerate(reference):
+        assert tree.rank(key) == position
+        assert tree.kth(position) == key
+    assert tree.slice(0, 25) == reference[:25]
+    assert tree.slice(len(reference) - 5, 10) == reference[-5:]
+
+
+def _loaded_leaderboard() -> LeaderboardService:
+    service = LeaderboardService()
+    service.load_snapshot(
+        portfolios=[
+            (1, 10, "Alpha", Decimal("100000.00")),
+            (2, 20, "Beta", Decimal("90000.00")),
+            (3, 10, "Gamma", Decimal("99000.00")),
+        ],
+        holdings=[
+            (2, "AAPL", 100, Decimal("100.00")),
+            (3, "MSFT", 10, Decimal("100.00")),
+        ],
+        prices=[("AAPL", Decimal("100.00"))],
+    )
+    return service
+
+
+def test_leaderboard_initial_ranking():
+    service = _loaded_leaderboard()
+    top = service.top(limit=10)
+
+    assert [entry.portfolio_id for entry in top] == [1, 2, 3]
+    assert top[0].return_pct == Decimal("0.0000")
+    assert top[2].total_value == Decimal("100000.00") # 99000 cash + 10 MSFT valued at avg price
+    assert [entry.rank for entry in service.ranks_for_user(10)] == [1, 3]
+
+
+def test_leaderboard_price_update_reranks_only_holders():
+    service = _loaded_leaderboard()
+
+    service.on_price_update("aapl", Decimal("120.00")) # Beta gains 2000
+
+    top = service.top(limit=3)
+    assert top[0].portfolio_id == 2
+    assert top[0].total_value == Decimal("102000.00")
+    assert top[0].return_pct == Decimal("2.0000")
+    assert service.rank_of(1).rank == 2
+
+
+def test_leaderboard_trade_and_portfolio_lifecycle():
+    service = _loaded_leaderboard()
+
+    # Gamma sells its MSFT at 150 -> cash 100500, no holdings left.
+    service.on_trade_committed(3, Decimal("100500.00"), "MSFT", 0, None)
+    assert service.rank_of(3).rank == 1
+    assert service.rank_of(3).total_value == Decimal("100500.00")
+
+    service.on_portfolio_upserted(4, 30, "Delta", Decimal("100000.00"))
+    assert len(service) == 4
+    service.on_portfolio_removed(3)
+    assert len(service) == 3
+    assert service.rank_of(3) is None
+    # MSFT no longer held by anyone, so a price move must not touch any portfolio.
+    service.on_price_update("MSFT", Decimal("1.00"))
+    assert [entry.portfolio_id for entry in service.top()] == [1, 2, 4] # Equal values tie-break by portfolio_id
+
+
+def test_leaderboard_hooks_ignored_until_loaded():
+    service = LeaderboardService()
+    service.on_portfolio_upserted(1, 10, "Alpha", Decimal("100000.00"))
+    service.on_price_update("AAPL", Decimal("1.00"))
+    assert len(service) == 0
+    assert not service.loaded
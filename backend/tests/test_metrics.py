@@ -0,0 +1,53 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.services.metrics_service import MetricsRegistry
+
+def test_counters_are_exact_across_threads():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs.", ("kind",))
+
+    def work():
+        child = counter.labels("a")
+        for _ in range(10000):
+            child.inc()
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.labels("a").value == 80000
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("jobs_total", "Jobs.", ("kind",)).labels('say "hi"').inc(2)
+    histogram = registry.histogram("job_seconds", "Job time.", buckets=(0.1, 1.0)).labels()
+    histogram.observe(0.05)
+    histogram.observe(2.0)
+
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{kind="say \\"hi\\""} 2' in text
+    assert "# TYPE job_seconds histogram" in text
+    assert 'job_seconds_bucket{le="0.1"} 1' in text
+    assert 'job_seconds_bucket{le="1.0"} 1' in text
+    assert 'job_seconds_bucket{le="+Inf"} 2' in text
+    assert "job_seconds_count 2" in text
+    assert "job_seconds_sum 2.05" in text
+
+def test_metrics_endpoint_reports_routes_and_prices(client: TestClient):
+    assert client.get("/marketdata/AAPL").status_code == 200
+    client.get("/no/such/path")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/marketdata/{ticker_symbol}",status="200"}' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/marketdata/{ticker_symbol}"}' in text
+    assert "marketdata_cache_lookups_total" in text
+    assert "marketdata_prices_total" in text
+    assert 'db_pool_checked_out{pool="async"}' in text
@@ -0,0 +1,75 @@
+import random
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+
+from fastapi.testclient import TestClient
+
+from app.services import money, trade_rules
+from app.services.trade_journal_service import from_cents, to_cents
+
+# Property checks: random inputs (fixed seed) through the micro-unit path and the Decimal path
+# it replaced, which must agree to the cent.
+
+CENT = Decimal("0.01")
+CASES = 5000
+
+def random_amount(rng: random.Random, places: int = 2, high: int = 10_000) -> Decimal:
+    return Decimal(rng.randrange(-high * 10 ** places, high * 10 ** places)).scaleb(-places)
+
+def test_conversions_round_trip_and_round_as_decimal():
+    rng = random.Random(49)
+    for _ in range(CASES):
+        amount = random_amount(rng, places=rng.randrange(7))
+        assert money.from_micros(money.to_micros(amount), places=6) == amount
+        assert money.from_micros(money.to_micros(amount)) == amount.quantize(CENT) # Half-even, as quantize
+        assert money.to_micros(amount, 2, ROUND_HALF_UP) == money.to_micros(amount.quantize(CENT, ROUND_HALF_UP))
+        assert from_cents(to_cents(amount)) == amount.quantize(CENT)
+        numerator, denominator = rng.randrange(-10 ** 9, 10 ** 9), rng.randrange(1, 10 ** 4)
+        for rounding in (ROUND_HALF_UP, ROUND_HALF_EVEN):
+            expected = (Decimal(numerator) / Decimal(denominator)).to_integral_value(rounding)
+            assert money.divide(numerator, denominator, rounding) == expected
+    assert money.to_micros(Decimal("1.0000005")) == 1_000_000 # Ties to even at the micro-unit
+    assert money.to_micros(1.1) == 1_100_000 and money.to_micros(3) == 3_000_000
+    assert money.divide(5, 2) == 3 and money.divide(-5, 2) == -3 and money.divide(5, 2, ROUND_HALF_EVEN) == 2
+
+def test_trade_rules_match_the_decimal_path():
+    rng = random.Random(7)
+    for _ in range(CASES):
+        held, quantity = rng.randrange(0, 10_000), rng.randrange(1, 1_000)
+        average, price = abs(random_amount(rng)), abs(random_amount(rng))
+        cash = abs(random_amount(rng, high=10_000_000))
+
+        expected_average = price if held == 0 else ((average * held + price * quantity) / (held + quantity)).quantize(CENT, ROUND_HALF_UP)
+        micros = trade_rules.average_price_after_buy(held, money.to_micros(average), money.to_micros(price), quantity)
+        assert money.from_micros(micros) == expected_average
+
+        try:
+            new_cash, new_quantity, _ = trade_rules.apply_buy(
+                money.to_micros(cash), held, money.to_micros(average), money.to_micros(price), quantity
+            )
+        except trade_rules.TradeRuleError:
+            assert cash < price * quantity
+        else:
+            assert (money.from_micros(new_cash), new_quantity) == (cash - price * quantity, held + quantity)
+
+def test_valuation_matches_the_decimal_path():
+    rng = random.Random(11)
+    starting = Decimal("100000.00")
+    for _ in range(CASES // 10):
+        positions = [(rng.randrange(1, 5_000), abs(random_amount(rng, places=rng.randrange(2, 7)))) for _ in range(20)]
+        total = abs(random_amount(rng, high=100_000)) + sum(quantity * price for quantity, price in positions)
+        total_micros = money.to_micros(total)
+        assert money.from_micros(total_micros) == total.quantize(CENT)
+        expected = ((total - starting) / starting * 100).quantize(Decimal("0.0001"))
+        assert money.percent(total_micros - money.to_micros(starting), money.to_micros(starting)) == expected
+
+def test_average_cost_is_stored_to_the_cent(client: TestClient, get_test_user_token: str):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Money"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 1, "price": 10.00}, headers=headers)
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 2, "price": 10.01}, headers=headers)
+
+    holdings = client.get(f"/portfolios/{portfolio_id}/holdings", headers=headers).json()
+    assert [(h["quantity"], h["average_buy_price"]) for h in holdings] == [(3, "10.01")] # 30.02 / 3, half-up
+    portfolio = client.get(f"/portfolios/{portfolio_id}", headers=headers).json()
+    assert Decimal(portfolio["cash_balance"]) == Decimal("100000.00") - Decimal("30.02")
@@ -0,0 +1,98 @@
+import asyncio
+from decimal import Decimal
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.services.market_data_service import MOCK_PRICES
+from app.services.portfolio_stream_service import PortfolioStreamHub, merge_patch
+from app.services.price_stream_service import price_hub
+
+def test_merge_patch():
+    old = {"cash": "1.00", "holdings": {"AAPL": {"quantity": 1, "price": "2.00"}, "MSFT": {"quantity": 3}}}
+    new = {"cash": "1.00", "holdings": {"AAPL": {"quantity": 1, "price": "2.50"}, "TSLA": {"quantity": 4}}}
+    assert merge_patch(old, new) == {"holdings": {"AAPL": {"price": "2.50"}, "MSFT": None, "TSLA": {"quantity": 4}}}
+    assert merge_patch(new, new) == {}
+
+def test_hub_revalues_only_portfolios_holding_the_ticker():
+    async def scenario():
+        hub = PortfolioStreamHub()
+        apple, microsoft = hub.open(1), hub.open(2)
+        hub.on_trade_committed(1, Decimal("500"), "AAPL", 4, Decimal("100")) # While loading: replayed after load
+        hub.load(1, Decimal("1000"), [("AAPL", 2, Decimal("100"))], {"AAPL": Decimal("110")})
+        hub.load(2, Decimal("1000"), [("MSFT", 1, Decimal("300"))], {})
+
+        event, snapshot = await apple.next_message()
+        assert event == "snapshot"
+        assert '"cash_balance": "500.00"' in snapshot and '"quantity": 4' in snapshot and '"unrealized_pnl": "40.00"' in snapshot
+        await microsoft.next_message()
+
+        price_hub.publish("AAPL", Decimal("120"))
+        assert await apple.next_message(timeout=1) == (
+            "patch",
+            '{"market_value": "480.00", "total_value": "980.00", "unrealized_pnl": "80.00", "return_pct": "-99.0200", '
+            '"holdings": {"AAPL": {"price": "120.00", "market_value": "480.00", "unrealized_pnl": "80.00"}}}',
+        )
+        assert await microsoft.next_message(timeout=0.05) is None # Not revalued
+        assert hub.stats() == {"subscriptions": 2, "portfolios": 2, "tickers": 2}
+
+        hub.on_trade_committed(1, Decimal("980"), "AAPL", 0, None)
+        assert await apple.next_message(timeout=1) == (
+            "patch",
+            '{"cash_balance": "980.00", "market_value": "0.00", "unrealized_pnl": "0.00", "holdings": {"AAPL": null}}',
+        )
+        apple.close()
+        microsoft.close()
+        assert hub.stats() == {"subscriptions": 0, "portfolios": 0, "tickers": 0}
+        assert price_hub.stats()["subscriptions"] == 0 # The hub's price feed is closed with the last stream
+
+    asyncio.run(scenario())
+    price_hub.reset()
+
+def test_portfolio_stream(client: TestClient, get_test_user_token: str, event_stream):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Live"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 10, "price": 150.00}, headers=headers)
+
+    async def stream_while_trading():
+        api = httpx.AsyncClient(transport=httpx.ASGITransport(app=client.app), base_url="http://testserver", headers=headers)
+        async with api, event_stream(f"/portfolios/{portfolio_id}/stream", headers=headers) as stream:
+            snapshot = await stream.next_event()
+            price_hub.publish("AAPL", Decimal("160.00"))
+            price_move = await stream.next_event()
+            await api.post(trades_url, json={"ticker_symbol": "MSFT", "trade_type": "BUY", "quantity": 2, "price": 300.00})
+            buy = await stream.next_event()
+            await api.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "SELL", "quantity": 10, "price": 160.00})
+            sell = await stream.next_event()
+            await api.delete(f"/portfolios/{portfolio_id}")
+            return snapshot, price_move, buy, sell, await stream.next_event()
+
+    snapshot, price_move, buy, sell, after_delete = client.portal.call(stream_while_trading)
+
+    event, data = snapshot
+    aapl_price = MOCK_PRICES["AAPL"]
+    assert event == "snapshot"
+    assert data["portfolio_id"] == portfolio_id
+    assert data["holdings"] == {"AAPL": {
+        "quantity": 10, "average_buy_price": "150.00", "price": str(aapl_price),
+        "market_value": str(10 * aapl_price), "unrealized_pnl": str(10 * (aapl_price - 150)),
+    }}
+    cash = Decimal(data["cash_balance"])
+    assert Decimal(data["total_value"]) == cash + 10 * aapl_price
+
+    assert price_move == ("patch", {
+        "market_value": "1600.00", "total_value": str(cash + 1600), "unrealized_pnl": "100.00",
+        "return_pct": price_move[1]["return_pct"],
+        "holdings": {"AAPL": {"price": "160.00", "market_value": "1600.00", "unrealized_pnl": "100.00"}},
+    })
+    assert buy[1]["cash_balance"] == str(cash - 600)
+    assert buy[1]["holdings"] == {"MSFT": {
+        "quantity": 2, "average_buy_price": "300.00", "price": "300.00", "market_value": "600.00", "unrealized_pnl": "0.00",
+    }}
+    assert sell[1]["holdings"] == {"AAPL": None}
+    assert sell[1]["cash_balance"] == str(cash + 1000)
+    assert after_delete is None # The stream ends with the portfolio
+
+    assert client.get("/portfolios/999999/stream", headers=headers).status_code == 404
+    assert client.get(f"/portfolios/{portfolio_id}/stream").status_code == 401
@@ -0,0 +1,101 @@
+import asyncio
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.services import market_data_service
+from app.services.market_data_service import MOCK_PRICES
+from app.services.price_stream_service import PRICE_STREAM_UPDATES, PriceStreamHub, price_hub
+
+def test_hub_fans_out_per_ticker_and_conflates_slow_subscribers():
+    async def scenario():
+        hub = PriceStreamHub()
+        fast, slow, other = hub.open(), hub.open(), hub.open()
+        fast.subscribe(["AAPL"])
+        slow.subscribe(["AAPL", "MSFT"])
+        other.subscribe(["TSLA"])
+        conflated_before = PRICE_STREAM_UPDATES.labels("conflated").value
+
+        hub.publish("aapl", Decimal("1.00"))
+        assert [u.price for u in await fast.next_updates()] == [Decimal("1.00")]
+        for price in ("2.00", "3.00", "4.00"): # slow does not read in between
+            hub.publish("AAPL", Decimal(price))
+        hub.publish("MSFT", Decimal("9.00"))
+
+        assert {u.ticker_symbol: u.price for u in await slow.next_updates()} == {"AAPL": Decimal("4.00"), "MSFT": Decimal("9.00")}
+        assert [u.price for u in await fast.next_updates()] == [Decimal("4.00")]
+        assert await other.next_updates(timeout=0.01) == [] # TSLA never moved
+        assert PRICE_STREAM_UPDATES.labels("conflated").value - conflated_before == 5
+
+        # Late subscribers start from the latest recorded price; closing wakes a waiting reader
+        late = hub.open()
+        late.subscribe(["AAPL"])
+        assert [u.price for u in await late.next_updates()] == [Decimal("4.00")]
+        waiting = asyncio.ensure_future(late.next_updates())
+        await asyncio.sleep(0)
+        late.close()
+        assert await waiting == []
+        assert hub.stats() == {"subscriptions": 3, "tickers": 3, "ticker_subscriptions": 4}
+
+    asyncio.run(scenario())
+
+def test_websocket_stream(client: TestClient):
+    with client.websocket_connect("/marketdata/stream?tickers=aapl") as ws:
+        snapshot = ws.receive_json()
+        assert snapshot == {**snapshot, "type": "price", "ticker_symbol": "AAPL", "price": str(MOCK_PRICES["AAPL"]), "source": "snapshot"}
+
+        price_hub.publish("AAPL", Decimal("171.10")) # From another thread, as sync code paths do
+        assert ws.receive_json()["price"] == "171.10"
+
+        ws.send_json({"action": "subscribe", "tickers": ["MSFT"]})
+        assert ws.receive_json()["ticker_symbol"] == "MSFT"
+        ws.send_json({"action": "unsubscribe", "tickers": ["AAPL"]})
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+
+        price_hub.publish("AAPL", Decimal("172.00")) # No longer subscribed
+        price_hub.publish("MSFT", Decimal("301.00"))
+        assert ws.receive_json()["ticker_symbol"] == "MSFT"
+    assert price_hub.stats()["subscriptions"] == 0
+
+def test_sse_stream(client: TestClient, event_stream):
+    async def read_stream():
+        async with event_stream("/marketdata/stream", "tickers=AAPL") as stream:
+            snapshot = await stream.next_event()
+            price_hub.publish("AAPL", Decimal("171.10"))
+            return [snapshot, await stream.next_event()]
+
+    events = client.portal.call(read_stream)
+    assert [(event, data["source"], data["price"]) for event, data in events] == [
+        ("price", "snapshot", str(MOCK_PRICES["AAPL"])), ("price", "realtime_finnhub", "171.10")
+    ]
+    assert price_hub.stats()["subscriptions"] == 0
+
+    assert client.get("/marketdata/stream?tickers=").status_code == 422
+
+def test_closing_the_last_subscription_mid_refresh_ends_the_refresher(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_STREAM_REFRESH_SECONDS", 0.01)
+    refreshing = asyncio.Event()
+
+    async def stalled_refresh(db, tickers):
+        refreshing.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError: # What closing the session under the cancelled query surfaces
+            raise OperationalError("SELECT", None, Exception("no active connection"))
+
+    monkeypatch.setattr(market_data_service, "get_prices_for_tickers_async", stalled_refresh)
+
+    async def scenario():
+        hub = PriceStreamHub()
+        subscription = hub.open()
+        subscription.subscribe(["AAPL"])
+        refresher = hub._refresher
+        await asyncio.wait_for(refreshing.wait(), 1)
+        subscription.close()
+        await asyncio.wait([refresher], timeout=1)
+        return refresher.done() and refresher.cancelled()
+
+    assert asyncio.run(scenario())
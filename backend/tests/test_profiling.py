@@ -0,0 +1,133 @@
+import cProfile
+import pstats
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.middleware.profiling import ProfilingMiddleware
+from app.services import profiling_service
+from app.services.profiling_service import profiler_service, sign_profile_request, verify_profile_request
+
+def test_signed_profile_requests_are_bound_to_path_and_expiry():
+    expires_at = int(time.time()) + 60
+    value = sign_profile_request("/portfolios/", expires_at, key="secret")
+    assert verify_profile_request(value, "/portfolios/", key="secret")
+    assert not verify_profile_request(value, "/leaderboard", key="secret")
+    assert not verify_profile_request(value, "/portfolios/", key="other")
+    assert not verify_profile_request(value, "/portfolios/", key="secret", now=expires_at + 1)
+    assert not verify_profile_request("garbage", "/portfolios/", key="secret")
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+def _outer():
+    return _busy(20000) + _busy(20000)
+
+def test_hotspots_and_collapsed_stacks_from_a_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _outer()
+    profiler.disable()
+    stats = pstats.Stats(profiler)
+
+    names = [h.function for h in profiling_service.hotspots(stats)]
+    assert any(name.startswith("<genexpr>") or name.startswith("_busy") for name in names)
+
+    collapsed = profiling_service.collapsed_stacks(stats)
+    lines = collapsed.strip().splitlines()
+    assert lines
+    for line in lines:
+        stack, _, micros = line.rpartition(" ")
+        assert stack and int(micros) > 0
+    assert any("_outer (" in line and "_busy (" in line.split("_outer (")[1] for line in lines)
+
+def _profiled_app():
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/work")
+    async def work():
+        return {"total": _outer()}
+
+    return app
+
+def test_armed_requests_are_profiled_once(monkeypatch):
+    monkeypatch.setattr(profiler_service, "sample_rate", 0)
+    profiler_service.clear()
+    profiler_service.configure(profile_next=1, path_prefix="/work")
+    try:
+        with TestClient(_profiled_app()) as client:
+            first = client.get("/work")
+            second = client.get("/work")
+    finally:
+        profiler_service.configure(profile_next=0, path_prefix="")
+
+    assert first.status_code == 200 and first.json()["total"] > 0
+    profile_id = first.headers["x-profile-id"]
+    assert "x-profile-id" not in second.headers
+    profile = profiler_service.get_profile(profile_id)
+    assert profile.trigger == "armed" and profile.route == "/work" and profile.status_code == 200
+    assert profile.hotspots
+    profiler_service.clear()
+
+def test_armed_request_gives_its_slot_back_while_another_is_profiled(monkeypatch):
+    monkeypatch.setattr(profiler_service, "sample_rate", 0)
+    profiler_service.clear()
+    profiler_service.configure(profile_next=1, path_prefix="/work")
+    busy = profiler_service.start() # Another request is being profiled
+    try:
+        with TestClient(_profiled_app()) as client:
+            skipped = client.get("/work")
+            assert profiler_service.profile_next == 1
+            profiler_service.finish(
+                busy, method="GET", path="/other", route=None, status_code=200, duration=0.01, trigger="sampled"
+            )
+            busy = None
+            profiled = client.get("/work")
+    finally:
+        if busy is not None:
+            busy.disable()
+            profiler_service._active.release()
+        profiler_service.configure(profile_next=0, path_prefix="")
+
+    assert "x-profile-id" not in skipped.headers
+    assert profiler_service.get_profile(profiled.headers["x-profile-id"]).trigger == "armed"
+    assert profiler_service.profile_next == 0
+    profiler_service.clear()
+
+def test_admin_profiling_endpoints(client: TestClient, monkeypatch):
+    assert client.get("/admin/profiling").status_code == 404 # No admin token configured
+
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", "admin-secret")
+    monkeypatch.setattr(settings, "PROFILING_SIGNING_KEY", "signing-secret")
+    assert client.get("/admin/profiling", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    admin = {"X-Admin-Token": "admin-secret"}
+    response = client.put("/admin/profiling", json={"profile_next": 2, "path_prefix": "/portfolios"}, headers=admin)
+    assert response.status_code == 200
+    assert response.json()["profile_next"] == 2
+    client.put("/admin/profiling", json={"profile_next": 0, "path_prefix": ""}, headers=admin)
+
+    response = client.post("/admin/profiling/tokens", json={"path": "/portfolios/"}, headers=admin)
+    assert response.status_code == 201
+    assert verify_profile_request(response.json()["value"], "/portfolios/")
+
+    # Store a profile directly; the app under test runs without PROFILING_ENABLED
+    profiler = profiler_service.start()
+    _outer()
+    profile_id = profiler_service.finish(
+        profiler, method="GET", path="/x", route=None, status_code=200, duration=0.01, trigger="sampled"
+    )
+    try:
+        listed = client.get("/admin/profiling/profiles", headers=admin).json()
+        assert listed[0]["profile_id"] == profile_id
+        detail = client.get(f"/admin/profiling/profiles/{profile_id}", headers=admin).json()
+        assert detail["hotspots"]
+        collapsed = client.get(f"/admin/profiling/profiles/{profile_id}/collapsed", headers=admin)
+        assert collapsed.headers["content-type"].startswith("text/plain")
+        assert "_outer" in collapsed.text
+        assert client.get("/admin/profiling/profiles/missing", headers=admin).status_code == 404
+    finally:
+        profiler_service.clear()
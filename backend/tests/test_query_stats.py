@@ -0,0 +1,27 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app.middleware import query_stats
+
+def test_responses_report_query_count_and_db_time(client: TestClient, get_test_user_token: str):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    response = client.post("/portfolios/", json={"portfolio_name": "Query Stats"}, headers=headers)
+    assert int(response.headers["x-db-query-count"]) >= 1
+    assert float(response.headers["x-db-time-ms"]) >= 0
+    assert response.headers["server-timing"].startswith("db;dur=")
+
+    # No database access at all
+    assert client.get("/").headers["x-db-query-count"] == "0"
+
+def test_requests_over_budget_are_logged(client: TestClient, get_test_user_token: str, monkeypatch, caplog):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    middleware = next(m for m in client.app.user_middleware if m.cls is query_stats.QueryStatsMiddleware)
+    monkeypatch.setitem(middleware.kwargs, "query_budget", 1)
+    client.app.middleware_stack = None # Rebuild with the lowered budget
+
+    with caplog.at_level(logging.WARNING, logger=query_stats.__name__):
+        client.post("/portfolios/", json={"portfolio_name": "Over Budget"}, headers=headers)
+    client.app.middleware_stack = None
+
+    assert any("POST /portfolios/ ran" in record.getMessage() for record in caplog.records)
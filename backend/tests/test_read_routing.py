@@ -0,0 +1,30 @@
+from app import database
+
+# Stands in for a configured replica; no second database is needed to test the routing decision.
+
+def test_reads_go_to_primary_without_replica():
+    assert database.replica_async_engine is None # No READ_REPLICA_DATABASE_URL in the test environment
+    database.pin_to_primary(1) # No-op without a replica
+    assert not database.is_pinned_to_primary(1)
+    assert database.read_sessionmaker(1) is database.AsyncSessionLocal
+
+def test_user_is_pinned_to_primary_after_a_write(monkeypatch):
+    replica_sessions = object()
+    monkeypatch.setattr(database, "ReplicaSessionLocal", replica_sessions)
+    monkeypatch.setattr(database, "_primary_pins", database.TTLCache(maxsize=10, ttl=60))
+
+    assert database.read_sessionmaker(7) is replica_sessions
+    database.pin_to_primary(7)
+    assert database.read_sessionmaker(7) is database.AsyncSessionLocal
+    assert database.read_sessionmaker(8) is replica_sessions # Other users still read from the replica
+    assert database.read_sessionmaker() is replica_sessions
+
+def test_pin_expires(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(database, "ReplicaSessionLocal", object())
+    monkeypatch.setattr(database, "_primary_pins", database.TTLCache(maxsize=10, ttl=5, timer=lambda: now[0]))
+
+    database.pin_to_primary(3)
+    assert database.is_pinned_to_primary(3)
+    now[0] = 6.0
+    assert not database.is_pinned_to_primary(3)
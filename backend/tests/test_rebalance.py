@@ -0,0 +1,156 @@
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.crud import crud_portfolio, crud_trade, crud_user
+from app.models.holding_models import DBHolding
+from app.models.portfolio_models import DBPortfolio, PortfolioCreate
+from app.models.trade_models import DBTrade, TradeCreate, TradeTypeEnum
+from app.models.user_models import UserCreate
+from app.services import rebalance_service, trade_rules
+from app.services.rebalance_service import plan_rebalance
+from app.services.trade_event_service import trade_event_relay
+
+# Order planning is pure; execution goes through crud_trade (POST /portfolios/{id}/rebalance through the
+# API, the bulk job called directly: its sync session cannot see rows the API's async session created).
+
+def test_plan_sells_before_buys_and_stays_within_cash():
+    plan = plan_rebalance(
+        cash_balance=Decimal("1000.00"),
+        holdings={"AAPL": 50, "TSLA": 5}, # 5000 + 5000
+        prices={"AAPL": Decimal("100.00"), "TSLA": Decimal("1000.00"), "MSFT": Decimal("300.00")},
+        target_weights={"AAPL": Decimal("0.5"), "MSFT": Decimal("0.4")},
+    )
+
+    assert plan.total_value == Decimal("11000.00")
+    orders = [(o.trade_type, o.ticker_symbol, o.quantity) for o in plan.orders]
+    # TSLA is not a target -> sold out; AAPL 50 -> 55; MSFT 0 -> floor(4400 / 300) = 14.
+    assert orders == [
+        (TradeTypeEnum.SELL, "TSLA", 5),
+        (TradeTypeEnum.BUY, "MSFT", 14),
+        (TradeTypeEnum.BUY, "AAPL", 5),
+    ]
+    assert plan.cash_after == Decimal("1300.00")
+    assert plan.cash_after >= 0
+
+
+def test_plan_is_empty_when_already_on_target():
+    plan = plan_rebalance(
+        cash_balance=Decimal("0.00"),
+        holdings={"AAPL": 10},
+        prices={"AAPL": Decimal("100.00")},
+        target_weights={"AAPL": Decimal("1")},
+    )
+    assert plan.orders == []
+    assert plan.cash_after == Decimal("0.00")
+
+
+def test_plan_keeps_stored_ticker_symbol_and_batch_price():
+    plan = plan_rebalance(
+        cash_balance=Decimal("0.00"),
+        holdings={"nvda": 10},
+        prices={"NVDA": Decimal("250.604")},
+        target_weights={"NVDA": Decimal("0.5")},
+    )
+    assert len(plan.orders) == 1
+    order = plan.orders[0]
+    assert (order.ticker_symbol, order.trade_type, order.quantity) == ("nvda", TradeTypeEnum.SELL, 5)
+    assert order.price == Decimal("250.60") # Prices are rounded to cents before planning
+
+
+def sell_unheld_nvda_second(monkeypatch):
+    """Plans as usual, plus a SELL of a ticker nobody holds as the second order of portfolios holding TSLA."""
+    def plan_with_violation(cash_balance, holdings, prices, target_weights):
+        plan = plan_rebalance(cash_balance, holdings, prices, target_weights)
+        if "TSLA" in holdings:
+            plan.orders.insert(1, TradeCreate(ticker_symbol="NVDA", trade_type=TradeTypeEnum.SELL, quantity=1, price=Decimal("250.60")))
+        return plan
+    monkeypatch.setattr(rebalance_service, "plan_rebalance", plan_with_violation)
+
+def test_rebalance_dry_run_then_execution(client: TestClient, get_test_user_token: str, monkeypatch):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Model"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+    client.post(trades_url, json={"ticker_symbol": "TSLA", "trade_type": "BUY", "quantity": 5, "price": 1000.00}, headers=headers)
+
+    def state():
+        async def read():
+            async with trade_event_relay.sessions() as db: # The test transaction
+                portfolio = await db.get(DBPortfolio, portfolio_id)
+                trade_count = await db.scalar(select(func.count()).select_from(DBTrade).where(DBTrade.portfolio_id == portfolio_id))
+                holdings = (await db.execute(
+                    select(DBHolding.ticker_symbol, DBHolding.quantity).where(DBHolding.portfolio_id == portfolio_id)
+                )).all()
+                return portfolio.version, portfolio.cash_balance, trade_count, sorted(holdings)
+        return client.portal.call(read)
+
+    rebalance_url = f"/portfolios/{portfolio_id}/rebalance"
+    weights = {"AAPL": 0.5, "MSFT": 0.3}
+    before = state()
+    planned = client.post(rebalance_url, json={"target_weights": weights, "dry_run": True}, headers=headers).json()
+    assert planned["dry_run"] and planned["trades"] == []
+    assert [(o["trade_type"], o["ticker_symbol"]) for o in planned["orders"]] == [("SELL", "TSLA"), ("BUY", "AAPL"), ("BUY", "MSFT")]
+    assert state() == before # Nothing written
+
+    # A rule violation in the middle of the orders: none of them is kept
+    with monkeypatch.context() as patch:
+        sell_unheld_nvda_second(patch)
+        failed = client.post(rebalance_url, json={"target_weights": weights}, headers=headers)
+    assert failed.status_code == 400
+    assert failed.json()["detail"] == f"SELL 1 NVDA: {trade_rules.INSUFFICIENT_QUANTITY_DETAIL}"
+    assert state() == before
+
+    executed = client.post(rebalance_url, json={"target_weights": weights}, headers=headers).json()
+    orders = [(o["trade_type"], o["ticker_symbol"], o["quantity"]) for o in executed["orders"]]
+    assert [(t["trade_type"], t["ticker_symbol"], t["quantity"]) for t in executed["trades"]] == orders
+    version, cash_balance, trade_count, holdings = state()
+    assert version == before[0] + 1 # Every order in one commit
+    assert cash_balance == Decimal(executed["cash_after"])
+    assert trade_count == before[2] + len(orders)
+    assert holdings == sorted((ticker, quantity) for trade_type, ticker, quantity in orders if trade_type == "BUY")
+
+def test_bulk_rebalance_isolates_failing_portfolios(sync_db: Session, monkeypatch):
+    db = sync_db
+    owner = crud_user.create_user(db, UserCreate(username="bulk_owner", email="bulk@example.com", password="x"), "x")
+    other = crud_user.create_user(db, UserCreate(username="bulk_other", email="other@example.com", password="x"), "x")
+    fresh, holding_tsla = (
+        crud_portfolio.create_user_portfolio(db, PortfolioCreate(portfolio_name=name), owner.user_id).portfolio_id
+        for name in ("Fresh", "Holds TSLA")
+    )
+    not_owned = crud_portfolio.create_user_portfolio(db, PortfolioCreate(portfolio_name="Other"), other.user_id).portfolio_id
+    crud_trade.create_portfolio_trade(
+        db, TradeCreate(ticker_symbol="TSLA", trade_type=TradeTypeEnum.BUY, quantity=1, price=Decimal("1000.00")), holding_tsla
+    )
+    sell_unheld_nvda_second(monkeypatch)
+
+    def state(portfolio_id):
+        db.expire_all()
+        portfolio = db.get(DBPortfolio, portfolio_id)
+        holdings = db.execute(
+            select(DBHolding.ticker_symbol, DBHolding.quantity).where(DBHolding.portfolio_id == portfolio_id)
+        ).all()
+        return portfolio.version, portfolio.cash_balance, sorted(holdings)
+
+    weights = {"AAPL": Decimal("0.5")}
+    requested = [fresh, holding_tsla, not_owned, fresh]
+    planned = rebalance_service.rebalance_portfolios_bulk(db, owner.user_id, requested, weights, dry_run=True)
+    assert [(r.portfolio_id, r.status) for r in planned.results] == [
+        (fresh, "planned"), (holding_tsla, "planned"), (not_owned, "not_found")
+    ]
+    fresh_before, tsla_before = state(fresh), state(holding_tsla)
+    assert fresh_before[2] == []
+
+    result = rebalance_service.rebalance_portfolios_bulk(db, owner.user_id, requested, weights, chunk_size=2)
+    assert (result.requested, result.succeeded, result.failed) == (3, 1, 2)
+    assert [(r.portfolio_id, r.status, r.detail) for r in result.results] == [
+        (fresh, "rebalanced", None),
+        (holding_tsla, "failed", trade_rules.INSUFFICIENT_QUANTITY_DETAIL),
+        (not_owned, "not_found", "Portfolio not found or not owned by user"),
+    ]
+    # The failing portfolio's SAVEPOINT rolled back its TSLA sale; the other portfolio's trades were committed
+    assert state(holding_tsla) == tsla_before
+    version, cash_balance, holdings = state(fresh)
+    assert version == fresh_before[0] + 1 and cash_balance < fresh_before[1]
+    assert [ticker for ticker, _ in holdings] == ["AAPL"]
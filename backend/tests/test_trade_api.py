@@ -43,6 +43,7 @@ def test_list_trades_for_portfolio(client: TestClient, setup_portfolio_for_trade
 
     # Create some trades
     client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "MSFT", "trade_type": "BUY", "quantity": 5, "price": 300.00}, headers=headers)
+    client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "GOOG", "trade_type": "BUY", "quantity": 2, "price": 2500.50}, headers=headers)
     client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "GOOG", "trade_type": "SELL", "quantity": 2, "price": 2500.50}, headers=headers)
 
     response = client.get(f"/portfolios/{portfolio_id}/trades/", headers=headers)
@@ -54,6 +55,23 @@ def test_list_trades_for_portfolio(client: TestClient, setup_portfolio_for_trade
     assert trades[1]["ticker_symbol"] == "GOOG"
 
 
+def test_list_trades_matches_single_trade_responses(client: TestClient, setup_portfolio_for_trades: tuple[str, int]):
+    # The list is encoded from column rows, the single trade from the ORM object: same JSON either way
+    token, portfolio_id = setup_portfolio_for_trades
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "MSFT", "trade_type": "BUY", "quantity": 5, "price": 300.00}, headers=headers)
+    client.post(f"/portfolios/{portfolio_id}/trades/", json={"ticker_symbol": "MSFT", "trade_type": "SELL", "quantity": 1, "price": 310.10}, headers=headers)
+
+    response = client.get(f"/portfolios/{portfolio_id}/trades/", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/json"
+    trades = response.json()
+    assert [t["price"] for t in trades] == ["300.00", "310.10"]
+    for trade in trades:
+        single = client.get(f"/portfolios/{portfolio_id}/trades/{trade['trade_id']}", headers=headers)
+        assert single.json() == trade
+
+
 def test_get_specific_trade(client: TestClient, setup_portfolio_for_trades: tuple[str, int]):
     token, portfolio_id = setup_portfolio_for_trades
     headers = {"Authorization": f"Bearer {token}"}
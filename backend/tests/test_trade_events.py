@@ -0,0 +1,201 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.models.trade_event_models import DBTradeEvent
+from app.services.trade_event_service import OutboxReader, TradeEventRelay
+
+def test_trade_event_stream(client: TestClient, get_test_user_token: str, event_stream, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", "admin-secret")
+    admin = {"X-Admin-Token": "admin-secret"}
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Outbox"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+    first = client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 10, "price": 150.00}, headers=headers).json()
+
+    async def consume():
+        api = httpx.AsyncClient(transport=httpx.ASGITransport(app=client.app), base_url="http://testserver", headers=headers)
+        async with api, event_stream("/trade-events/stream", "after=0", admin) as replay, \
+                event_stream("/trade-events/stream", headers=admin) as live:
+            received = [await replay.next_event()] # Committed before anyone listened: read from the table
+            await api.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "SELL", "quantity": 50, "price": 160.00}) # Rejected
+            await api.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "SELL", "quantity": 4, "price": 160.00})
+            await api.post(f"/portfolios/{portfolio_id}/rebalance", json={"target_weights": {"MSFT": 0.5}})
+            received += [await replay.next_event() for _ in range(3)]
+            live_events = [await live.next_event() for _ in range(3)] # Each consumer has its own cursor
+        # Resuming after the second event skips what the consumer already has
+        async with event_stream("/trade-events/stream", headers={**admin, "Last-Event-ID": str(received[1][1]["event_id"])}) as resumed:
+            resumed_events = [await resumed.next_event() for _ in range(2)]
+        return received, live_events, resumed_events
+
+    received, live_events, resumed_events = client.portal.call(consume)
+
+    assert [event for event, _ in received] == ["trade"] * 4
+    events = [data for _, data in received]
+    assert [e["event_id"] for e in events] == sorted({e["event_id"] for e in events})
+    assert events[0]["trade_id"] == first["trade_id"]
+    assert (events[0]["trade_type"], events[0]["quantity"], events[0]["price"], events[0]["position_quantity"]) == ("BUY", 10, "150.00", 10)
+    assert events[0]["cash_balance"] == "98500.00"
+    assert (events[1]["trade_type"], events[1]["quantity"], events[1]["position_quantity"], events[1]["cash_balance"]) == ("SELL", 4, 6, "99140.00")
+    assert {e["ticker_symbol"] for e in events[2:]} == {"AAPL", "MSFT"} # The rebalance's orders, one commit
+    assert live_events == received[1:]
+    assert resumed_events == received[2:]
+
+    assert client.get("/trade-events/stream").status_code == 403
+    assert client.get("/trade-events/stream", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+def test_relay_waits_for_missing_offsets_and_pages_old_ones_from_the_table(monkeypatch):
+    monkeypatch.setattr(settings, "TRADE_EVENT_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "TRADE_EVENT_BUFFER_SIZE", 4)
+    monkeypatch.setattr(settings, "TRADE_EVENT_GAP_SECONDS", 0.2)
+    directory = tempfile.mkdtemp(prefix="trade-events-")
+
+    def event(event_id: int) -> DBTradeEvent:
+        return DBTradeEvent(
+            event_id=event_id, trade_id=event_id, portfolio_id=1, ticker_symbol="AAPL", trade_type="BUY",
+            quantity=1, price=Decimal("1.00"), cash_balance=Decimal("99.00"), position_quantity=event_id,
+            average_buy_price=Decimal("1.00"),
+        )
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'events.db')}")
+        async with engine.begin() as connection:
+            await connection.run_sync(lambda sync: DBTradeEvent.__table__.create(sync))
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def commit(*event_ids):
+            async with sessions() as db:
+                db.add_all([event(i) for i in event_ids])
+                await db.commit()
+            relay.notify()
+
+        async def offsets(subscription):
+            batch = await subscription.next_batch(timeout=1)
+            return [int(chunk.split(b"\n", 1)[0][4:]) for chunk in batch]
+
+        relay = TradeEventRelay()
+        relay.sessions = sessions
+        await commit(1, 2)
+        live = await relay.open()
+        assert relay.head == 2
+        await commit(3, 5) # 4 is taken by a transaction that has not committed yet
+        assert await offsets(live) == [3]
+        await asyncio.sleep(0.05)
+        await commit(4)
+        assert await offsets(live) == [4, 5] # Held back at 4, so nothing was skipped
+
+        await commit(6, 8) # 7 does not commit in time: claimed with a gap marker once TRADE_EVENT_GAP_SECONDS old
+        assert await offsets(live) == [6]
+        assert await offsets(live) == [8]
+        with pytest.raises(IntegrityError): # So its transaction cannot commit later, unseen by the stream
+            await commit(7)
+        await commit(9, 10, 11, 12)
+        assert await offsets(live) == [9, 10]
+        assert await offsets(live) == [11, 12]
+        assert relay._offsets[0] > 3 # Older events were dropped from memory...
+
+        replay = await relay.open(after=0) # ...so this consumer pages through the table, then joins the buffer
+        replayed = []
+        while len(replayed) < 11:
+            replayed += await offsets(replay)
+        assert replayed == [1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12]
+        assert relay.stats()["subscriptions"] == 2
+        live.close()
+        replay.close()
+        assert relay._task is None
+        await engine.dispose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def test_gap_marker_waits_for_a_transaction_still_holding_the_offset(monkeypatch):
+    monkeypatch.setattr(settings, "TRADE_EVENT_GAP_SECONDS", 0)
+    directory = tempfile.mkdtemp(prefix="trade-events-")
+
+    def event(event_id: int) -> DBTradeEvent:
+        return DBTradeEvent(
+            event_id=event_id, trade_id=event_id, portfolio_id=1, ticker_symbol="AAPL", trade_type="BUY",
+            quantity=1, price=Decimal("1.00"), cash_balance=Decimal("99.00"), position_quantity=event_id,
+            average_buy_price=Decimal("1.00"),
+        )
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'events.db')}")
+        async with engine.begin() as connection:
+            await connection.run_sync(lambda sync: DBTradeEvent.__table__.create(sync))
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            db.add_all([event(1), event(3)])
+            await db.commit()
+
+        reader = OutboxReader()
+        async with sessions() as db:
+            assert [row.event_id for row in (await reader.read_batch(db, 10))[0]] == [1]
+
+        writer = sessions() # Took offset 2 and is still running when the gap is claimed
+        writer.add(event(2))
+        await writer.flush()
+
+        async def commit_late():
+            await asyncio.sleep(0.2)
+            await writer.commit()
+
+        late = asyncio.ensure_future(commit_late())
+        async with sessions() as db:
+            assert await reader.read_batch(db, 10) == ([], True) # The marker waited, then gave way
+        await late
+        await writer.close()
+        async with sessions() as db:
+            rows, more = await reader.read_batch(db, 10)
+        await engine.dispose()
+        return [row.event_id for row in rows], more
+
+    try:
+        assert asyncio.run(scenario()) == ([2, 3], False)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def test_closing_the_last_consumer_mid_batch_ends_the_relay():
+    directory = tempfile.mkdtemp(prefix="trade-events-")
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'events.db')}")
+        async with engine.begin() as connection:
+            await connection.run_sync(lambda sync: DBTradeEvent.__table__.create(sync))
+        relay = TradeEventRelay()
+        relay.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        subscription = await relay.open()
+        reading = asyncio.Event()
+
+        class StalledReader(OutboxReader):
+            async def read_batch(self, db, limit):
+                reading.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError: # What closing the session under the cancelled read surfaces
+                    raise OperationalError("SELECT", None, Exception("no active connection"))
+
+        relay._reader = StalledReader(relay.head)
+        task = relay._task
+        relay.notify()
+        await asyncio.wait_for(reading.wait(), 1)
+        subscription.close()
+        await asyncio.wait([task], timeout=1)
+        await engine.dispose()
+        return task.done() and task.cancelled() # Not left polling next to the relay the next open() starts
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.services.trade_event_service import OutboxReader, trade_event_relay
+from app.services.trade_journal_service import (
+    RECORD_SIZE, JournalRecord, PositionBook, TradeJournal, TradeJournalService, recover, write_snapshot,
+)
+
+def record(offset: int, portfolio_id: int = 1, ticker: str = "AAPL", position: int = 1) -> JournalRecord:
+    return JournalRecord(
+        offset=offset, trade_id=offset, portfolio_id=portfolio_id, timestamp_us=1_700_000_000_000_000 + offset,
+        price=15_012, average_buy_price=14_950, cash_balance=9_000_000 - offset, quantity=1,
+        position_quantity=position, ticker_symbol=ticker, trade_type="BUY",
+    )
+
+def test_journal_segments_replay_and_torn_records(tmp_path):
+    offsets = [1, 2, 3, 5, 6, 7, 9, 10, 11, 12] # Gaps, as rolled-back outbox ids leave them
+    journal = TradeJournal(str(tmp_path), writable=True, segment_records=4)
+    assert journal.append(record(offset) for offset in offsets) == 10
+    assert journal.append([record(12), record(4)]) == 0 # Already written (or older than the head)
+    journal.flush()
+    journal.close()
+
+    reader = TradeJournal(str(tmp_path))
+    assert (reader.head, reader.record_count, reader.segment_count) == (12, 10, 3)
+    assert [r.offset for r in reader.replay(after=4)] == [5, 6, 7, 9, 10, 11, 12]
+    assert list(reader.replay(after=12)) == []
+    assert list(reader.replay())[3] == record(5)
+    reader.close()
+
+    # A crash in the middle of writing the last record: it is dropped and overwritten by the next append
+    last_segment = os.path.join(str(tmp_path), "segment-00000003.journal")
+    with open(last_segment, "r+b") as file:
+        file.seek(2 * RECORD_SIZE + 40)
+        file.write(b"\xff\xff")
+    journal = TradeJournal(str(tmp_path), writable=True, segment_records=4)
+    assert (journal.head, journal.record_count) == (11, 9)
+    assert journal.append([record(12), record(13)]) == 2
+    assert [r.offset for r in journal.replay(after=10)] == [11, 12, 13]
+    journal.close()
+
+def test_recovery_replays_only_the_tail(tmp_path):
+    journal = TradeJournal(str(tmp_path), writable=True, segment_records=100)
+    journal.append([record(1, 1, "AAPL", 5), record(2, 2, "MSFT", 3), record(3, 1, "TSLA", 2)])
+    book = PositionBook()
+    for r in journal.replay():
+        book.apply(r)
+    write_snapshot(str(tmp_path), book.dump(), book.offset)
+    journal.append([record(4, 1, "AAPL", 0), record(5, 2, "MSFT", 7)]) # Sold out, bought more
+
+    recovered, snapshot_offset, replayed = recover(journal)
+    assert (snapshot_offset, replayed, recovered.offset) == (3, 2, 5)
+    full = PositionBook()
+    for r in journal.replay():
+        full.apply(r)
+    assert recovered.portfolios == full.portfolios
+    assert recovered.holdings(1) == {"TSLA": (2, Decimal("149.50"))}
+    assert PositionBook.load(recovered.dump()).portfolios == recovered.portfolios
+
+    with open(os.path.join(str(tmp_path), f"snapshot-{3:020d}.snap"), "r+b") as file:
+        file.write(b"junk") # A damaged snapshot is skipped: everything is replayed instead
+    assert recover(journal)[1:] == (0, 5)
+    journal.close()
+
+def test_workers_recover_the_book_and_follow_the_outbox(client: TestClient, get_test_user_token: str, tmp_path):
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    portfolio_id = client.post("/portfolios/", json={"portfolio_name": "Journal"}, headers=headers).json()["portfolio_id"]
+    trades_url = f"/portfolios/{portfolio_id}/trades/"
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "BUY", "quantity": 10, "price": 150.00}, headers=headers)
+    client.post(trades_url, json={"ticker_symbol": "MSFT", "trade_type": "BUY", "quantity": 2, "price": 300.00}, headers=headers)
+    directory = str(tmp_path)
+
+    def worker() -> TradeJournalService:
+        service = TradeJournalService()
+        service.sessions = trade_event_relay.sessions # The test transaction
+        assert client.portal.call(lambda: service.start(directory, follow=False))
+        return service
+
+    first = worker()
+    assert first.writer and first.recovery["replayed_records"] == 0
+    assert client.portal.call(first.catch_up) == 2
+    second = worker() # Same directory: recovers from the journal, but only one worker writes
+    assert not second.writer and second.recovery["replayed_records"] == 2
+    assert second.book.portfolios == first.book.portfolios
+    assert first.book.holdings(portfolio_id) == {"AAPL": (10, Decimal("150.00")), "MSFT": (2, Decimal("300.00"))}
+    assert first.book.portfolios[portfolio_id][0] == 9_790_000 # Cash after both trades, in cents
+
+    client.post(trades_url, json={"ticker_symbol": "AAPL", "trade_type": "SELL", "quantity": 10, "price": 160.00}, headers=headers)
+    assert client.portal.call(second.catch_up) == 1 # Every worker follows the outbox into its own book
+    assert second.book.holdings(portfolio_id) == {"MSFT": (2, Decimal("300.00"))}
+    client.portal.call(first.snapshot)
+    client.portal.call(first.stop) # Not caught up: the next writer re-reads and appends the missing record
+    assert client.portal.call(second.catch_up) == 1 and second.writer
+    assert second.journal.head == second.book.offset
+    client.portal.call(second.stop)
+
+    third = worker()
+    assert (third.recovery["snapshot_offset"], third.recovery["replayed_records"]) == (first.book.offset, 1)
+    assert third.book.portfolios == second.book.portfolios
+    client.portal.call(third.stop)
+
+def test_stop_ends_a_follow_loop_cancelled_mid_read(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'outbox.db'}")
+        service = TradeJournalService()
+        service.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        assert await service.start(str(tmp_path / "journal"))
+        reading = asyncio.Event()
+
+        class StalledReader(OutboxReader):
+            async def read_batch(self, db, limit):
+                reading.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError: # What closing the session under the cancelled read surfaces
+                    raise OperationalError("SELECT", None, Exception("no active connection"))
+
+        service._reader = StalledReader(service.book.offset)
+        service.notify()
+        await asyncio.wait_for(reading.wait(), 1)
+        stopping = asyncio.ensure_future(service.stop())
+        done, _ = await asyncio.wait([stopping], timeout=1)
+        await engine.dispose()
+        return stopping in done
+
+    os.makedirs(tmp_path / "journal")
+    assert asyncio.run(scenario()) # The lifespan shutdown does not hang on it
@@ -1,3 +1,7 @@
+import asyncio
+import threading
+
+import httpx
 from fastapi.testclient import TestClient
 from fastapi import status # For status codes
 
@@ -81,3 +85,81 @@ def test_access_protected_route_valid_token(client: TestClient, get_test_user_to
     assert response.status_code == status.HTTP_200_OK
     # Expect an empty list if no portfolios created for this user yet
     assert response.json() == []
+
+def test_authenticated_requests_reuse_cached_identity(client: TestClient, get_test_user_token: str, monkeypatch):
+    from app.crud.aio import crud_user
+    from app.services import auth_service
+
+    headers = {"Authorization": f"Bearer {get_test_user_token}"}
+    first = client.get("/users/me", headers=headers)
+    assert first.status_code == status.HTTP_200_OK
+
+    # Once resolved, the identity comes from the cache: no user lookups may reach the database.
+    async def fail_lookup(*args, **kwargs):
+        raise AssertionError("identity should have been served from the cache")
+    monkeypatch.setattr(crud_user, "get_user_by_id", fail_lookup)
+    monkeypatch.setattr(crud_user, "get_user_by_username", fail_lookup)
+    second = client.get("/users/me", headers=headers)
+    assert second.status_code == status.HTTP_200_OK
+    assert second.json() == first.json()
+
+    # After invalidation the user is looked up again.
+    monkeypatch.undo()
+    auth_service.invalidate_cached_user(first.json()["user_id"])
+    assert client.get("/users/me", headers=headers).status_code == status.HTTP_200_OK
+
+def logins_while_one_is_verifying(client: TestClient, monkeypatch, attempts: int = 1):
+    """
+    Registers a user, then holds one login inside its bcrypt check while `attempts` more are made.
+    Returns (the held login's response, the other responses, a login made once everything finished).
+    """
+    from app.services import auth_service
+
+    credentials = {"username": "busyuser", "password": "busypass"}
+    assert client.post("/users/register", json={**credentials, "email": "busy@example.com"}).status_code == status.HTTP_200_OK
+    verifying, release = threading.Event(), threading.Event()
+    verify_password = auth_service.verify_password
+
+    def held_verify(plain_password, hashed_password):
+        if not verifying.is_set():
+            verifying.set()
+            release.wait(5)
+        return verify_password(plain_password, hashed_password)
+
+    monkeypatch.setattr(auth_service, "verify_password", held_verify)
+
+    async def scenario():
+        api = httpx.AsyncClient(transport=httpx.ASGITransport(app=client.app), base_url="http://testserver")
+        async with api:
+            held = asyncio.ensure_future(api.post("/users/login", data=credentials))
+            assert await asyncio.to_thread(verifying.wait, 5)
+            others = [await api.post("/users/login", data=credentials) for _ in range(attempts)]
+            release.set()
+            return await held, others, await api.post("/users/login", data=credentials)
+
+    return client.portal.call(scenario)
+
+def test_login_gets_503_while_the_password_pool_is_full(client: TestClient, monkeypatch):
+    from app.services import auth_service
+
+    monkeypatch.setattr(auth_service, "_password_slots", threading.BoundedSemaphore(1)) # PASSWORD_HASH_MAX_PENDING=1
+    held, (rejected,), after = logins_while_one_is_verifying(client, monkeypatch)
+    assert rejected.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert rejected.json()["detail"] == "Authentication service is busy, please retry shortly."
+    assert rejected.headers["Retry-After"] == "1"
+    # Both slots were given back: the held login and the next one go through
+    assert held.status_code == after.status_code == status.HTTP_200_OK
+    assert auth_service._password_slots.acquire(blocking=False)
+
+def test_login_waits_for_a_slot_then_gets_503(client: TestClient, monkeypatch):
+    from app.routes import user_routes
+    from app.services.auth_service import ConcurrencyLimiter
+
+    limiter = ConcurrencyLimiter(limit=1, timeout=0.05, name="login")
+    monkeypatch.setattr(user_routes, "login_limiter", limiter)
+    held, rejected, after = logins_while_one_is_verifying(client, monkeypatch, attempts=2)
+    assert [r.status_code for r in rejected] == [status.HTTP_503_SERVICE_UNAVAILABLE] * 2
+    assert rejected[0].json()["detail"] == "Too many concurrent login requests, please retry shortly."
+    assert all(r.elapsed.total_seconds() >= limiter.timeout for r in rejected) # Queued for the timeout first
+    assert held.status_code == after.status_code == status.HTTP_200_OK
+    assert not limiter._semaphore.locked() # Timed-out waiters did not keep (or leak) a slot